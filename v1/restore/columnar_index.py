@@ -0,0 +1,274 @@
+"""
+Memory-mapped columnar index of the manifest rows for date and size range queries.
+
+Built from the local manifest cache (manifest_cache.py). Each refresh turns
+the manifests that are new or changed in the cache into a segment: one .npy
+file per column, sorted by date, plus the row order by size. Files are opened
+memory-mapped, so opening the index reads nothing and a query only touches
+the pages of the rows it returns:
+
+    date.npy (days since 1970-01-01), size.npy, tar.npy, start.npy, stop.npy,
+    path.npy (ids into paths.npy/paths_offsets.npy), manifest.npy
+    size_sorted.npy, by_size.npy    sizes in ascending order and their row numbers
+
+Date and size ranges are found with a binary search. Rows of manifests that
+were changed or deleted are dropped from results, and for good when the
+segments are rebuilt (once there are more than MAX_SEGMENTS).
+
+Usage:
+    python3 columnar_index.py --index ./index --cache manifests.db --bucket your-bucket --prefix manifests/ \\
+        --start 2024-11-01 --end 2024-11-02
+"""
+import argparse
+import os
+import shutil
+import sqlite3
+from datetime import date, datetime
+
+import numpy as np
+
+MAX_SEGMENTS = 16
+EPOCH_ORDINAL = date(1970, 1, 1).toordinal()
+COLUMNS = ('date', 'size', 'tar', 'start', 'stop', 'path', 'manifest')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifests (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    etag TEXT,
+    manifest_id INTEGER NOT NULL,
+    segment TEXT,
+    PRIMARY KEY (bucket, key)
+);
+CREATE TABLE IF NOT EXISTS retired (
+    manifest_id INTEGER PRIMARY KEY
+);
+"""
+
+
+def day_number(value):
+    """Days since 1970-01-01 of a date or a YYYY-MM-DD string"""
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%Y-%m-%d')
+    return value.toordinal() - EPOCH_ORDINAL
+
+
+def save_strings(directory, name, strings):
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f'{name}.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(directory, f'{name}_offsets.npy'), offsets)
+
+
+class Segment:
+    def __init__(self, directory):
+        self.name = os.path.basename(directory)
+
+        def load(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+        self.columns = {column: load(column) for column in COLUMNS}
+        self.size_sorted, self.by_size = load('size_sorted'), load('by_size')
+        self.paths, self.paths_offsets = load('paths'), load('paths_offsets')
+        self.tars, self.tars_offsets = load('tars'), load('tars_offsets')
+
+    def strings(self, blob, offsets, ids):
+        """Decoded strings of ids, each distinct id decoded once"""
+        unique, inverse = np.unique(ids, return_inverse=True)
+        names = np.array([bytes(blob[offsets[i]:offsets[i + 1]]).decode('utf-8') for i in unique], dtype=object)
+        return names[inverse]
+
+    def rows(self, start_day=None, end_day=None, min_size=None, max_size=None):
+        """Row numbers in the ranges, found by binary search on the narrower of the two orders"""
+        dates = self.columns['date']
+        first = 0 if start_day is None else np.searchsorted(dates, start_day, side='left')
+        last = len(dates) if end_day is None else np.searchsorted(dates, end_day, side='right')
+        by_date = last - first
+        if min_size is None and max_size is None:
+            return np.arange(first, last)
+
+        low = 0 if min_size is None else np.searchsorted(self.size_sorted, min_size, side='left')
+        high = len(self.size_sorted) if max_size is None else np.searchsorted(self.size_sorted, max_size, side='right')
+        if high - low < by_date:
+            rows = np.sort(self.by_size[low:high])
+            if start_day is not None or end_day is not None:
+                rows = rows[(rows >= first) & (rows < last)]
+            return rows
+        rows = np.arange(first, last)
+        sizes = self.columns['size'][first:last]
+        keep = np.ones(len(rows), dtype=bool)
+        if min_size is not None:
+            keep &= sizes >= min_size
+        if max_size is not None:
+            keep &= sizes <= max_size
+        return rows[keep]
+
+
+def build_segment(directory, rows):
+    """Write a segment for [(tarfile_location, filename, year, month, day, filesize, start_byte, stop_byte, manifest_id)]"""
+    os.makedirs(directory)
+    path_ids, tar_ids = {}, {}
+    columns = {column: [] for column in COLUMNS}
+    for tar, filename, year, month, day, size, start, stop, manifest_id in rows:
+        columns['date'].append(date(year, month, day).toordinal() - EPOCH_ORDINAL)
+        columns['size'].append(size)
+        columns['tar'].append(tar_ids.setdefault(tar, len(tar_ids)))
+        columns['start'].append(start)
+        columns['stop'].append(stop)
+        columns['path'].append(path_ids.setdefault(filename, len(path_ids)))
+        columns['manifest'].append(manifest_id)
+
+    dtypes = {'date': np.int32, 'size': np.int64, 'tar': np.uint32, 'start': np.int64, 'stop': np.int64,
+              'path': np.uint32, 'manifest': np.uint32}
+    arrays = {column: np.array(values, dtype=dtypes[column]) for column, values in columns.items()}
+    order = np.argsort(arrays['date'], kind='stable')
+    for column, array in arrays.items():
+        np.save(os.path.join(directory, f'{column}.npy'), array[order])
+    by_size = np.argsort(arrays['size'][order], kind='stable').astype(np.uint64)
+    np.save(os.path.join(directory, 'by_size.npy'), by_size)
+    np.save(os.path.join(directory, 'size_sorted.npy'), arrays['size'][order][by_size])
+    save_strings(directory, 'paths', list(path_ids))
+    save_strings(directory, 'tars', list(tar_ids))
+
+
+class ColumnarIndex:
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.join(path, 'segments'), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, 'state.db'))
+        self._conn.executescript(SCHEMA)
+        self._load()
+
+    def _load(self):
+        names = sorted(name for name, in self._conn.execute(
+            'SELECT DISTINCT segment FROM manifests WHERE segment IS NOT NULL'))
+        self.segments = [Segment(os.path.join(self.path, 'segments', name)) for name in names]
+        self.retired = np.array(sorted(m for m, in self._conn.execute('SELECT manifest_id FROM retired')),
+                                dtype=np.uint32)
+
+    def refresh(self, cache_path, bucket, prefix):
+        """Add the manifests that are new or changed in the cache; returns (manifests, rows, retired)"""
+        cache = sqlite3.connect(cache_path)
+        listed = dict(cache.execute(
+            'SELECT key, etag FROM manifests WHERE bucket = ? AND substr(key, 1, ?) = ?',
+            (bucket, len(prefix), prefix)))
+        # Only this prefix: manifests of other prefixes and buckets are left alone
+        known = {key: (etag, manifest_id) for key, etag, manifest_id in self._conn.execute(
+            'SELECT key, etag, manifest_id FROM manifests WHERE bucket = ? AND substr(key, 1, ?) = ?',
+            (bucket, len(prefix), prefix))}
+        changed = [key for key, etag in listed.items() if key not in known or known[key][0] != etag]
+        gone = [key for key in known if key not in listed or key in changed]
+        # Ids of retired manifests stay reserved until their rows are rebuilt away
+        next_id = max(self._conn.execute('SELECT MAX(manifest_id) FROM manifests').fetchone()[0] or 0,
+                      self._conn.execute('SELECT MAX(manifest_id) FROM retired').fetchone()[0] or 0) + 1
+
+        ids = {key: manifest_id for manifest_id, key in enumerate(changed, next_id)}
+        rows = []
+        for key in changed:
+            rows.extend(row + (ids[key],) for row in cache.execute(
+                'SELECT tarfile_location, filename, year, month, day, filesize, start_byte, stop_byte '
+                'FROM rows WHERE bucket = ? AND manifest_key = ?', (bucket, key)))
+        cache.close()
+
+        segment = None
+        if rows:
+            segment = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+            build_segment(os.path.join(self.path, 'segments', segment), rows)
+        with self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO retired VALUES (?)', [(known[key][1],) for key in gone])
+            self._conn.executemany('DELETE FROM manifests WHERE bucket = ? AND key = ?', [(bucket, key) for key in gone])
+            self._conn.executemany('INSERT INTO manifests VALUES (?, ?, ?, ?, ?)',
+                                   [(bucket, key, listed[key], ids[key], segment) for key in changed])
+        self._load()
+        if len(self.segments) > MAX_SEGMENTS:
+            self.rebuild(cache_path)
+        return len(changed), len(rows), len(gone)
+
+    def rebuild(self, cache_path):
+        """
+        Replace all segments with one built from the cache, dropping the rows of retired manifests;
+        the current manifests of every bucket are rebuilt, as the old segments hold all of them
+        """
+        cache = sqlite3.connect(cache_path)
+        current = list(self._conn.execute('SELECT bucket, key, manifest_id FROM manifests'))
+        rows = []
+        for bucket, key, manifest_id in current:
+            rows.extend(row + (manifest_id,) for row in cache.execute(
+                'SELECT tarfile_location, filename, year, month, day, filesize, start_byte, stop_byte '
+                'FROM rows WHERE bucket = ? AND manifest_key = ?', (bucket, key)))
+        cache.close()
+        old = [segment.name for segment in self.segments]
+        name = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        if rows:
+            build_segment(os.path.join(self.path, 'segments', name), rows)
+        with self._conn:
+            self._conn.execute('UPDATE manifests SET segment = ?', (name if rows else None,))
+            self._conn.execute('DELETE FROM retired')
+        self._load()
+        for segment in old:
+            shutil.rmtree(os.path.join(self.path, 'segments', segment), ignore_errors=True)
+
+    def manifest_ids(self, bucket, prefix):
+        """Ids of the current manifests under s3://bucket/prefix"""
+        return np.array(sorted(m for m, in self._conn.execute(
+            'SELECT manifest_id FROM manifests WHERE bucket = ? AND substr(key, 1, ?) = ?',
+            (bucket, len(prefix), prefix))), dtype=np.uint32)
+
+    def query(self, start_date=None, end_date=None, min_size=None, max_size=None, bucket=None, prefix=''):
+        """
+        Columns of the rows in the date (YYYY-MM-DD, inclusive) and size ranges, as numpy arrays;
+        with bucket, only the rows of the manifests under s3://bucket/prefix
+        """
+        start_day = None if start_date is None else day_number(start_date)
+        end_day = None if end_date is None else day_number(end_date)
+        scope = None if bucket is None else self.manifest_ids(bucket, prefix)
+        parts = []
+        for segment in self.segments:
+            rows = segment.rows(start_day, end_day, min_size, max_size)
+            if scope is not None and len(rows):
+                # Current manifests only, so retired rows are dropped as well
+                rows = rows[np.isin(segment.columns['manifest'][rows], scope)]
+            elif len(self.retired) and len(rows):
+                rows = rows[~np.isin(segment.columns['manifest'][rows], self.retired)]
+            if not len(rows):
+                continue
+            parts.append({
+                'tarfile_location': segment.strings(segment.tars, segment.tars_offsets, segment.columns['tar'][rows]),
+                'filename': segment.strings(segment.paths, segment.paths_offsets, segment.columns['path'][rows]),
+                'start_byte': np.asarray(segment.columns['start'][rows]),
+                'stop_byte': np.asarray(segment.columns['stop'][rows]),
+                'date': (np.asarray(segment.columns['date'][rows]).astype('datetime64[D]')),
+                'filesize': np.asarray(segment.columns['size'][rows]),
+            })
+        names = ('tarfile_location', 'filename', 'start_byte', 'stop_byte', 'date', 'filesize')
+        if not parts:
+            return {name: np.array([]) for name in names}
+        return {name: np.concatenate([part[name] for part in parts]) for name in names}
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Date and size range queries over the local manifest cache')
+    parser.add_argument('--index', required=True, help='Index directory (created if missing)')
+    parser.add_argument('--cache', required=True, help='Manifest cache file (manifest_cache.py)')
+    parser.add_argument('--bucket', required=True, help='S3 bucket name')
+    parser.add_argument('--prefix', default='manifests/', help='S3 prefix for CSV files')
+    parser.add_argument('--start', help='First date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='Last date (YYYY-MM-DD)')
+    parser.add_argument('--min_size', type=int, help='Smallest file size')
+    parser.add_argument('--max_size', type=int, help='Largest file size')
+    args = parser.parse_args()
+
+    index = ColumnarIndex(args.index)
+    manifests, rows, retired = index.refresh(args.cache, args.bucket, args.prefix)
+    print(f"Index: {rows} rows from {manifests} manifests added, {retired} manifests retired")
+    result = index.query(args.start, args.end, args.min_size, args.max_size, args.bucket, args.prefix)
+    for values in zip(*(result[name] for name in ('tarfile_location', 'filename', 'start_byte', 'stop_byte', 'date'))):
+        print('|'.join(str(value) for value in values))
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
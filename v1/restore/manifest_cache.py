@@ -0,0 +1,133 @@
+"""
+Local mirror of the manifests under an S3 prefix.
+
+The rows of every manifest are kept in one SQLite file together with the
+ETag of the manifest object they came from. A sync lists the prefix, GETs in
+parallel only the manifests that are new or whose ETag changed, and drops the
+rows of manifests that are gone; searches then read the local file only.
+
+Usage:
+    python3 manifest_cache.py --cache manifests.db --bucket your-bucket --prefix d1000/manifests/
+"""
+import argparse
+import concurrent.futures
+import sqlite3
+
+import boto3
+import pandas as pd
+
+DELIMITER = '|'
+COLUMNS = ['tarfile_location', 'filename', 'year', 'month', 'day',
+           'filesize', 'start_byte', 'stop_byte', 'md5']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifests (
+    bucket TEXT NOT NULL,
+    key TEXT NOT NULL,
+    etag TEXT,
+    rows INTEGER,
+    PRIMARY KEY (bucket, key)
+);
+CREATE TABLE IF NOT EXISTS rows (
+    bucket TEXT NOT NULL,
+    manifest_key TEXT NOT NULL,
+    tarfile_location TEXT,
+    filename TEXT,
+    year INTEGER,
+    month INTEGER,
+    day INTEGER,
+    filesize INTEGER,
+    start_byte INTEGER,
+    stop_byte INTEGER,
+    md5 TEXT
+);
+CREATE INDEX IF NOT EXISTS rows_manifest ON rows (bucket, manifest_key);
+"""
+
+
+def parse_manifest(text):
+    """Rows of a manifest; file names may contain the delimiter, so the tar is first and the rest last"""
+    rows = []
+    for line in text.splitlines():
+        parts = line.split(DELIMITER)
+        if len(parts) < 9:
+            continue
+        try:
+            # year, month, day, filesize, start_byte, stop_byte
+            numbers = [int(p) for p in parts[-7:-1]]
+        except ValueError:
+            continue
+        rows.append([parts[0], DELIMITER.join(parts[1:-7])] + numbers + [parts[-1]])
+    return rows
+
+
+class ManifestCache:
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.executescript(SCHEMA)
+
+    def sync(self, s3_client, bucket, prefix, max_workers=16):
+        """Bring the mirror of s3://bucket/prefix up to date; returns (downloaded, removed, unchanged)"""
+        listed = {}
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=prefix):
+            for obj in page.get('Contents', []):
+                if obj['Key'].endswith('.csv'):
+                    listed[obj['Key']] = obj.get('ETag')
+
+        known = dict(self._conn.execute(
+            'SELECT key, etag FROM manifests WHERE bucket = ? AND substr(key, 1, ?) = ?',
+            (bucket, len(prefix), prefix)))
+        changed = [key for key, etag in listed.items() if known.get(key) != etag]
+        removed = [key for key in known if key not in listed]
+
+        def fetch(key):
+            obj = s3_client.get_object(Bucket=bucket, Key=key)
+            return key, obj.get('ETag'), parse_manifest(obj['Body'].read().decode('utf-8'))
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for key, etag, rows in executor.map(fetch, changed):
+                with self._conn:
+                    self._drop(bucket, key)
+                    self._conn.executemany(
+                        f"INSERT INTO rows VALUES (?, ?, {', '.join('?' * len(COLUMNS))})",
+                        [[bucket, key] + row for row in rows])
+                    self._conn.execute('INSERT INTO manifests VALUES (?, ?, ?, ?)', (bucket, key, etag, len(rows)))
+
+        with self._conn:
+            for key in removed:
+                self._drop(bucket, key)
+        return len(changed), len(removed), len(listed) - len(changed)
+
+    def _drop(self, bucket, key):
+        self._conn.execute('DELETE FROM rows WHERE bucket = ? AND manifest_key = ?', (bucket, key))
+        self._conn.execute('DELETE FROM manifests WHERE bucket = ? AND key = ?', (bucket, key))
+
+    def dataframe(self, bucket, prefix):
+        """All mirrored rows under s3://bucket/prefix, with the columns of search_item.create_dataframe"""
+        return pd.read_sql_query(
+            f"SELECT {', '.join(COLUMNS)} FROM rows WHERE bucket = ? AND substr(manifest_key, 1, ?) = ?",
+            self._conn, params=(bucket, len(prefix), prefix))
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sync a local mirror of the manifests under an S3 prefix')
+    parser.add_argument('--cache', required=True, help='SQLite cache file (created if missing)')
+    parser.add_argument('--bucket', required=True, help='S3 bucket name')
+    parser.add_argument('--prefix', default='manifests/', help='S3 prefix for CSV files')
+    parser.add_argument('--max_workers', type=int, default=16, help='Parallel manifest downloads')
+    args = parser.parse_args()
+
+    cache = ManifestCache(args.cache)
+    downloaded, removed, unchanged = cache.sync(boto3.client('s3'), args.bucket, args.prefix, args.max_workers)
+    print(f"s3://{args.bucket}/{args.prefix}: {downloaded} downloaded, {removed} removed, {unchanged} unchanged")
+    cache.close()
+
+
+if __name__ == '__main__':
+    main()
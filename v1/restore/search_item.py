@@ -5,6 +5,9 @@ from datetime import datetime
 import argparse
 import sys
 
+from columnar_index import ColumnarIndex
+from manifest_cache import ManifestCache
+
 # Initialize S3 client
 s3 = boto3.client('s3')
 
@@ -38,11 +41,45 @@ def create_dataframe(bucket, prefix):
     combined_df.columns = ['tarfile_location', 'filename', 'year', 'month', 'day', 
                            'filesize', 'start_byte', 'stop_byte', 'md5']
     
-    # Convert year, month, day to datetime
+    return add_date_column(combined_df)
+
+def create_dataframe_cached(bucket, prefix, cache_path, sync=True, max_workers=16):
+    """Create DataFrame from the local manifest cache, downloading only new or changed manifests first"""
+    cache = ManifestCache(cache_path)
+    if sync:
+        sync_cache(cache, bucket, prefix, max_workers)
+    combined_df = cache.dataframe(bucket, prefix)
+    cache.close()
+    return add_date_column(combined_df)
+
+def sync_cache(cache, bucket, prefix, max_workers=16):
+    """Download new or changed manifests into the cache"""
+    downloaded, removed, unchanged = cache.sync(s3, bucket, prefix, max_workers)
+    print(f"Manifest cache: {downloaded} downloaded, {removed} removed, {unchanged} unchanged", file=sys.stderr)
+
+def search_index(bucket, prefix, cache_path, index_path, search_type, search_value, end_value,
+                 sync=True, max_workers=16):
+    """Date or size range search on the columnar index of the cache, without loading all rows"""
+    if sync:
+        cache = ManifestCache(cache_path)
+        sync_cache(cache, bucket, prefix, max_workers)
+        cache.close()
+    index = ColumnarIndex(index_path)
+    index.refresh(cache_path, bucket, prefix)
+    if search_type == 'date':
+        columns = index.query(start_date=search_value, end_date=end_value or search_value,
+                              bucket=bucket, prefix=prefix)
+    else:
+        columns = index.query(min_size=int(search_value), max_size=int(end_value) if end_value else None,
+                              bucket=bucket, prefix=prefix)
+    index.close()
+    return pd.DataFrame(columns)[["tarfile_location", "filename", "start_byte", "stop_byte", "date"]]
+
+def add_date_column(df):
+    """Convert year, month, day to datetime"""
     pd.set_option('display.max_colwidth', None)
-    combined_df['date'] = pd.to_datetime(combined_df[['year', 'month', 'day']])
-    
-    return combined_df
+    df['date'] = pd.to_datetime(df[['year', 'month', 'day']])
+    return df
 
 def search_by_name(df, name):
     """Search files by name"""
@@ -55,21 +92,43 @@ def search_by_date(df, start_date, end_date):
     mask = (df['date'] >= start_date) & (df['date'] <= end_date)
     return df[["tarfile_location", "filename", "start_byte", "stop_byte", "date"]].loc[mask]
 
+def search_by_size(df, min_size, max_size=None):
+    """Search files by size range"""
+    mask = df['filesize'] >= min_size
+    if max_size is not None:
+        mask &= df['filesize'] <= max_size
+    return df[["tarfile_location", "filename", "start_byte", "stop_byte", "date"]].loc[mask]
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Search S3 CSV files')
     parser.add_argument('--bucket', required=True, help='S3 bucket name')
     parser.add_argument('--prefix', default='manifests/', help='S3 prefix for CSV files')
-    parser.add_argument('--search_type', choices=['name', 'date'], required=True, help='Type of search to perform')
-    parser.add_argument('--search_value', required=True, help='Search value (name, start_date, or start_byte)')
-    parser.add_argument('--end_value', help='End value for date search')
+    parser.add_argument('--search_type', choices=['name', 'date', 'size'], required=True, help='Type of search to perform')
+    parser.add_argument('--search_value', required=True, help='Search value (name, start_date, or minimum size)')
+    parser.add_argument('--end_value', help='End value for date or size search')
+    parser.add_argument('--cache', help='Local manifest cache file; only new or changed manifests are downloaded')
+    parser.add_argument('--offline', action='store_true', help='Search the cache without syncing it first')
+    parser.add_argument('--max_workers', type=int, default=16, help='Parallel manifest downloads for --cache')
+    parser.add_argument('--index', help='Columnar index directory for date and size searches; needs --cache')
     return parser.parse_args()
 
 # Main execution
 if __name__ == "__main__":
     args = parse_arguments()
 
+    if args.index and args.search_type in ('date', 'size'):
+        if not args.cache:
+            sys.exit("--index needs --cache")
+        result = search_index(args.bucket, args.prefix, args.cache, args.index, args.search_type,
+                              args.search_value, args.end_value, not args.offline, args.max_workers)
+        result.to_csv(sys.stdout, sep='|')
+        sys.exit(0)
+
     # Create DataFrame
-    df = create_dataframe(args.bucket, args.prefix)
+    if args.cache:
+        df = create_dataframe_cached(args.bucket, args.prefix, args.cache, not args.offline, args.max_workers)
+    else:
+        df = create_dataframe(args.bucket, args.prefix)
 
     # Perform search based on arguments
     if args.search_type == 'name':
@@ -78,6 +137,9 @@ if __name__ == "__main__":
         start_date = datetime.strptime(args.search_value, '%Y-%m-%d')
         end_date = datetime.strptime(args.end_value, '%Y-%m-%d') if args.end_value else start_date
         result = search_by_date(df, start_date, end_date)
+    elif args.search_type == 'size':
+        max_size = int(args.end_value) if args.end_value else None
+        result = search_by_size(df, int(args.search_value), max_size)
 
     # Print results
     #print(result)
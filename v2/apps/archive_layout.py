@@ -0,0 +1,51 @@
+"""
+S3 key layout for archives and manifests.
+
+Default layout:
+    {dst_prefix}/archives/{date}/archive_{batch_id}.tar
+    {dst_prefix}/manifests/{date}/manifest_{batch_id}.csv
+
+With prefix shards (N > 0) a hashed sub-prefix is added after the date so a
+run's PUTs spread over N prefixes instead of one:
+    {dst_prefix}/archives/{date}/{shard}/archive_{batch_id}.tar
+    {dst_prefix}/manifests/{date}/{shard}/manifest_{batch_id}.csv
+
+The shard only depends on the batch id, so the tar and its manifest land in
+the same shard and the layout is reproducible. Search walks the manifests
+prefix recursively and restore reads the tar key from the manifest, so both
+work with either layout.
+"""
+import hashlib
+
+
+def shard_name(batch_id, shards):
+    """Hashed sub-prefix for batch_id, as fixed-width hex"""
+    width = len(f"{shards - 1:x}")
+    index = int(hashlib.md5(batch_id.encode('utf-8')).hexdigest(), 16) % shards
+    return f"{index:0{width}x}"
+
+
+def date_prefix(dst_prefix, kind, date, batch_id, shards=0):
+    """Prefix under which an object of kind ('archives', 'manifests') is stored"""
+    prefix = f"{dst_prefix}/{kind}/{date}"
+    if shards:
+        prefix += f"/{shard_name(batch_id, shards)}"
+    return prefix
+
+
+def archive_keys(dst_prefix, date, batch_id, tar_ext='.tar', shards=0):
+    """Return (tar_key, manifest_key) for a batch"""
+    tar_key = f"{date_prefix(dst_prefix, 'archives', date, batch_id, shards)}/archive_{batch_id}{tar_ext}"
+    manifest_key = f"{date_prefix(dst_prefix, 'manifests', date, batch_id, shards)}/manifest_{batch_id}.csv"
+    return tar_key, manifest_key
+
+
+def manifest_key(tar_key):
+    """Manifest key of a tar stored by archive_keys (or without the date), None for other names"""
+    head, sep, rest = ('/' + tar_key).rpartition('/archives/')
+    directory, _, name = rest.rpartition('/')
+    if not sep or not name.startswith('archive_'):
+        return None
+    batch_id = name[len('archive_'):].split('.tar')[0]
+    key = f"{head}/manifests/{directory + '/' if directory else ''}manifest_{batch_id}.csv"
+    return key[1:]
@@ -0,0 +1,368 @@
+"""
+Dry-run planning for the archivers.
+
+With --dry-run an archiver runs its normal producer (directory walk, input
+file or S3 listing, and the real batching policy) but hands the batches to a
+PlanRecorder instead of the consumer queue, so no file is read and nothing
+is written to the destination. The recorder estimates tar and manifest
+sizes, request counts and cost per storage class and a rough duration, and
+can save the batches (--save-plan) so that a later real run executes exactly
+that plan (--plan-file) without scanning again.
+
+Plan files are JSON lines (gzipped if the name ends in .gz): one header
+line, then one line per batch with its files.
+"""
+import gzip
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime
+
+# USD per 1,000 requests (us-east-1). Multipart uploads are billed per
+# CreateMultipartUpload, UploadPart and CompleteMultipartUpload request.
+PUT_PRICE_PER_1000 = {
+    'STANDARD': 0.005,
+    'REDUCED_REDUNDANCY': 0.005,
+    'INTELLIGENT_TIERING': 0.005,
+    'STANDARD_IA': 0.01,
+    'ONEZONE_IA': 0.01,
+    'GLACIER_IR': 0.02,
+    'GLACIER': 0.03,
+    'DEEP_ARCHIVE': 0.05,
+    'EXPRESS_ONEZONE': 0.00113,
+}
+GET_PRICE_PER_1000 = 0.0004  # STANDARD source objects (s3s3)
+
+# Rough per-thread throughput for the duration estimate; calibrate with
+# benchmarks/run_e2e.py and pass --plan-rates for real numbers
+DEFAULT_FILES_PER_SECOND_PER_THREAD = 150
+DEFAULT_MB_PER_SECOND_PER_THREAD = 20
+
+TAR_BLOCK = 512
+TAR_RECORD = 20 * TAR_BLOCK
+PLAN_VERSION = 1
+
+
+def parse_rates(value):
+    """'FILES_PER_SECOND,MB_PER_SECOND' -> (float, float)"""
+    files, mb = value.split(',')
+    return float(files), float(mb)
+
+
+def estimate_tar_size(members, disk_mtime=False):
+    """
+    Uncompressed tar size for [(name, size)], as tarfile writes it (PAX format).
+    disk_mtime: members are added from disk with tar.add, whose float mtime
+    gets a PAX extended header of its own.
+    """
+    total = 0
+    for name, size in members:
+        total += TAR_BLOCK + math.ceil(size / TAR_BLOCK) * TAR_BLOCK
+        if disk_mtime or len(name.encode('utf-8')) > 100:
+            # PAX extended header (header block + one data block)
+            total += 2 * TAR_BLOCK
+    total += 2 * TAR_BLOCK  # end-of-archive marker
+    return math.ceil(total / TAR_RECORD) * TAR_RECORD
+
+
+def put_requests(size, multipart_threshold, multipart_chunksize):
+    """PUT requests for one upload: 1, or create + parts + complete for multipart"""
+    if size >= multipart_threshold:
+        return math.ceil(size / multipart_chunksize) + 2
+    return 1
+
+
+def size_bucket(size):
+    """Power-of-two bucket label for the size distribution"""
+    if size <= 1024:
+        return '<=1KB'
+    upper = 1 << (size - 1).bit_length()
+    for unit, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024)):
+        if upper >= factor:
+            return f"<={upper // factor}{unit}"
+    return f"<={upper}B"
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+def _open_plan(path, mode):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    return open(path, mode, encoding='utf-8')
+
+
+def _display(size):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB', 'PB'):
+        if size < 1024 or unit == 'PB':
+            return f"{size:.2f}{unit}"
+        size /= 1024
+
+
+class PlanRecorder:
+    """Takes the place of the batch queue during a dry run"""
+
+    def __init__(self, archiver, source, destination, strategy, num_threads, fields,
+                 name_field, path_field, dst_prefix='', to_s3=True,
+                 tar_storageclass='STANDARD', manifest_storageclass='STANDARD',
+                 multipart_threshold=8 * 1024 * 1024, multipart_chunksize=16 * 1024 * 1024,
+                 source_gets=False, disk_mtime=True, tar_key_length=None, save_plan=None, rates=None):
+        """
+        fields: FileInfo fields stored in a saved plan
+        name_field: field used as the tar member name; path_field: field written to the manifest
+        disk_mtime: see estimate_tar_size (False for s3s3, which builds its own TarInfo)
+        tar_key_length: length of the tar name in manifest rows, if not an S3 key under dst_prefix
+        """
+        self.archiver = archiver
+        self.source = source
+        self.destination = destination
+        self.strategy = strategy
+        self.num_threads = num_threads
+        self.fields = list(fields)
+        self.name_field = name_field
+        self.path_field = path_field
+        self.to_s3 = to_s3
+        self.tar_storageclass = tar_storageclass
+        self.manifest_storageclass = manifest_storageclass
+        self.multipart_threshold = multipart_threshold
+        self.multipart_chunksize = multipart_chunksize
+        self.source_gets = source_gets
+        self.disk_mtime = disk_mtime
+        self.save_plan = save_plan
+        if rates is None:
+            rates = (DEFAULT_FILES_PER_SECOND_PER_THREAD * num_threads,
+                     DEFAULT_MB_PER_SECOND_PER_THREAD * num_threads)
+        self.rates = rates
+        # Length of a tar key such as {dst_prefix}/archives/20250101/archive_20250101_120000_0001.tar
+        self._tar_key_length = tar_key_length if tar_key_length is not None else len(dst_prefix) + 53
+
+        self._lock = threading.Lock()
+        self._started = time.time()
+        self.files = 0
+        self.bytes = 0
+        self.file_sizes = {}
+        self.tar_sizes = []
+        self.files_per_tar = []
+        self.manifest_bytes = 0
+        self.tar_requests = 0
+        self.multipart_tars = 0
+
+        self._plan = None
+        if save_plan:
+            self._plan = _open_plan(save_plan, 'w')
+            self._plan.write(json.dumps({
+                'type': 'header', 'version': PLAN_VERSION, 'archiver': archiver, 'source': source,
+                'strategy': strategy, 'fields': self.fields,
+                'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            }) + '\n')
+
+    # queue.Queue interface used by the producers
+    def put(self, item, block=True, timeout=None):
+        if item is not None:
+            self.add_batch(item)
+
+    def qsize(self):
+        return 0
+
+    def add_batch(self, batch):
+        members = [(getattr(f, self.name_field), f.size) for f in batch.files]
+        tar_size = estimate_tar_size(members, self.disk_mtime)
+        # Manifest row: tar key, path, date, size, start, end, md5 and separators
+        offset_digits = 2 * len(str(tar_size))
+        manifest_size = 110 + sum(
+            self._tar_key_length + len(getattr(f, self.path_field)) + 19 + len(str(f.size)) + offset_digits + 32 + 7
+            for f in batch.files
+        )
+        requests = put_requests(tar_size, self.multipart_threshold, self.multipart_chunksize)
+
+        with self._lock:
+            self.files += len(batch.files)
+            self.bytes += batch.total_size
+            for f in batch.files:
+                bucket = size_bucket(f.size)
+                self.file_sizes[bucket] = self.file_sizes.get(bucket, 0) + 1
+            self.tar_sizes.append(tar_size)
+            self.files_per_tar.append(len(batch.files))
+            self.manifest_bytes += manifest_size
+            self.tar_requests += requests
+            self.multipart_tars += requests > 1
+            if self._plan:
+                self._plan.write(json.dumps({
+                    'type': 'batch', 'batch_number': batch.batch_number, 'total_size': batch.total_size,
+                    'files': [[getattr(f, field) for field in self.fields] for f in batch.files],
+                }) + '\n')
+
+    def finish(self):
+        """Close the saved plan and return the report as a dict"""
+        if self._plan:
+            self._plan.close()
+        scan_seconds = time.time() - self._started
+        tars = len(self.tar_sizes)
+        tar_sizes = sorted(self.tar_sizes)
+        files_per_tar = sorted(self.files_per_tar)
+
+        requests, cost = {}, {}
+        if self.to_s3:
+            requests = {
+                'tar_put': self.tar_requests,
+                'manifest_put': tars,
+                'total_put': self.tar_requests + tars,
+            }
+            tar_cost = self.tar_requests / 1000 * PUT_PRICE_PER_1000.get(self.tar_storageclass, 0.0)
+            manifest_cost = tars / 1000 * PUT_PRICE_PER_1000.get(self.manifest_storageclass, 0.0)
+            cost = {
+                f"tar_put_{self.tar_storageclass}": round(tar_cost, 4),
+                f"manifest_put_{self.manifest_storageclass}": round(manifest_cost, 4),
+            }
+            # Same number of files stored one object each, for comparison
+            cost[f"unarchived_put_{self.tar_storageclass}"] = round(
+                self.files / 1000 * PUT_PRICE_PER_1000.get(self.tar_storageclass, 0.0), 4)
+            if self.source_gets:
+                requests['source_get'] = self.files
+                cost['source_get_STANDARD'] = round(self.files / 1000 * GET_PRICE_PER_1000, 4)
+            cost['total'] = round(sum(v for k, v in cost.items() if not k.startswith('unarchived')), 4)
+
+        files_per_second, mb_per_second = self.rates
+        processing_seconds = max(
+            self.files / files_per_second if files_per_second else 0.0,
+            self.bytes / (mb_per_second * 1024 ** 2) if mb_per_second else 0.0,
+        )
+        return {
+            'archiver': self.archiver,
+            'source': self.source,
+            'destination': self.destination,
+            'strategy': self.strategy,
+            'num_threads': self.num_threads,
+            'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'scan_seconds': round(scan_seconds, 3),
+            'scan_files_per_second': round(self.files / scan_seconds, 1) if scan_seconds else 0.0,
+            'files': self.files,
+            'bytes': self.bytes,
+            'file_size_distribution': dict(sorted(self.file_sizes.items(), key=lambda kv: _bucket_order(kv[0]))),
+            'tars': tars,
+            'manifests': tars,
+            'multipart_tars': self.multipart_tars,
+            'tar_bytes_estimated': sum(tar_sizes),
+            'tar_size': {
+                'min': tar_sizes[0] if tar_sizes else 0,
+                'p50': _percentile(tar_sizes, 0.5),
+                'p90': _percentile(tar_sizes, 0.9),
+                'max': tar_sizes[-1] if tar_sizes else 0,
+            },
+            'files_per_tar': {
+                'min': files_per_tar[0] if files_per_tar else 0,
+                'p50': _percentile(files_per_tar, 0.5),
+                'max': files_per_tar[-1] if files_per_tar else 0,
+            },
+            'manifest_bytes_estimated': self.manifest_bytes,
+            'storage_class': {'tar': self.tar_storageclass, 'manifest': self.manifest_storageclass} if self.to_s3 else {},
+            'requests': requests,
+            'cost_usd': cost,
+            'duration_estimate': {
+                'seconds': round(max(processing_seconds, scan_seconds)),
+                'assumed_files_per_second': files_per_second,
+                'assumed_mb_per_second': mb_per_second,
+            },
+            'plan_file': self.save_plan,
+        }
+
+    def format_report(self, report):
+        """Human-readable report lines"""
+        lines = [
+            f"Dry run plan for {report['archiver']}: {report['source']} -> {report['destination']}",
+            f"Strategy: {report['strategy']}, threads: {report['num_threads']}",
+            f"Scanned {report['files']:,} files ({_display(report['bytes'])}) in {report['scan_seconds']:.1f}s "
+            f"({report['scan_files_per_second']:,.0f} files/s)",
+            "File size distribution:",
+        ]
+        for bucket, count in report['file_size_distribution'].items():
+            share = count / report['files'] * 100 if report['files'] else 0
+            lines.append(f"  {bucket:>8}: {count:>14,} ({share:5.1f}%)")
+        tar_size = report['tar_size']
+        lines += [
+            f"Tars: {report['tars']:,}, manifests: {report['manifests']:,}, "
+            f"multipart tars: {report['multipart_tars']:,}",
+            f"Tar size (estimated, uncompressed): total {_display(report['tar_bytes_estimated'])}, "
+            f"min {_display(tar_size['min'])}, p50 {_display(tar_size['p50'])}, "
+            f"p90 {_display(tar_size['p90'])}, max {_display(tar_size['max'])}",
+            f"Files per tar: min {report['files_per_tar']['min']:,}, p50 {report['files_per_tar']['p50']:,}, "
+            f"max {report['files_per_tar']['max']:,}",
+            f"Manifest size (estimated): {_display(report['manifest_bytes_estimated'])}",
+        ]
+        if report['requests']:
+            lines.append("Requests: " + ', '.join(f"{k} {v:,}" for k, v in report['requests'].items()))
+            lines.append("Request cost (USD): " + ', '.join(f"{k} ${v:,.4f}" for k, v in report['cost_usd'].items()))
+        duration = report['duration_estimate']
+        lines.append(
+            f"Estimated duration: {_format_duration(duration['seconds'])} "
+            f"(assuming {duration['assumed_files_per_second']:,.0f} files/s and "
+            f"{duration['assumed_mb_per_second']:,.0f} MB/s)"
+        )
+        if report['plan_file']:
+            lines.append(f"Plan saved to {report['plan_file']} (run again with --plan-file to execute it)")
+        return lines
+
+    def complete(self, logs_dir, run_time, logger):
+        """Finish the plan, write plan_{run_time}.json/.txt to logs_dir and log the report"""
+        report = self.finish()
+        json_path = os.path.join(logs_dir, f'plan_{run_time}.json')
+        text_path = os.path.join(logs_dir, f'plan_{run_time}.txt')
+        lines = self.format_report(report)
+        with open(json_path, 'w') as f:
+            json.dump(report, f, indent=2)
+        with open(text_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+        logger.info("####################################")
+        for line in lines:
+            logger.info(line)
+        logger.info(f"Plan report written to {json_path} and {text_path}")
+        logger.info("####################################")
+        return report
+
+
+def _bucket_order(label):
+    number = ''.join(c for c in label if c.isdigit())
+    factor = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}.get(label[-2:], 1)
+    return int(number or 0) * factor
+
+
+def _format_duration(seconds):
+    hours, remainder = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(remainder, 60)
+    if hours >= 24:
+        return f"{hours // 24}d {hours % 24}h {minutes}m"
+    return f"{hours}h {minutes}m {seconds}s"
+
+
+def _check_header(path, header, archiver, source):
+    if header.get('type') != 'header' or header.get('version') != PLAN_VERSION:
+        raise ValueError(f"{path} is not a plan file")
+    if header['archiver'] != archiver:
+        raise ValueError(f"{path} was planned for {header['archiver']}, not {archiver}")
+    if header['source'] != source:
+        raise ValueError(f"{path} was planned for source {header['source']}, not {source}")
+    return header
+
+
+def check_plan(path, archiver, source):
+    """Validate a saved plan against this run and return its header"""
+    with _open_plan(path, 'r') as f:
+        return _check_header(path, json.loads(f.readline()), archiver, source)
+
+
+def iter_plan_batches(path, archiver, source):
+    """Yield (batch_number, total_size, [file dicts]) from a saved plan"""
+    with _open_plan(path, 'r') as f:
+        header = _check_header(path, json.loads(f.readline()), archiver, source)
+        fields = header['fields']
+        for line in f:
+            entry = json.loads(line)
+            if entry.get('type') != 'batch':
+                continue
+            yield entry['batch_number'], entry['total_size'], [dict(zip(fields, values)) for values in entry['files']]
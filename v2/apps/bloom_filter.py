@@ -0,0 +1,152 @@
+"""
+Bloom filter sidecars of manifest file names.
+
+With --bloom-filter the archivers write, next to every CSV manifest, a Bloom
+filter of the file names it lists:
+    {dst_prefix}/manifests/{date}/manifest_{batch_id}.csv
+    {dst_prefix}/blooms/{date}/manifest_{batch_id}.bloom
+
+path-lookup.py checks a path against all of them at once and reads only the
+manifests whose filter matches. The false positive rate applies to every
+filter, so a lookup of a path reads about rate * manifests manifests that do
+not hold it. The default rate is sized for EXPECTED_MANIFESTS filters, about
+one false read per lookup: 1e-5, about 3 bytes per file. At 1% a filter
+takes 1.2 bytes per file, but a lookup over 100,000 manifests reads 1,000.
+
+File format: MAGIC, number of bits (uint64), number of hashes (uint8), bits.
+Bit positions are (h1 + i * h2) mod bits, i < hashes, for the two 64-bit
+halves of the BLAKE2b-128 digest of the UTF-8 name.
+"""
+import hashlib
+import math
+import os
+import struct
+
+import numpy as np
+
+from manifest_parquet import writes_csv
+
+MAGIC = b'SFB1'
+HEADER = struct.Struct('<4sQB')
+# Filters a lookup checks; the per-filter rate keeps false manifest reads near one per lookup
+EXPECTED_MANIFESTS = 100000
+DEFAULT_FP_RATE = 1 / EXPECTED_MANIFESTS
+MASK64 = (1 << 64) - 1
+
+
+def check_bloom(fp_rate, manifest_format):
+    """Validate --bloom-fp-rate; path-lookup.py reads the CSV manifests the filters point at"""
+    if not 0 < fp_rate < 1:
+        raise ValueError("--bloom-fp-rate must be between 0 and 1")
+    if not writes_csv(manifest_format):
+        raise ValueError("--bloom-filter is for CSV manifests: use --manifest-format csv or both")
+
+
+def hash_pair(name):
+    digest = hashlib.blake2b(name.encode('utf-8'), digest_size=16).digest()
+    return struct.unpack('<QQ', digest)
+
+
+class BloomFilter:
+    def __init__(self, num_bits, num_hashes, bits=None):
+        self.num_bits = num_bits
+        self.num_hashes = num_hashes
+        self.bits = bytearray(bits) if bits is not None else bytearray((num_bits + 7) // 8)
+
+    @classmethod
+    def for_capacity(cls, count, fp_rate=DEFAULT_FP_RATE):
+        """Filter sized for count names at the given false positive rate"""
+        count = max(count, 1)
+        num_bits = max(64, math.ceil(-count * math.log(fp_rate) / math.log(2) ** 2))
+        num_hashes = max(1, round(num_bits / count * math.log(2)))
+        return cls(num_bits, num_hashes)
+
+    def _positions(self, name):
+        h1, h2 = hash_pair(name)
+        return (((h1 + i * h2) & MASK64) % self.num_bits for i in range(self.num_hashes))
+
+    def add(self, name):
+        for position in self._positions(name):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, name):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(name))
+
+    def to_bytes(self):
+        return HEADER.pack(MAGIC, self.num_bits, self.num_hashes) + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, data):
+        magic, num_bits, num_hashes = HEADER.unpack_from(data)
+        if magic != MAGIC:
+            raise ValueError('not a bloom filter sidecar')
+        return cls(num_bits, num_hashes, data[HEADER.size:])
+
+
+def bloom_path(manifest_path):
+    """Bloom key (or local path) for a CSV manifest key: manifests/ -> blooms/, .csv(.gz) -> .bloom"""
+    head, sep, tail = manifest_path.rpartition('/manifests/')
+    if not sep:
+        head, sep, tail = manifest_path.rpartition(f'{os.sep}manifests{os.sep}')
+    if sep:
+        manifest_path = f"{head}{sep.replace('manifests', 'blooms')}{tail}"
+    if manifest_path.endswith('.gz'):
+        manifest_path = manifest_path[:-3]
+    return os.path.splitext(manifest_path)[0] + '.bloom'
+
+
+def manifest_filenames(lines, delimiter='|'):
+    """File names of manifest lines (header first); file names may contain the delimiter"""
+    for line in lines[1:]:
+        parts = line.split(delimiter)
+        if len(parts) >= 7:
+            yield delimiter.join(parts[1:-5])
+
+
+def to_bloom(lines, delimiter='|', fp_rate=DEFAULT_FP_RATE):
+    """Sidecar contents (bytes) for manifest lines"""
+    names = list(manifest_filenames(lines, delimiter))
+    bloom = BloomFilter.for_capacity(len(names), fp_rate)
+    for name in names:
+        bloom.add(name)
+    return bloom.to_bytes()
+
+
+class BloomSet:
+    """Many filters in one array, checked together for a name"""
+
+    def __init__(self, keys, sidecars):
+        self.keys = list(keys)
+        headers = [HEADER.unpack_from(data) for data in sidecars]
+        self.num_bits = np.array([h[1] for h in headers], dtype=np.uint64)
+        self.num_hashes = np.array([h[2] for h in headers], dtype=np.uint8)
+        sizes = [len(data) - HEADER.size for data in sidecars]
+        self.offsets = np.zeros(len(sizes), dtype=np.uint64)
+        if sizes:
+            np.cumsum(sizes[:-1], out=self.offsets[1:])
+        self.bits = np.frombuffer(b''.join(data[HEADER.size:] for data in sidecars), dtype=np.uint8)
+
+    def nbytes(self):
+        return self.bits.nbytes
+
+    def expected_false_matches(self):
+        """Filters expected to match a name they do not hold: the sum of (bits set / bits) ** hashes"""
+        if not self.keys:
+            return 0.0
+        popcount = np.unpackbits(np.arange(256, dtype=np.uint8)[:, None], axis=1).sum(axis=1)
+        ones = np.add.reduceat(popcount[self.bits].astype(np.uint64), self.offsets.astype(np.intp))
+        return float(np.sum((ones / self.num_bits) ** self.num_hashes))
+
+    def matches(self, name):
+        """Keys whose filter may contain name"""
+        if not self.keys:
+            return []
+        h1, h2 = (np.uint64(h) for h in hash_pair(name))
+        maybe = np.ones(len(self.keys), dtype=bool)
+        with np.errstate(over='ignore'):
+            for i in range(int(self.num_hashes.max())):
+                position = (h1 + np.uint64(i) * h2) % self.num_bits
+                byte = self.bits[self.offsets + (position >> np.uint64(3))]
+                hit = (byte >> (position & np.uint64(7)).astype(np.uint8)) & 1
+                maybe &= (hit == 1) | (i >= self.num_hashes)
+        return [self.keys[i] for i in np.flatnonzero(maybe)]
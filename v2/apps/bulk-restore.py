@@ -0,0 +1,331 @@
+"""
+Bulk restore: many archived files with few GETs.
+
+Members of the restore list are grouped by tar and nearby byte ranges are
+merged into single ranged GETs (restore_plan.coalesce). GETs run in parallel
+and each response is streamed through tarfile, writing the wanted members as
+they pass by and stopping once the last one is written.
+
+Tars that would need many GETs are checked against the cost of reading them
+whole (restore_plan.choose_downloads). Their size comes from their manifest,
+or from S3 once the manifest has been compacted. A tar read whole is
+downloaded in parallel parts to a temporary file under the output directory.
+
+    python3 bulk-restore.py --bucket my-bucket --input subtree_manifest.csv --output-dir restored_data
+"""
+import os
+import boto3
+from boto3.s3.transfer import TransferConfig
+from botocore.config import Config
+from botocore.exceptions import ClientError
+import tarfile
+import concurrent.futures
+import logging
+import shutil
+import threading
+import time
+import argparse
+from distutils import util
+from archive_layout import manifest_key
+from restore import CHUNK_SIZE, copy_member
+from restore_plan import (RangeGet, choose_downloads, coalesce, is_range_addressable, output_path, parse_size,
+                          read_restore_list, whole_parts)
+
+
+def matches_name(member, name):
+    """Compressed tars are matched by member name: the manifest has the source path, the tar a relative one"""
+    return member.filename == name or member.filename.endswith('/' + name)
+
+
+class BulkRestore:
+    def __init__(self, args):
+        self.bucket = args.bucket
+        self.input = args.input
+        self.output_dir = args.output_dir
+        self.num_threads = args.num_threads
+        self.max_gap = args.max_gap
+        self.max_range = args.max_range
+        self.retries = args.retries
+        self.strategy = args.strategy
+        self.request_cost = args.request_cost
+        self.part_size = args.part_size
+        self.dry_run = args.dry_run
+        self.profile_name = args.profile_name
+        self.endpoint = args.endpoint
+
+        config = Config(
+            max_pool_connections=min(self.num_threads * 2, 1000),
+            retries={'max_attempts': 3},
+            connect_timeout=5,
+            read_timeout=60
+        )
+        session = boto3.Session(profile_name=self.profile_name)
+        self.s3_client = session.client('s3', config=config, endpoint_url=self.endpoint)
+
+        # Whole tars are downloaded in parallel parts
+        self.transfer_config = TransferConfig(
+            max_concurrency=self.num_threads,
+            multipart_chunksize=self.part_size,
+            multipart_threshold=self.part_size
+        )
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        console_handler = logging.StreamHandler()
+        console_handler.setLevel(logging.INFO)
+        console_handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        self.logger.addHandler(console_handler)
+
+        self.lock = threading.Lock()
+        self.restored_files = 0
+        self.failed_files = 0
+        self.restored_bytes = 0
+        self.downloaded_bytes = 0
+        self.get_requests = 0
+
+    def get_size_display(self, size_bytes):
+        for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+            if size_bytes < 1024:
+                return f"{size_bytes:.2f} {unit}"
+            size_bytes /= 1024
+        return f"{size_bytes:.2f} PB"
+
+    def plan(self):
+        members = read_restore_list(self.input)
+        gets = coalesce(members, self.max_gap, self.max_range)
+        gets = self.choose(gets)
+        tars = len({get.tar for get in gets})
+        ranged = [get for get in gets if get.stop is not None]
+        self.logger.info(f"{len(members):,} files in {tars:,} tars: {len(gets):,} GETs "
+                         f"({len(gets) - len(ranged):,} whole tars)")
+        if ranged:
+            span = sum(get.length for get in ranged)
+            wanted = sum(get.wanted for get in ranged)
+            self.logger.info(f"Ranged GETs read {self.get_size_display(span)} for "
+                             f"{self.get_size_display(wanted)} of members "
+                             f"({self.get_size_display(span - wanted)} of gaps)")
+        return members, gets
+
+    def tar_size(self, tar):
+        """Size of a tar from its manifest (end of its last member), or from S3 if the manifest has no row of it"""
+        key = manifest_key(tar)
+        if key:
+            try:
+                content = self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read().decode('utf-8')
+                # Deduplicated rows point into other tars: only this tar's members count
+                stops = [int(parts[-2]) for parts in (line.split('|') for line in content.splitlines()[1:])
+                         if len(parts) >= 7 and parts[0] == tar]
+                if stops:
+                    return max(stops) + 1
+            except (ClientError, ValueError):
+                pass
+        return self.s3_client.head_object(Bucket=self.bucket, Key=tar)['ContentLength']
+
+    def choose(self, gets):
+        """Ranged GETs or whole-tar download per tar, by cost; a tar needing one GET stays ranged"""
+        counts = {}
+        for get in gets:
+            counts[get.tar] = counts.get(get.tar, 0) + (1 if get.stop is not None else 0)
+        tars = [tar for tar, count in counts.items() if count > 1 or (count and self.strategy == 'whole')]
+        if self.strategy == 'ranged' or not tars:
+            return gets
+
+        tar_sizes = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            futures = {executor.submit(self.tar_size, tar): tar for tar in tars}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    tar_sizes[futures[future]] = future.result()
+                except Exception as e:
+                    self.logger.warning(f"{futures[future]}: size unknown ({str(e)}), using ranged GETs")
+
+        gets, choices = choose_downloads(gets, tar_sizes, self.request_cost, self.part_size, self.strategy)
+        for c in sorted(choices, key=lambda c: c.tar):
+            self.logger.info(
+                f"{c.tar}: {c.files:,} files, {c.wanted / c.tar_size if c.tar_size else 0:.0%} of "
+                f"{self.get_size_display(c.tar_size)}; ranged {c.ranged_gets:,} GETs reading "
+                f"{self.get_size_display(c.ranged_bytes)} (cost {self.get_size_display(c.ranged_cost)}) vs "
+                f"whole {c.whole_parts:,} parts (cost {self.get_size_display(c.whole_cost)}): "
+                f"{'whole tar' if c.whole else 'ranged'}")
+        return gets
+
+    def write_member(self, tar, info, members):
+        """Write one tar member to the paths of every wanted file it holds; the files that failed"""
+        paths = []
+        for member in members:
+            path = output_path(self.output_dir, member.filename)
+            if path is None:
+                self.logger.error(f"Refusing to restore {member.filename} outside {self.output_dir}")
+                continue
+            paths.append((member, path))
+        if not paths:
+            return list(members)
+
+        first = paths[0][1]
+        digest = copy_member(tar, info, first, checksum=any(member.md5 for member, _ in paths))
+
+        failed = [member for member in members if member not in [m for m, _ in paths]]
+        # The first path is moved into place last: the others are copied from its .part file
+        for member, path in reversed(paths):
+            if member.md5 and member.md5 != digest:
+                self.logger.error(f"MD5 mismatch for {member.filename}: expected {member.md5}, got {digest}")
+                failed.append(member)
+                continue
+            if path != first:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                shutil.copyfile(first + '.part', path + '.part')
+            os.replace(path + '.part', path)
+            os.utime(path, (info.mtime, info.mtime))
+            with self.lock:
+                self.restored_files += 1
+                self.restored_bytes += info.size
+        if os.path.exists(first + '.part'):
+            os.remove(first + '.part')
+        return failed
+
+    def fetch(self, get):
+        """Stream one GET through tarfile, writing wanted members; the members not restored"""
+        if get.stop is None:
+            return self.fetch_whole(get)
+        response = self.s3_client.get_object(Bucket=self.bucket, Key=get.tar, Range=f"bytes={get.start}-{get.stop}")
+        body = response['Body']
+        with self.lock:
+            self.get_requests += 1
+        try:
+            return self.extract(get, body, 'r|')
+        finally:
+            with self.lock:
+                self.downloaded_bytes += body.tell() if hasattr(body, 'tell') else 0
+            body.close()
+
+    def fetch_whole(self, get):
+        """Download a whole tar in parallel parts, then extract the wanted members from the local copy"""
+        download = os.path.join(self.output_dir, f".{os.path.basename(get.tar)}.{threading.get_ident()}.download")
+        try:
+            self.s3_client.download_file(self.bucket, get.tar, download, Config=self.transfer_config)
+            size = os.path.getsize(download)
+            with self.lock:
+                self.get_requests += whole_parts(size, self.part_size)
+                self.downloaded_bytes += size
+            with open(download, 'rb') as f:
+                return self.extract(get, f, 'r|*')
+        finally:
+            if os.path.exists(download):
+                os.remove(download)
+
+    def extract(self, get, fileobj, mode):
+        """Write the members of get found in a tar stream; (members not found, members failed)"""
+        remaining = list(get.members)
+        failed = []
+        with tarfile.open(fileobj=fileobj, mode=mode, bufsize=CHUNK_SIZE) as tar:
+            for info in tar:
+                if is_range_addressable(get.tar):
+                    found = [m for m in remaining if m.start_byte == get.start + info.offset]
+                else:
+                    found = [m for m in remaining if matches_name(m, info.name)]
+                if not found:
+                    continue
+                if not info.isfile():
+                    failed.extend(found)
+                    self.logger.error(f"{get.tar}: {info.name} is not a regular file")
+                else:
+                    failed.extend(self.write_member(tar, info, found))
+                remaining = [m for m in remaining if m not in found]
+                if not remaining:
+                    break
+        return remaining, failed
+
+    def restore(self, get):
+        """Restore the members of one GET, retrying from the first member not yet written"""
+        attempt = 0
+        failed = []
+        while True:
+            try:
+                remaining, errors = self.fetch(get)
+                failed.extend(errors)
+                if remaining:
+                    self.logger.error(f"{get.tar}: {len(remaining):,} files not found in bytes "
+                                      f"{get.start}-{get.stop if get.stop is not None else ''}")
+                    failed.extend(remaining)
+                break
+            except Exception as e:
+                attempt += 1
+                if attempt > self.retries:
+                    self.logger.error(f"{get.tar}: {str(e)}")
+                    failed.extend(m for m in get.members if not self.is_restored(m))
+                    break
+                self.logger.warning(f"{get.tar}: {str(e)}, retry {attempt}/{self.retries}")
+                pending = [m for m in get.members if not self.is_restored(m)]
+                if not pending:
+                    break
+                if get.stop is not None:
+                    get = RangeGet(get.tar, pending[0].start_byte, get.stop, pending)
+                else:
+                    get = RangeGet(get.tar, 0, None, pending)
+        with self.lock:
+            self.failed_files += len(failed)
+        for member in failed:
+            self.logger.error(f"Failed to restore {member.filename} from {member.tar}")
+
+    def is_restored(self, member):
+        path = output_path(self.output_dir, member.filename)
+        return path is not None and os.path.exists(path) and not os.path.exists(path + '.part')
+
+    def start_processing(self):
+        start_time = time.time()
+        members, gets = self.plan()
+        if self.dry_run:
+            for get in gets:
+                span = 'whole tar' if get.stop is None else f"bytes {get.start}-{get.stop}"
+                print(f"{get.tar}|{span}|{len(get.members)} files")
+            return
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.num_threads) as executor:
+            list(executor.map(self.restore, gets))
+
+        duration = time.time() - start_time
+        self.logger.info(f"####################################")
+        self.logger.info(f"Bulk restore completed in {duration:.2f} seconds")
+        self.logger.info(f"Bucket: {self.bucket}")
+        self.logger.info(f"Output directory: {self.output_dir}")
+        self.logger.info(f"Files restored: {self.restored_files:,} of {len(members):,}")
+        self.logger.info(f"Failed files: {self.failed_files:,}")
+        self.logger.info(f"GET requests: {self.get_requests:,} for {len(members):,} files")
+        self.logger.info(f"Bytes downloaded: {self.get_size_display(self.downloaded_bytes)} "
+                         f"for {self.get_size_display(self.restored_bytes)} restored")
+        self.logger.info(f"####################################")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Restore many archived files with coalesced ranged GETs')
+    parser.add_argument('--bucket', required=True, help='S3 bucket holding the tars')
+    parser.add_argument('--input', required=True,
+                        help='Restore list: manifest rows (path_index.py --export), search.py output or search page CSV')
+    parser.add_argument('--output-dir', default='restored_data', help='Directory to restore into')
+    parser.add_argument('--num-threads', type=int, default=10, help='Number of parallel GETs')
+    parser.add_argument('--max-gap', type=parse_size, default=1024 * 1024,
+                        help='Merge members of a tar into one GET when at most this many bytes apart (e.g., 1MB)')
+    parser.add_argument('--max-range', type=parse_size, default=256 * 1024 * 1024,
+                        help='Largest merged GET (e.g., 256MB)')
+    parser.add_argument('--strategy', choices=['auto', 'ranged', 'whole'], default='auto',
+                        help='Per tar: ranged GETs, whole-tar download, or whichever costs less (auto)')
+    parser.add_argument('--request-cost', type=parse_size, default=1024 * 1024,
+                        help='Cost of one GET request, as bytes read, for the auto strategy (e.g., 1MB)')
+    parser.add_argument('--part-size', type=parse_size, default=16 * 1024 * 1024,
+                        help='Part size of parallel whole-tar downloads (e.g., 16MB)')
+    parser.add_argument('--retries', type=int, default=3, help='Retries of a failed GET, from the first file not restored')
+    parser.add_argument('--dry-run', type=util.strtobool, default=False,
+                        help='Print the GETs that would be made without downloading')
+    parser.add_argument('--profile-name', help='AWS profile name to use')
+    parser.add_argument('--endpoint', default=None, help='endpoint_url (e.g. a local S3-compatible server)')
+    args = parser.parse_args()
+
+    restore = BulkRestore(args)
+    try:
+        restore.start_processing()
+    except ValueError as e:
+        parser.error(str(e))
+
+if __name__ == '__main__':
+    main()
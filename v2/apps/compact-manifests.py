@@ -0,0 +1,274 @@
+"""
+Compact the per-tar manifests of a date into a few large sorted files.
+
+Every tar gets its own manifest, so a large run leaves tens of thousands of
+small objects under manifests/{date}/, which slows down Athena planning and
+LISTs. This command merges them, for each date:
+
+    manifests/{date}[/{shard}]/manifest_*.csv            -> manifests/{date}/compacted_{time}_{n}.csv.gz
+    manifests_parquet/{date}[/{shard}]/manifest_*.parquet -> manifests_parquet/{date}/compacted_{time}_{n}.parquet
+
+Each output holds up to --target-size of input manifests, sorted by filename.
+
+Search keeps seeing a consistent set while it runs:
+  1. outputs are written under names starting with '_', which Athena ignores
+  2. a journal (_compaction_{time}.json, also hidden) records the outputs and
+     the originals they replace
+  3. outputs are published by copying them to their final names; from here
+     until step 4 a row can be in both files, and search uses SELECT DISTINCT
+  4. the originals are retired: moved to manifests_retired/ (default) or deleted
+  5. the journal is deleted
+With --bloom-filter, each compacted CSV file gets a Bloom filter sidecar
+(bloom_filter.py), written before it is published, and the sidecars of the
+originals are deleted with them.
+A run that stops part way is finished by the next run for that date, which
+replays any journal it finds before compacting again.
+
+Usage:
+    python3 compact-manifests.py --bucket my-bucket --prefix archive1 --date 20250101
+    python3 compact-manifests.py --bucket my-bucket --prefix archive1 --before 20250201 --kind parquet
+"""
+import argparse
+import gzip
+import io
+import json
+import logging
+import os
+from datetime import datetime
+from distutils import util
+
+import boto3
+from botocore.exceptions import ClientError
+
+from bloom_filter import DEFAULT_FP_RATE, bloom_path, to_bloom
+from dedup_index import manifest_rows_text
+from manifest_parquet import COMPRESSION, ROW_GROUP_SIZE, check_format
+
+KINDS = {
+    # kind: (manifest directory, original suffix, output suffix)
+    'csv': ('manifests', '.csv', '.csv.gz'),
+    'parquet': ('manifests_parquet', '.parquet', '.parquet'),
+}
+
+
+def parse_size(size_str):
+    """Convert human readable size string (256MB, 1GB) to bytes"""
+    size_str = size_str.strip().upper()
+    for unit, factor in (('GB', 1024 ** 3), ('MB', 1024 ** 2), ('KB', 1024), ('B', 1)):
+        if size_str.endswith(unit):
+            return int(float(size_str[:-len(unit)]) * factor)
+    return int(size_str)
+
+
+def csv_sort_key(row):
+    """(filename, tarname) of a manifest row; file names may contain the delimiter"""
+    parts = row.split('|')
+    return '|'.join(parts[1:-5]), parts[0]
+
+
+class ManifestCompactor:
+    def __init__(self, args):
+        self.bucket = args.bucket
+        self.prefix = args.prefix.rstrip('/')
+        self.kind = args.kind
+        self.target_size = args.target_size
+        self.retire = args.retire
+        self.storage_class = args.storage_class
+        self.dry_run = args.dry_run
+        self.bloom_filter = args.bloom_filter and self.kind == 'csv'
+        self.current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+        self.directory, self.original_suffix, self.output_suffix = KINDS[self.kind]
+        if self.kind == 'parquet':
+            check_format('parquet')
+
+        session = boto3.Session(profile_name=args.profile_name)
+        self.s3_client = session.client('s3', endpoint_url=args.endpoint)
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        self.logger.addHandler(handler)
+
+    def _list(self, prefix, delimiter=None):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        kwargs = {'Bucket': self.bucket, 'Prefix': prefix}
+        if delimiter:
+            kwargs['Delimiter'] = delimiter
+        for page in paginator.paginate(**kwargs):
+            if delimiter:
+                for common in page.get('CommonPrefixes', []):
+                    yield common['Prefix']
+            else:
+                yield from page.get('Contents', [])
+
+    def dates(self, before=None):
+        """Date directories of the manifest kind, optionally only those before a date"""
+        root = f"{self.prefix}/{self.directory}/"
+        dates = [p[len(root):].rstrip('/') for p in self._list(root, delimiter='/')]
+        return sorted(d for d in dates if before is None or d < before)
+
+    def compact_date(self, date):
+        """Compact one date; returns (originals retired, outputs published)"""
+        date_prefix = f"{self.prefix}/{self.directory}/{date}/"
+        objects = list(self._list(date_prefix))
+
+        # Finish any compaction that stopped part way first
+        for obj in objects:
+            name = os.path.basename(obj['Key'])
+            if name.startswith('_compaction_') and name.endswith('.json'):
+                self.logger.info(f"Resuming interrupted compaction {obj['Key']}")
+                if not self.dry_run:
+                    self._finish(obj['Key'], self._read_json(obj['Key']))
+                objects = list(self._list(date_prefix))
+
+        # Staged outputs without a journal are left over from a run that stopped before publishing
+        for obj in objects:
+            if os.path.basename(obj['Key']).startswith('_compacted_') and not self.dry_run:
+                self.s3_client.delete_object(Bucket=self.bucket, Key=obj['Key'])
+                self.logger.info(f"Removed unpublished {obj['Key']}")
+
+        originals = [o for o in objects
+                     if os.path.basename(o['Key']).startswith('manifest_') and o['Key'].endswith(self.original_suffix)]
+        if len(originals) < 2:
+            self.logger.info(f"{date_prefix}: {len(originals)} manifests, nothing to compact")
+            return 0, 0
+
+        groups, group, group_size = [], [], 0
+        for obj in sorted(originals, key=lambda o: o['Key']):
+            if group and group_size + obj['Size'] > self.target_size:
+                groups.append(group)
+                group, group_size = [], 0
+            group.append(obj)
+            group_size += obj['Size']
+        groups.append(group)
+
+        total_size = sum(o['Size'] for o in originals)
+        self.logger.info(f"{date_prefix}: {len(originals):,} manifests ({total_size:,} bytes) -> {len(groups)} files")
+        if self.dry_run:
+            return 0, 0
+
+        outputs = []
+        for n, group in enumerate(groups, 1):
+            body, rows, lines = self._merge(group)
+            name = f"compacted_{self.current_time}_{n:04d}{self.output_suffix}"
+            staged = f"{date_prefix}_{name}"
+            self.s3_client.put_object(Bucket=self.bucket, Key=staged, Body=body, StorageClass=self.storage_class)
+            if self.bloom_filter:
+                # Lookups only use a filter once its manifest exists
+                self.s3_client.put_object(Bucket=self.bucket, Key=bloom_path(f"{date_prefix}{name}"),
+                                          Body=to_bloom(lines, '|', DEFAULT_FP_RATE), StorageClass=self.storage_class)
+            outputs.append({'staged': staged, 'final': f"{date_prefix}{name}", 'rows': rows,
+                            'originals': [o['Key'] for o in group]})
+            self.logger.info(f"Staged {staged}: {rows:,} rows from {len(group):,} manifests, {len(body):,} bytes")
+
+        journal_key = f"{date_prefix}_compaction_{self.current_time}.json"
+        journal = {'created': self.current_time, 'retire': self.retire, 'blooms': self.bloom_filter, 'outputs': outputs}
+        self.s3_client.put_object(Bucket=self.bucket, Key=journal_key, Body=json.dumps(journal, indent=2).encode('utf-8'))
+        self._finish(journal_key, journal)
+        return len(originals), len(outputs)
+
+    def _merge(self, group):
+        """Merged contents of a group of manifests, sorted by filename: (body, rows, CSV lines)"""
+        if self.kind == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            tables = [pq.read_table(io.BytesIO(self._read(o['Key']))) for o in group]
+            table = pa.concat_tables(tables).sort_by([('filename', 'ascending'), ('tarname', 'ascending')])
+            buffer = io.BytesIO()
+            pq.write_table(table, buffer, compression=COMPRESSION, row_group_size=ROW_GROUP_SIZE)
+            return buffer.getvalue(), table.num_rows, None
+
+        header, rows = None, []
+        for obj in group:
+            lines = manifest_rows_text(self._read(obj['Key']), obj['Key']).splitlines()
+            if not lines:
+                continue
+            # One header for the compacted file: the table skips the first line of each file
+            header = header or lines[0]
+            rows.extend(line for line in lines[1:] if line)
+        rows.sort(key=csv_sort_key)
+        lines = [header] + rows
+        body = gzip.compress(('\n'.join(lines) + '\n').encode('utf-8'), compresslevel=6)
+        return body, len(rows), lines
+
+    def _finish(self, journal_key, journal):
+        """Publish the staged outputs, retire the originals, drop the journal (idempotent)"""
+        for output in journal['outputs']:
+            if self._exists(output['staged']):
+                self.s3_client.copy_object(
+                    Bucket=self.bucket, Key=output['final'], StorageClass=self.storage_class,
+                    CopySource={'Bucket': self.bucket, 'Key': output['staged']}
+                )
+                self.s3_client.delete_object(Bucket=self.bucket, Key=output['staged'])
+                self.logger.info(f"Published {output['final']}")
+            elif not self._exists(output['final']):
+                raise RuntimeError(f"{journal_key}: neither {output['staged']} nor {output['final']} exists")
+
+        originals = [key for output in journal['outputs'] for key in output['originals']]
+        sidecars = [bloom_path(key) for key in originals] if journal.get('blooms') else []
+        if journal['retire'] == 'move':
+            retired_root = f"{self.prefix}/{self.directory}/"
+            for key in originals:
+                if not self._exists(key):
+                    continue
+                retired = f"{self.prefix}/manifests_retired/{self.directory}/{key[len(retired_root):]}"
+                self.s3_client.copy_object(Bucket=self.bucket, Key=retired,
+                                           CopySource={'Bucket': self.bucket, 'Key': key})
+        deleted = originals + sidecars
+        for i in range(0, len(deleted), 1000):
+            self.s3_client.delete_objects(
+                Bucket=self.bucket,
+                Delete={'Objects': [{'Key': key} for key in deleted[i:i + 1000]], 'Quiet': True}
+            )
+        self.s3_client.delete_object(Bucket=self.bucket, Key=journal_key)
+        self.logger.info(f"Retired ({journal['retire']}) {len(originals):,} manifests")
+
+    def _read(self, key):
+        return self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read()
+
+    def _read_json(self, key):
+        return json.loads(self._read(key).decode('utf-8'))
+
+    def _exists(self, key):
+        try:
+            self.s3_client.head_object(Bucket=self.bucket, Key=key)
+            return True
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Merge per-tar manifests into a few large sorted files per date')
+    parser.add_argument('--bucket', required=True, help='S3 bucket holding the archives')
+    parser.add_argument('--prefix', required=True, help='Archive prefix (the --dst-prefix of the archiver)')
+    dates = parser.add_mutually_exclusive_group(required=True)
+    dates.add_argument('--date', action='append', help='Date directory to compact, e.g. 20250101 (repeatable)')
+    dates.add_argument('--before', help='Compact every date directory before this date, e.g. 20250201')
+    parser.add_argument('--kind', choices=sorted(KINDS), default='csv',
+                        help='csv: manifests/ into .csv.gz, parquet: manifests_parquet/ into .parquet')
+    parser.add_argument('--target-size', type=parse_size, default=parse_size('256MB'),
+                        help='Input manifest bytes merged into one output file (e.g. 256MB)')
+    parser.add_argument('--retire', choices=['move', 'delete'], default='move',
+                        help='Move the originals to manifests_retired/ or delete them')
+    parser.add_argument('--storage-class', default='STANDARD', help='Storage class of the compacted files')
+    parser.add_argument('--bloom-filter', type=util.strtobool, default=False,
+                        help='Write a Bloom filter sidecar for each compacted CSV file and delete those of the originals')
+    parser.add_argument('--dry-run', type=util.strtobool, default=False, help='Only report what would be compacted')
+    parser.add_argument('--profile-name', default=None, help='AWS profile name')
+    parser.add_argument('--endpoint', default=None, help='endpoint_url')
+    args = parser.parse_args()
+
+    compactor = ManifestCompactor(args)
+    retired = published = 0
+    for date in args.date or compactor.dates(args.before):
+        r, p = compactor.compact_date(date)
+        retired += r
+        published += p
+    compactor.logger.info(f"Compaction complete: {retired:,} manifests replaced by {published:,} files")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,178 @@
+"""
+Content-addressed deduplication across archive runs.
+
+The index maps the (md5, size) of every archived file to the tar member that
+already holds it: the tar key and the start/stop bytes recorded in its
+manifest row. It is a local SQLite file, filled from the manifests of earlier
+runs (sync) and from every batch a run uploads. When a file's content is
+already archived, the archiver writes a manifest row pointing at the existing
+member instead of adding the bytes to a new tar. Restore fetches that member,
+whose tar header holds the name the content was first archived as, and writes
+it under the file name of the manifest row (restore.py --target_name,
+bulk-restore.py).
+
+Only members of uncompressed tars are indexed: byte ranges in .tar.gz files
+do not address a single member.
+
+Usage (import manifests of other prefixes into an index):
+    python3 dedup_index.py --index dedup.db --bucket my-bucket --prefix archive1 --prefix archive2
+"""
+import argparse
+import gzip
+import os
+import sqlite3
+import threading
+
+import boto3
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS content (
+    md5 TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    tar_key TEXT NOT NULL,
+    start_byte INTEGER NOT NULL,
+    stop_byte INTEGER NOT NULL,
+    PRIMARY KEY (md5, size)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS manifests (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    rows INTEGER
+);
+"""
+
+
+def manifest_rows_text(body, key):
+    """Text of a CSV manifest object; compacted manifests are gzipped (.csv.gz)"""
+    if key.endswith('.gz'):
+        body = gzip.decompress(body)
+    return body.decode('utf-8')
+
+
+def is_csv_manifest(key):
+    """Per-tar or compacted CSV manifest; names starting with '_' are staged or journals"""
+    return key.endswith(('.csv', '.csv.gz')) and not os.path.basename(key).startswith('_')
+
+
+def parse_manifest(text):
+    """Yield (md5, size, tar_key, start_byte, stop_byte) for the indexable rows of a manifest"""
+    lines = text.splitlines()
+    # s3s3-archiver.py manifests (tar_path|...|end_position|...) end one byte past the member;
+    # stop_byte is inclusive, as in the fss3 manifests
+    exclusive = 1 if lines and lines[0].startswith('tar_path|') else 0
+    for line in lines[1:]:
+        parts = line.split('|')
+        # File names may contain the delimiter: the tar key is first, the numbers and md5 last
+        if len(parts) < 7 or not parts[-1]:
+            continue
+        tar_key = parts[0]
+        if not tar_key.endswith('.tar'):
+            continue
+        try:
+            size, start_byte, stop_byte = int(parts[-4]), int(parts[-3]), int(parts[-2])
+        except ValueError:
+            continue
+        yield parts[-1], size, tar_key, start_byte, stop_byte - exclusive
+
+
+class DedupIndex:
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+
+        # Savings of this run
+        self.files_deduplicated = 0
+        self.bytes_saved = 0
+        self.puts_saved = 0
+        self.tars_skipped = 0
+
+    def count(self):
+        """Distinct contents in the index"""
+        with self._lock:
+            return self._conn.execute('SELECT COUNT(*) FROM content').fetchone()[0]
+
+    def lookup(self, keys):
+        """{(md5, size): (tar_key, start_byte, stop_byte)} for the keys already archived"""
+        found = {}
+        with self._lock:
+            for md5, size in keys:
+                row = self._conn.execute(
+                    'SELECT tar_key, start_byte, stop_byte FROM content WHERE md5 = ? AND size = ?', (md5, size)
+                ).fetchone()
+                if row:
+                    found[(md5, size)] = row
+        return found
+
+    def add(self, entries):
+        """Index [(md5, size, tar_key, start_byte, stop_byte)]; the first member stored for a content wins"""
+        with self._lock, self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO content VALUES (?, ?, ?, ?, ?)', entries)
+
+    def record(self, files, bytes_saved, puts_saved, tar_skipped=False):
+        with self._lock:
+            self.files_deduplicated += files
+            self.bytes_saved += bytes_saved
+            self.puts_saved += puts_saved
+            self.tars_skipped += tar_skipped
+
+    def sync(self, s3_client, bucket, prefix):
+        """Import the manifests under {prefix}/manifests/ that are new or changed; returns (manifests, rows)"""
+        with self._lock:
+            known = dict(self._conn.execute('SELECT key, etag FROM manifests'))
+        manifests = rows = 0
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix.rstrip('/')}/manifests/"):
+            for obj in page.get('Contents', []):
+                key, etag = obj['Key'], obj.get('ETag')
+                if not is_csv_manifest(key) or known.get(key) == etag:
+                    continue
+                text = manifest_rows_text(s3_client.get_object(Bucket=bucket, Key=key)['Body'].read(), key)
+                entries = list(parse_manifest(text))
+                with self._lock, self._conn:
+                    self._conn.executemany('INSERT OR IGNORE INTO content VALUES (?, ?, ?, ?, ?)', entries)
+                    self._conn.execute('INSERT OR REPLACE INTO manifests VALUES (?, ?, ?)', (key, etag, len(entries)))
+                manifests += 1
+                rows += len(entries)
+        if self.logger:
+            self.logger.info(f"Dedup index {self.path}: imported {rows:,} rows from {manifests:,} new manifests "
+                             f"under s3://{bucket}/{prefix}")
+        return manifests, rows
+
+    def summary(self):
+        """Run report lines"""
+        return [
+            f"Deduplicated files: {self.files_deduplicated:,}",
+            f"Bytes not stored again: {self.bytes_saved:,}",
+            f"PUT requests saved: {self.puts_saved:,} ({self.tars_skipped:,} tars not needed)",
+        ]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a dedup index from archive manifests')
+    parser.add_argument('--index', required=True, help='SQLite index file (created if missing)')
+    parser.add_argument('--bucket', required=True, help='S3 bucket holding the archives')
+    parser.add_argument('--prefix', required=True, action='append', help='Archive prefix (repeatable)')
+    parser.add_argument('--profile-name', default=None, help='AWS profile name')
+    parser.add_argument('--endpoint', default=None, help='endpoint_url')
+    args = parser.parse_args()
+
+    s3_client = boto3.Session(profile_name=args.profile_name).client('s3', endpoint_url=args.endpoint)
+    index = DedupIndex(args.index)
+    for prefix in args.prefix:
+        manifests, rows = index.sync(s3_client, args.bucket, prefix)
+        print(f"s3://{args.bucket}/{prefix}: imported {rows:,} rows from {manifests:,} manifests")
+    print(f"{args.index}: {index.count():,} distinct contents")
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,12 @@ import time
 import argparse
 from argparse import ArgumentTypeError
 from distutils import util
+from run_stats import RunStats
+from run_metrics import RunMetrics
+from run_trace import Tracer
+from archive_plan import PlanRecorder, check_plan, iter_plan_batches, parse_rates
+from bloom_filter import DEFAULT_FP_RATE, bloom_path, check_bloom, to_bloom
+from manifest_parquet import MANIFEST_FORMATS, check_format, to_parquet, writes_csv, writes_parquet
 
 def parse_size(size_str: str) -> int:
     """Convert human readable size string to bytes"""
@@ -86,6 +92,14 @@ class FS2FSArchiver:
         self.max_size_per_tar = args.max_size
         self.num_threads = args.num_threads
         self.compress = args.compress
+        self.dry_run = args.dry_run
+        self.plan_file = args.plan_file
+        self.manifest_format = args.manifest_format
+        check_format(self.manifest_format)
+        self.bloom_filter = args.bloom_filter
+        self.bloom_fp_rate = args.bloom_fp_rate
+        if self.bloom_filter:
+            check_bloom(self.bloom_fp_rate, self.manifest_format)
         
         # Create necessary directories
         self.directories = self._create_directories()
@@ -118,29 +132,48 @@ class FS2FSArchiver:
         # Validate options
         if self.max_files_per_tar is not None and self.max_size_per_tar is not None:
             raise ValueError("Cannot specify both --max-files and --max-size")
-        if self.max_files_per_tar is None and self.max_size_per_tar is None:
+        if self.max_files_per_tar is None and self.max_size_per_tar is None and not self.plan_file:
             raise ValueError("Must specify either --max-files or --max-size")
+        if args.save_plan and not self.dry_run:
+            raise ValueError("--save-plan requires --dry-run")
+        if self.plan_file:
+            plan = check_plan(self.plan_file, 'fsfs', self.src_prefix)
+            self.logger.info(f"Executing saved plan {self.plan_file} instead of scanning the source")
             
-        # Log the chosen strategy
-        if self.max_files_per_tar is not None:
+        # Log the chosen strategy (a saved plan already fixed its batches)
+        if self.plan_file:
+            self.logger.info(f"Using the plan's strategy: {plan['strategy']}")
+        elif self.max_files_per_tar is not None:
             self.logger.info(f"Using file count strategy: {self.max_files_per_tar} files per archive")
         else:
             self.logger.info(f"Using size strategy: {self.get_size_display(self.max_size_per_tar)} per archive")
         
         # Initialize locks and events
         self.tar_sequence_lock = threading.Lock()
-        self._stats_lock = threading.Lock()
         self.stop_event = threading.Event()
         
-        # Initialize counters
-        self._total_files = 0
-        self._failed_files = 0
-        self._total_tar_files = 0
-        self._total_manifest_files = 0
-        self._total_bytes_transferred = 0
+        # Initialize counters (per-thread shards, summed on read)
+        self.stats = RunStats()
         
         # Queue for producer/consumer pattern
         self.file_batch_queue = queue.Queue(maxsize=self.num_threads * 2)
+        if self.dry_run:
+            # Batches go to the planner instead of the consumers
+            if self.plan_file:
+                strategy = plan['strategy']
+            elif self.max_files_per_tar is not None:
+                strategy = f"{self.max_files_per_tar} files per archive"
+            else:
+                strategy = f"{self.get_size_display(self.max_size_per_tar)} per archive"
+            self.file_batch_queue = PlanRecorder(
+                'fsfs', self.src_prefix, self.dst_prefix,
+                strategy, self.num_threads, ('full_path', 'rel_path', 'size'), 'rel_path', 'rel_path',
+                to_s3=False,
+                # Manifest rows name the tar file only: archive_20250101_120000_0001.tar
+                tar_key_length=31,
+                save_plan=args.save_plan,
+                rates=args.plan_rates
+            )
         
         # Set timestamp for file naming
         self.current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -151,6 +184,24 @@ class FS2FSArchiver:
         
         # Set delimiter for manifest files
         self.DELIMITER = '|'
+
+        # Live metrics (HTTP endpoint and/or periodic JSON snapshot)
+        self.metrics = RunMetrics(
+            self.stats,
+            self._collect_metrics,
+            logger=self.logger,
+            port=args.metrics_port,
+            snapshot_file=os.path.join(self.directories['logs'], f'metrics_{self.current_time}.json') if args.metrics_snapshot else None,
+            interval=args.metrics_interval,
+            host=args.metrics_host
+        )
+
+        # Timeline trace (Chrome trace format), written when the run ends
+        self.tracer = Tracer(
+            os.path.join(self.directories['logs'], f'trace_{self.current_time}.json') if args.trace else None,
+            file_spans=args.trace_files
+        )
+
     def _create_directories(self):
         """Create necessary directories for archives, manifests, and logs"""
         directories = {
@@ -158,6 +209,10 @@ class FS2FSArchiver:
             'manifests': os.path.join(self.dst_prefix, 'manifests'),
             'logs': os.path.join(self.dst_prefix, 'logs')
         }
+        if writes_parquet(self.manifest_format):
+            directories['manifests_parquet'] = os.path.join(self.dst_prefix, 'manifests_parquet')
+        if self.bloom_filter:
+            directories['blooms'] = os.path.join(self.dst_prefix, 'blooms')
         
         for dir_name, dir_path in directories.items():
             try:
@@ -168,38 +223,43 @@ class FS2FSArchiver:
         
         return directories
 
-    def _update_stats(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0):
-        """Thread-safe statistics update"""
-        with self._stats_lock:
-            self._total_files += files
-            self._failed_files += failed
-            self._total_tar_files += tars
-            self._total_manifest_files += manifests
-            self._total_bytes_transferred += bytes_transferred
+    def _update_stats(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0, category=None):
+        """Lock-free statistics update"""
+        self.stats.update(files, failed, tars, manifests, bytes_transferred, category)
+
+    def _collect_metrics(self):
+        """Gauges for the metrics endpoint that are not part of RunStats"""
+        return {
+            'queue_depth': self.file_batch_queue.qsize(),
+        }
 
     @property
     def total_files(self):
-        return self._total_files
+        return self.stats.totals()['files']
     
     @property
     def failed_files(self):
-        return self._failed_files
+        return self.stats.totals()['failed']
     
     @property
     def total_tar_files(self):
-        return self._total_tar_files
+        return self.stats.totals()['tars']
     
     @property
     def total_manifest_files(self):
-        return self._total_manifest_files
+        return self.stats.totals()['manifests']
     
     @property
     def total_bytes_transferred(self):
-        return self._total_bytes_transferred
+        return self.stats.totals()['bytes']
 
     def start_processing(self):
         """Start the producer and consumer threads"""
+        if self.dry_run:
+            self._dry_run()
+            return
         self.start_time = time.time()
+        self.metrics.start()
         
         # Create and start consumer threads first
         self.consumer_threads = [
@@ -215,7 +275,7 @@ class FS2FSArchiver:
             
         # Create and start producer thread
         self.producer_thread = threading.Thread(
-            target=self._file_list_producer,
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
             name="producer"
         )
         self.producer_thread.start()
@@ -224,6 +284,8 @@ class FS2FSArchiver:
         self.producer_thread.join()
         for consumer in self.consumer_threads:
             consumer.join()
+        self.metrics.stop()
+        trace_file = self.tracer.write()
 
         # Log final statistics
         elapsed_time = time.time() - self.start_time
@@ -240,8 +302,23 @@ class FS2FSArchiver:
         if elapsed_time > 0:
             transfer_rate = self.total_bytes_transferred / elapsed_time
             self.logger.info(f"Average transfer rate: {self.get_size_display(transfer_rate)}/s")
+        for line in self.stats.format_histograms():
+            self.logger.info(f"Latency {line}")
+        if trace_file:
+            self.logger.info(f"Trace written to {trace_file}")
         self.logger.info(f"####################################")
 
+    def _dry_run(self):
+        """Run the producer into the planner and report the plan"""
+        self.logger.info("Dry run: scanning the source without reading or writing any file")
+        producer = threading.Thread(
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
+            name="producer"
+        )
+        producer.start()
+        producer.join()
+        self.file_batch_queue.complete(self.directories['logs'], self.current_time, self.logger)
+
     @staticmethod
     def get_size_display(size_in_bytes):
         """Convert bytes to human readable format"""
@@ -266,6 +343,7 @@ class FS2FSArchiver:
             batch_number = 0
             total_files_found = 0
             start_time = time.time()
+            scan_mark = time.perf_counter()
             
             self.logger.info("Starting file discovery and immediate processing...")
             
@@ -281,6 +359,7 @@ class FS2FSArchiver:
                         file_size = os.path.getsize(full_path)
                     except OSError as e:
                         self.logger.error(f"Failed to get size for file {full_path}: {str(e)}")
+                        self.stats.add_failure('scan')
                         continue
                     
                     total_files_found += 1
@@ -321,6 +400,10 @@ class FS2FSArchiver:
                         )
                         
                         # Queue the batch for immediate processing
+                        put_start = time.perf_counter()
+                        self.stats.add_busy('scan', put_start - scan_mark)
+                        self.tracer.complete('scan', scan_mark, put_start, batch=batch_number, files=len(current_batch))
+                        queued_batch = batch_number
                         while not self.stop_event.is_set():
                             try:
                                 self.file_batch_queue.put(batch, timeout=5.0)
@@ -335,6 +418,9 @@ class FS2FSArchiver:
                             except queue.Full:
                                 self.logger.warning("Queue full, waiting for consumers to catch up...")
                                 time.sleep(1)
+                        scan_mark = time.perf_counter()
+                        self.stats.add_idle('producer', scan_mark - put_start)
+                        self.tracer.complete('queue put', put_start, scan_mark, 'idle', batch=queued_batch)
             
             # Process any remaining files in the last batch
             if current_batch:
@@ -345,6 +431,9 @@ class FS2FSArchiver:
                     file_count=len(current_batch)
                 )
                 
+                put_start = time.perf_counter()
+                self.stats.add_busy('scan', put_start - scan_mark)
+                self.tracer.complete('scan', scan_mark, put_start, batch=batch_number, files=len(current_batch))
                 while not self.stop_event.is_set():
                     try:
                         self.file_batch_queue.put(batch, timeout=5.0)
@@ -356,6 +445,13 @@ class FS2FSArchiver:
                     except queue.Full:
                         self.logger.warning("Queue full, waiting to queue final batch...")
                         time.sleep(1)
+                put_end = time.perf_counter()
+                self.stats.add_idle('producer', put_end - put_start)
+                self.tracer.complete('queue put', put_start, put_end, 'idle', batch=batch_number)
+            else:
+                scan_end = time.perf_counter()
+                self.stats.add_busy('scan', scan_end - scan_mark)
+                self.tracer.complete('scan', scan_mark, scan_end)
             
             self.logger.info(
                 f"File discovery complete. Total files found: {total_files_found:,} "
@@ -381,6 +477,36 @@ class FS2FSArchiver:
                 except queue.Full:
                     pass
 
+    def _plan_producer(self):
+        """Producer that replays the batches of a saved plan"""
+        try:
+            for batch_number, total_size, files in iter_plan_batches(self.plan_file, 'fsfs', self.src_prefix):
+                batch = FileBatch(
+                    files=[FileInfo(**f) for f in files],
+                    batch_number=batch_number,
+                    total_size=total_size,
+                    file_count=len(files)
+                )
+                while not self.stop_event.is_set():
+                    try:
+                        self.file_batch_queue.put(batch, timeout=5.0)
+                        break
+                    except queue.Full:
+                        time.sleep(1)
+                if self.stop_event.is_set():
+                    break
+        except Exception as e:
+            self.logger.error(f"Producer error: {str(e)}", exc_info=True)
+            self.stop_event.set()
+        # Send completion signals to consumers
+        for _ in range(self.num_threads):
+            while not self.stop_event.is_set():
+                try:
+                    self.file_batch_queue.put(None, timeout=5.0)
+                    break
+                except queue.Full:
+                    time.sleep(1)
+
     def _tar_creator_consumer(self):
         """Consumes file batches from the queue and creates tar archives"""
         thread_name = threading.current_thread().name
@@ -397,10 +523,15 @@ class FS2FSArchiver:
         while not self.stop_event.is_set():
             try:
                 # Get batch from queue
+                wait_start = time.perf_counter()
                 try:
                     batch = self.file_batch_queue.get(timeout=1.0)
                 except queue.Empty:
                     continue
+                finally:
+                    wait_end = time.perf_counter()
+                    self.stats.add_idle('consumer', wait_end - wait_start)
+                    self.tracer.complete('queue wait', wait_start, wait_end, 'idle')
                 
                 if batch is None:
                     self.logger.debug(f"{thread_name}: Received completion signal")
@@ -417,6 +548,7 @@ class FS2FSArchiver:
                 manifest_path = os.path.join(self.directories['manifests'], manifest_filename)
                 
                 # Create tar archive
+                stage = 'hash'
                 try:
                     manifest_content = []
                     failed_files = []
@@ -427,17 +559,31 @@ class FS2FSArchiver:
                     )
                     
                     # First pass: calculate MD5 hashes
+                    stage_start = time.perf_counter()
                     file_hashes = {}
                     for file_info in batch.files:
                         try:
+                            t0 = time.perf_counter()
                             with open(file_info.full_path, 'rb') as f:
                                 file_data = f.read()
+                                t1 = time.perf_counter()
                                 file_hashes[file_info.full_path] = hashlib.md5(file_data).hexdigest()
+                            t2 = time.perf_counter()
+                            self.stats.record_file('read', t1 - t0)
+                            self.stats.record_file('hash', t2 - t1)
+                            self.tracer.file_span('read', t0, t1, file=file_info.rel_path, size=file_info.size)
+                            self.tracer.file_span('hash', t1, t2, file=file_info.rel_path)
                         except Exception as e:
                             self.logger.error(f"Failed to calculate MD5 for {file_info.full_path}: {str(e)}")
                             failed_files.append(file_info.full_path)
+                    hash_failures = len(failed_files)
 
                     # Create tar file with positioning information
+                    stage = 'tar'
+                    stage_end = time.perf_counter()
+                    self.stats.add_busy('hash', stage_end - stage_start)
+                    self.tracer.complete('read+hash', stage_start, stage_end, batch=tar_filename, files=batch.file_count)
+                    stage_start = time.perf_counter()
 
                     with tarfile.open(tar_path, 'w:'+ compress) as tar:
                         offset = 0  # Track current position in tar file
@@ -452,7 +598,11 @@ class FS2FSArchiver:
                                 start_pos = offset
                                 
                                 # Add file to tar
+                                t0 = time.perf_counter()
                                 tar.add(file_info.full_path, arcname=file_info.rel_path)
+                                t1 = time.perf_counter()
+                                self.stats.record_file('tar', t1 - t0)
+                                self.tracer.file_span('tar', t0, t1, file=file_info.rel_path)
                                 
                                 # Calculate end position
                                 end_pos = start_pos + file_size - 1
@@ -472,13 +622,32 @@ class FS2FSArchiver:
                                 failed_files.append(file_info.full_path)
                     
                     # Write manifest file
-                    with open(manifest_path, 'w') as f:
-                        f.write('\n'.join(manifest_content))
+                    if writes_csv(self.manifest_format):
+                        with open(manifest_path, 'w') as f:
+                            f.write('\n'.join(manifest_content))
+                    if writes_parquet(self.manifest_format):
+                        parquet_file = os.path.join(
+                            self.directories['manifests_parquet'], os.path.splitext(manifest_filename)[0] + '.parquet'
+                        )
+                        with open(parquet_file, 'wb') as f:
+                            f.write(to_parquet(manifest_content, self.DELIMITER))
+                    if self.bloom_filter:
+                        bloom_file = os.path.join(
+                            self.directories['blooms'], os.path.splitext(manifest_filename)[0] + '.bloom'
+                        )
+                        with open(bloom_file, 'wb') as f:
+                            f.write(to_bloom(manifest_content, self.DELIMITER, self.bloom_fp_rate))
+                    stage_end = time.perf_counter()
+                    self.stats.add_busy('tar', stage_end - stage_start)
+                    self.tracer.complete('tar', stage_start, stage_end, batch=tar_filename, files=batch.file_count)
                     
                     # Update statistics
+                    if hash_failures:
+                        self._update_stats(failed=hash_failures, category='hash')
                     self._update_stats(
                         files=len(batch.files) - len(failed_files),
-                        failed=len(failed_files),
+                        failed=len(failed_files) - hash_failures,
+                        category='tar',
                         tars=1,
                         manifests=1,
                         bytes_transferred=batch.total_size
@@ -491,6 +660,8 @@ class FS2FSArchiver:
                     
                 except Exception as e:
                     self.logger.error(f"{thread_name}: Failed to create archive {tar_filename}: {str(e)}")
+                    self.stats.add_failure(stage, len(batch.files))
+                    self.tracer.instant('batch failed', batch=tar_filename, stage=stage, error=str(e))
                     # Attempt to clean up partial files
                     for file in [tar_path, manifest_path]:
                         if os.path.exists(file):
@@ -513,7 +684,7 @@ def main():
     parser.add_argument('--src-path', required=True, help='Source directory path')
     parser.add_argument('--dst-path', required=True, help='Destination directory path')
     
-    group = parser.add_mutually_exclusive_group(required=True)
+    group = parser.add_mutually_exclusive_group()
     group.add_argument('--max-files', type=int, help='Maximum files per archive')
     group.add_argument(
         '--max-size', 
@@ -523,8 +694,34 @@ def main():
     
     parser.add_argument('--num-threads', type=int, default=4, help='Number of consumer threads')
     parser.add_argument('--compress', type=util.strtobool, default=False, help='GZip Compress for tarfile, True or False')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve live metrics on this HTTP port (/metrics, /metrics.json; 0 = off)')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='Address the metrics endpoint listens on (0.0.0.0 for every interface)')
+    parser.add_argument('--metrics-snapshot', type=util.strtobool, default=False,
+                        help='Write a JSON metrics snapshot to the log directory every --metrics-interval seconds')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='Metrics sampling interval in seconds')
+    parser.add_argument('--manifest-format', choices=MANIFEST_FORMATS, default='csv',
+                        help='Manifest format: pipe-delimited csv, parquet (in manifests_parquet/, needs pyarrow) or both')
+    parser.add_argument('--bloom-filter', type=util.strtobool, default=False,
+                        help='Write a Bloom filter of the file names next to each manifest (in blooms/), for path-lookup.py')
+    parser.add_argument('--bloom-fp-rate', type=float, default=DEFAULT_FP_RATE,
+                        help='False positive rate of each Bloom filter; a path lookup reads about RATE x manifests in vain')
+    parser.add_argument('--dry-run', type=util.strtobool, default=False,
+                        help='Scan the source and report the batch plan and duration without archiving')
+    parser.add_argument('--save-plan', default=None,
+                        help='With --dry-run, save the batch plan to this file (.gz to compress)')
+    parser.add_argument('--plan-file', default=None, help='Execute a plan saved with --save-plan instead of scanning')
+    parser.add_argument('--plan-rates', type=parse_rates, default=None,
+                        help='Throughput assumed by the dry-run duration estimate: FILES_PER_SECOND,MB_PER_SECOND')
+    parser.add_argument('--trace', type=util.strtobool, default=False,
+                      help='Write a Chrome/Perfetto trace of every stage, batch and thread to the log directory')
+    parser.add_argument('--trace-files', type=util.strtobool, default=False,
+                      help='Also trace every file (read, hash, tar); large for long runs')
     
     args = parser.parse_args()
+    if args.max_files is None and args.max_size is None and not args.plan_file:
+        parser.error("one of the arguments --max-files --max-size is required")
     
     archiver = FS2FSArchiver(args)
     archiver.start_processing()
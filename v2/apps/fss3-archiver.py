@@ -20,6 +20,15 @@ import time
 import argparse
 from argparse import ArgumentTypeError
 from distutils import util
+from run_stats import RunStats
+from s3_concurrency import AdaptiveConcurrency
+from archive_layout import archive_keys
+from run_metrics import RunMetrics
+from run_trace import Tracer
+from archive_plan import PlanRecorder, check_plan, iter_plan_batches, parse_rates, put_requests
+from bloom_filter import DEFAULT_FP_RATE, bloom_path, check_bloom, to_bloom
+from dedup_index import DedupIndex
+from manifest_parquet import MANIFEST_FORMATS, check_format, parquet_path, to_parquet, writes_csv, writes_parquet
 
 # Global variables
 REGION=None
@@ -105,6 +114,15 @@ class FS2S3Archiver:
         self.current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
         self.tar_storageclass = args.tar_storageclass
         self.manifest_storageclass = args.manifest_storageclass
+        self.adaptive_concurrency = args.adaptive_concurrency
+        self.initial_concurrency = args.initial_concurrency
+        self.prefix_shards = args.prefix_shards
+        self.dry_run = args.dry_run
+        self.plan_file = args.plan_file
+        self.dedup_sync = args.dedup_sync
+        self.manifest_format = args.manifest_format
+        self.bloom_filter = args.bloom_filter
+        self.bloom_fp_rate = args.bloom_fp_rate
 
         # Set S3 client
         self.s3_client = self._get_s3_client()
@@ -141,32 +159,68 @@ class FS2S3Archiver:
         self.logger.addHandler(file_handler)
         self.logger.addHandler(console_handler)
         
+        # Adaptive concurrency: --num-threads becomes the ceiling for S3 requests
+        self.concurrency = None
+        if self.adaptive_concurrency:
+            self.concurrency = AdaptiveConcurrency(self.num_threads, initial=self.initial_concurrency, logger=self.logger)
+            self.concurrency.attach(self.s3_client)
+            self.logger.info(f"Using adaptive concurrency: starting at {self.concurrency.limiters['GET'].limit}, "
+                             f"up to {self.num_threads} concurrent S3 requests")
+
         # Validate options
         if self.max_files_per_tar is not None and self.max_size_per_tar is not None:
             raise ValueError("Cannot specify both --max-files and --max-size")
-        if self.max_files_per_tar is None and self.max_size_per_tar is None:
+        if self.max_files_per_tar is None and self.max_size_per_tar is None and not self.plan_file:
             raise ValueError("Must specify either --max-files or --max-size")
+        if self.prefix_shards < 0:
+            raise ValueError("--prefix-shards must be 0 or greater")
+        if args.save_plan and not self.dry_run:
+            raise ValueError("--save-plan requires --dry-run")
+        check_format(self.manifest_format)
+        if args.dedup_index and not writes_csv(self.manifest_format):
+            raise ValueError("--dedup-index reads CSV manifests: use --manifest-format csv or both")
+        if self.bloom_filter:
+            check_bloom(self.bloom_fp_rate, self.manifest_format)
+        if self.plan_file:
+            plan = check_plan(self.plan_file, 'fss3', self.input_file or self.src_prefix)
+            self.logger.info(f"Executing saved plan {self.plan_file} instead of scanning the source")
             
-        # Log the chosen strategy
-        if self.max_files_per_tar is not None:
+        # Log the chosen strategy (a saved plan already fixed its batches)
+        if self.plan_file:
+            self.logger.info(f"Using the plan's strategy: {plan['strategy']}")
+        elif self.max_files_per_tar is not None:
             self.logger.info(f"Using file count strategy: {self.max_files_per_tar} files per archive")
         else:
             self.logger.info(f"Using size strategy: {self.get_size_display(self.max_size_per_tar)} per archive")
         
         # Initialize locks and events
         self.tar_sequence_lock = threading.Lock()
-        self._stats_lock = threading.Lock()
         self.stop_event = threading.Event()
         
-        # Initialize counters
-        self._total_files = 0
-        self._failed_files = 0
-        self._total_tar_files = 0
-        self._total_manifest_files = 0
-        self._total_bytes_transferred = 0
+        # Initialize counters (per-thread shards, summed on read)
+        self.stats = RunStats()
         
         # Queue for producer/consumer pattern
         self.file_batch_queue = queue.Queue(maxsize=self.num_threads * 2)
+        if self.dry_run:
+            # Batches go to the planner instead of the consumers
+            if self.plan_file:
+                strategy = plan['strategy']
+            elif self.max_files_per_tar is not None:
+                strategy = f"{self.max_files_per_tar} files per archive"
+            else:
+                strategy = f"{self.get_size_display(self.max_size_per_tar)} per archive"
+            self.file_batch_queue = PlanRecorder(
+                'fss3', self.input_file or self.src_prefix, f"s3://{self.dst_bucket}/{self.dst_prefix}",
+                strategy, self.num_threads, ('full_path', 'rel_path', 'size'), 'rel_path', 'full_path',
+                dst_prefix=self.dst_prefix,
+                tar_storageclass=self.tar_storageclass,
+                manifest_storageclass=self.manifest_storageclass,
+                multipart_threshold=self.transfer_config.multipart_threshold,
+                multipart_chunksize=self.transfer_config.multipart_chunksize,
+                save_plan=args.save_plan,
+                rates=args.plan_rates
+            )
         
         # Set timestamp for file naming
         self.tar_sequence = 0
@@ -177,6 +231,30 @@ class FS2S3Archiver:
         # Set delimiter for manifest files
         self.DELIMITER = '|'
 
+        # Live metrics (HTTP endpoint and/or periodic JSON snapshot)
+        self.metrics = RunMetrics(
+            self.stats,
+            self._collect_metrics,
+            logger=self.logger,
+            port=args.metrics_port,
+            snapshot_file=os.path.join(self.directories['logs'], f'metrics_{self.current_time}.json') if args.metrics_snapshot else None,
+            interval=args.metrics_interval,
+            host=args.metrics_host
+        )
+
+        # Timeline trace (Chrome trace format), written when the run ends
+        self.tracer = Tracer(
+            os.path.join(self.directories['logs'], f'trace_{self.current_time}.json') if args.trace else None,
+            file_spans=args.trace_files
+        )
+
+        # Cross-run deduplication by content (md5, size)
+        self.dedup = None
+        if args.dedup_index and not self.dry_run:
+            self.dedup = DedupIndex(args.dedup_index, logger=self.logger)
+            if self.compress:
+                self.logger.warning("--dedup-index has no effect with --compress: byte ranges in .tar.gz do not address members")
+
     def _get_s3_client(self):
         """Initialize s3 client"""
         session = boto3.Session(profile_name=self.profile_name)
@@ -200,34 +278,39 @@ class FS2S3Archiver:
         
         return directories
 
-    def _update_stats(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0):
-        """Thread-safe statistics update"""
-        with self._stats_lock:
-            self._total_files += files
-            self._failed_files += failed
-            self._total_tar_files += tars
-            self._total_manifest_files += manifests
-            self._total_bytes_transferred += bytes_transferred
+    def _update_stats(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0, category=None):
+        """Lock-free statistics update"""
+        self.stats.update(files, failed, tars, manifests, bytes_transferred, category)
+
+    def _collect_metrics(self):
+        """Gauges for the metrics endpoint that are not part of RunStats"""
+        gauges = {
+            'queue_depth': self.file_batch_queue.qsize(),
+        }
+        if self.dedup:
+            gauges['dedup_files'] = self.dedup.files_deduplicated
+            gauges['dedup_bytes_saved'] = self.dedup.bytes_saved
+        return gauges
 
     @property
     def total_files(self):
-        return self._total_files
+        return self.stats.totals()['files']
     
     @property
     def failed_files(self):
-        return self._failed_files
+        return self.stats.totals()['failed']
     
     @property
     def total_tar_files(self):
-        return self._total_tar_files
+        return self.stats.totals()['tars']
     
     @property
     def total_manifest_files(self):
-        return self._total_manifest_files
+        return self.stats.totals()['manifests']
     
     @property
     def total_bytes_transferred(self):
-        return self._total_bytes_transferred
+        return self.stats.totals()['bytes']
 
     def format_duration(self, seconds):
        """Convert seconds to human readable duration format"""
@@ -246,7 +329,14 @@ class FS2S3Archiver:
 
     def start_processing(self):
         """Start the producer and consumer threads"""
+        if self.dry_run:
+            self._dry_run()
+            return
         self.start_time = time.time()
+        if self.dedup and self.dedup_sync:
+            with self.tracer.span('dedup sync'):
+                self.dedup.sync(self.s3_client, self.dst_bucket, self.dst_prefix)
+        self.metrics.start()
         
         # Create and start consumer threads first
         self.consumer_threads = [
@@ -262,7 +352,7 @@ class FS2S3Archiver:
             
         # Create and start producer thread
         self.producer_thread = threading.Thread(
-            target=self._file_list_producer,
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
             name="producer"
         )
         self.producer_thread.start()
@@ -271,6 +361,8 @@ class FS2S3Archiver:
         self.producer_thread.join()
         for consumer in self.consumer_threads:
             consumer.join()
+        self.metrics.stop()
+        trace_file = self.tracer.write()
 
         # Log final statistics
         elapsed_time = time.time() - self.start_time
@@ -290,8 +382,52 @@ class FS2S3Archiver:
         if elapsed_time > 0:
             transfer_rate = self.total_bytes_transferred / elapsed_time
             self.logger.info(f"Average transfer rate: {self.get_size_display(transfer_rate)}/s")
+        for line in self.stats.format_histograms():
+            self.logger.info(f"Latency {line}")
+        if self.concurrency:
+            for line in self.concurrency.summary():
+                self.logger.info(f"Adaptive concurrency {line}")
+        if self.dedup:
+            for line in self.dedup.summary():
+                self.logger.info(line)
+            self.dedup.close()
+        if trace_file:
+            self.logger.info(f"Trace written to {trace_file}")
         self.logger.info(f"####################################")
 
+    def _dry_run(self):
+        """Run the producer into the planner and report the plan"""
+        self.logger.info("Dry run: listing the source without reading or uploading any file")
+        producer = threading.Thread(
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
+            name="producer"
+        )
+        producer.start()
+        producer.join()
+        self.file_batch_queue.complete(self.directories['logs'], self.current_time, self.logger)
+
+    def _plan_producer(self):
+        """Producer that replays the batches of a saved plan"""
+        try:
+            for batch_number, total_size, files in iter_plan_batches(
+                    self.plan_file, 'fss3', self.input_file or self.src_prefix):
+                if self.stop_event.is_set():
+                    break
+                batch_files = [FileInfo(**f) for f in files]
+                self.file_batch_queue.put(FileBatch(
+                    files=batch_files,
+                    batch_number=batch_number,
+                    total_size=total_size,
+                    file_count=len(batch_files)
+                ))
+        except Exception as e:
+            self.logger.error(f"Producer error: {str(e)}")
+            self.stop_event.set()
+        finally:
+            # Signal consumers that no more batches are coming
+            for _ in range(self.num_threads):
+                self.file_batch_queue.put(None)
+
     def _read_input_file(self, input_file):
         """Read file paths from input file"""
         files_info = []
@@ -317,10 +453,10 @@ class FS2S3Archiver:
                             ))
                         except OSError as e:
                             self.logger.error(f"Error accessing file {file_path}: {str(e)}")
-                            self._update_stats(failed=1)
+                            self._update_stats(failed=1, category='scan')
                     else:
                         self.logger.warning(f"File not found: {file_path}")
-                        self._update_stats(failed=1)
+                        self._update_stats(failed=1, category='scan')
         except Exception as e:
             self.logger.error(f"Error reading input file {input_file}: {str(e)}")
             raise
@@ -345,7 +481,7 @@ class FS2S3Archiver:
                         ))
                     except OSError as e:
                         self.logger.error(f"Error accessing file {full_path}: {str(e)}")
-                        self._update_stats(failed=1)
+                        self._update_stats(failed=1, category='scan')
         except Exception as e:
             self.logger.error(f"Error scanning directory {self.src_prefix}: {str(e)}")
             raise
@@ -374,9 +510,10 @@ class FS2S3Archiver:
             current_batch = []
             current_batch_size = 0
             batch_number = 0
+            scan_mark = time.perf_counter()
     
             def send_batch():
-                nonlocal current_batch, current_batch_size, batch_number
+                nonlocal current_batch, current_batch_size, batch_number, scan_mark
                 if current_batch:
                     file_batch = FileBatch(
                         files=current_batch,
@@ -384,7 +521,13 @@ class FS2S3Archiver:
                         total_size=current_batch_size,
                         file_count=len(current_batch)
                     )
+                    put_start = time.perf_counter()
+                    self.stats.add_busy('scan', put_start - scan_mark)
+                    self.tracer.complete('scan', scan_mark, put_start, batch=batch_number, files=len(current_batch))
                     self.file_batch_queue.put(file_batch)
+                    scan_mark = time.perf_counter()
+                    self.stats.add_idle('producer', scan_mark - put_start)
+                    self.tracer.complete('queue put', put_start, scan_mark, 'idle', batch=batch_number)
                     batch_number += 1
                     current_batch = []
                     current_batch_size = 0
@@ -422,7 +565,7 @@ class FS2S3Archiver:
                                 
                         except OSError as e:
                             self.logger.error(f"Error processing {full_path}: {str(e)}")
-                            self._update_stats(failed=1)
+                            self._update_stats(failed=1, category='scan')
     
             # Send any remaining files in the last batch
             send_batch()
@@ -459,9 +602,16 @@ class FS2S3Archiver:
         file_hashes = {}
         for file_info in batch.files:
             try:
+                t0 = time.perf_counter()
                 with open(file_info.full_path, 'rb') as f:
                     file_data = f.read()
+                    t1 = time.perf_counter()
                     file_hashes[file_info.full_path] = hashlib.md5(file_data).hexdigest()
+                t2 = time.perf_counter()
+                self.stats.record_file('read', t1 - t0)
+                self.stats.record_file('hash', t2 - t1)
+                self.tracer.file_span('read', t0, t1, file=file_info.rel_path, size=file_info.size)
+                self.tracer.file_span('hash', t1, t2, file=file_info.rel_path)
             except Exception as e:
                 self.logger.error(f"Failed to calculate MD5 for {file_info.full_path}: {str(e)}")
                 failed_files.append(file_info.full_path)
@@ -483,10 +633,15 @@ class FS2S3Archiver:
         while not self.stop_event.is_set():
             try:
                 # Get batch from queue
+                wait_start = time.perf_counter()
                 try:
                     batch = self.file_batch_queue.get(timeout=1.0)
                 except queue.Empty:
                     continue
+                finally:
+                    wait_end = time.perf_counter()
+                    self.stats.add_idle('consumer', wait_end - wait_start)
+                    self.tracer.complete('queue wait', wait_start, wait_end, 'idle')
                 
                 if batch is None:
                     self.logger.debug(f"{thread_name}: Received completion signal")
@@ -502,10 +657,12 @@ class FS2S3Archiver:
                 
                 mid_prefix = self.current_time.split('_')[0]
                 print(f"mid_prefix: {mid_prefix}")
-                tar_path = self.dst_prefix + "/archives/" +  mid_prefix + "/" + tar_filename
-                manifest_path = self.dst_prefix + "/manifests/" + mid_prefix + "/" +  manifest_filename
+                tar_path, manifest_path = archive_keys(
+                    self.dst_prefix, mid_prefix, batch_id, tar_ext, self.prefix_shards
+                )
 
                 # Create tar archive
+                stage = 'hash'
                 try:
                     manifest_content = []
                     failed_files = []
@@ -517,15 +674,32 @@ class FS2S3Archiver:
                     
                     # First pass: calculate MD5 hashes
                     hash_enabled = True
+                    stage_start = time.perf_counter()
                     if hash_enabled:
                         file_hashes = self._create_hash(batch)
                     else:
                         file_hashes = {}
+                    stage_end = time.perf_counter()
+                    self.stats.add_busy('hash', stage_end - stage_start)
+                    self.tracer.complete('read+hash', stage_start, stage_end, batch=batch_id, files=batch.file_count)
 
                     # Create tar file with positioning information
                     tar_buffer = io.BytesIO()
                     manifest_buffer = io.StringIO()
 
+                    # Contents already archived, by (md5, size): earlier runs, then this tar.
+                    # Offsets in a .tar.gz are positions in the gzip stream, not members: no dedup there
+                    dedup = self.dedup and not self.compress
+                    stored = {}
+                    if dedup:
+                        stored = self.dedup.lookup(
+                            (file_hashes[f.full_path], f.size) for f in batch.files if f.full_path in file_hashes
+                        )
+                    added = []
+                    dedup_files = dedup_bytes = dedup_span = 0
+
+                    stage = 'tar'
+                    stage_start = time.perf_counter()
                     with tarfile.open(fileobj=tar_buffer, mode='w:'+ compress) as tar:
                         offset = 0  # Track current position in tar file
                         
@@ -536,10 +710,27 @@ class FS2S3Archiver:
                             try:
                                 # Get file size and calculate positions
                                 file_size = os.path.getsize(file_info.full_path)
+                                content_key = (file_hashes.get(file_info.full_path), file_size)
+                                if dedup and content_key in stored:
+                                    # Point the manifest at the archived copy instead of storing it again
+                                    stored_key, stored_start, stored_stop = stored[content_key]
+                                    manifest_content.append(
+                                        f"{stored_key}{self.DELIMITER}{file_info.full_path}{self.DELIMITER}{current_date}{self.DELIMITER}"
+                                        f"{file_size}{self.DELIMITER}{stored_start}{self.DELIMITER}{stored_stop}{self.DELIMITER}"
+                                        f"{content_key[0]}"
+                                        )
+                                    dedup_files += 1
+                                    dedup_bytes += file_size
+                                    dedup_span += stored_stop - stored_start + 1
+                                    continue
                                 start_pos = tar_buffer.tell()
                                 
                                 # Add file to tar
+                                t0 = time.perf_counter()
                                 tar.add(file_info.full_path, arcname=file_info.rel_path)
+                                t1 = time.perf_counter()
+                                self.stats.record_file('tar', t1 - t0)
+                                self.tracer.file_span('tar', t0, t1, file=file_info.rel_path)
 
                                 # Show file name while executing
                                 #print(f"Adding {file_info.full_path} into {tar_path}")
@@ -549,6 +740,9 @@ class FS2S3Archiver:
                                 
                                 # Update offset for next file
                                 offset = end_pos + 1
+                                if dedup and content_key[0] and file_size:
+                                    stored.setdefault(content_key, (tar_path, start_pos, end_pos))
+                                    added.append((content_key[0], file_size, tar_path, start_pos, end_pos))
                                 
                                 # Add to manifest with correct positions
                                 if file_hashes == {}:
@@ -570,20 +764,52 @@ class FS2S3Archiver:
                     # Write manifest file
                     content_log = '\n'.join(manifest_content)
                     manifest_buffer.write(content_log)
-
-                    # Upload files
-                    tar_buffer.seek(0)
-                    self._upload_to_s3(bucket=self.dst_bucket, key=tar_path, data=tar_buffer, storageclass=self.tar_storageclass)
-                    manifest_buffer.seek(0)
-                    self._upload_to_s3(bucket=self.dst_bucket, key=manifest_path, data=manifest_buffer.getvalue().encode('utf-8'), storageclass=self.manifest_storageclass)
+                    stage_end = time.perf_counter()
+                    # Size of the finished tar; the upload closes tar_buffer
+                    tar_size = tar_buffer.tell()
+                    self.stats.add_busy('tar', stage_end - stage_start)
+                    self.tracer.complete('tar', stage_start, stage_end, batch=batch_id, bytes=tar_size)
+
+                    # Upload files (no tar when every file was already archived)
+                    stage = 'upload'
+                    upload_tar = not (self.dedup and dedup_files and not added)
+                    with self.stats.upload():
+                        if upload_tar:
+                            with self.tracer.span('upload tar', batch=batch_id, key=tar_path):
+                                tar_buffer.seek(0)
+                                self._upload_to_s3(bucket=self.dst_bucket, key=tar_path, data=tar_buffer, storageclass=self.tar_storageclass)
+                        if writes_csv(self.manifest_format):
+                            with self.tracer.span('upload manifest', batch=batch_id, key=manifest_path):
+                                manifest_buffer.seek(0)
+                                self._upload_to_s3(bucket=self.dst_bucket, key=manifest_path, data=manifest_buffer.getvalue().encode('utf-8'), storageclass=self.manifest_storageclass)
+                        if writes_parquet(self.manifest_format):
+                            parquet_key = parquet_path(manifest_path)
+                            with self.tracer.span('upload manifest', batch=batch_id, key=parquet_key):
+                                self._upload_to_s3(bucket=self.dst_bucket, key=parquet_key, data=to_parquet(manifest_content, self.DELIMITER), storageclass=self.manifest_storageclass)
+                        if self.bloom_filter:
+                            bloom_key = bloom_path(manifest_path)
+                            with self.tracer.span('upload manifest', batch=batch_id, key=bloom_key):
+                                self._upload_to_s3(bucket=self.dst_bucket, key=bloom_key, data=to_bloom(manifest_content, self.DELIMITER, self.bloom_fp_rate), storageclass=self.manifest_storageclass)
+
+                    if self.dedup:
+                        if not self.compress:
+                            self.dedup.add(added)
+                        if dedup_files:
+                            threshold = self.transfer_config.multipart_threshold
+                            chunksize = self.transfer_config.multipart_chunksize
+                            puts = put_requests(tar_size + dedup_span, threshold, chunksize)
+                            if upload_tar:
+                                puts -= put_requests(tar_size, threshold, chunksize)
+                            self.dedup.record(dedup_files, dedup_bytes, puts, tar_skipped=not upload_tar)
 
                     # Update statistics
                     self._update_stats(
                         files=len(batch.files) - len(failed_files),
                         failed=len(failed_files),
-                        tars=1,
+                        category='tar',
+                        tars=1 if upload_tar else 0,
                         manifests=1,
-                        bytes_transferred=batch.total_size
+                        bytes_transferred=batch.total_size - dedup_bytes
                     )
                     
                     self.logger.info(
@@ -595,7 +821,8 @@ class FS2S3Archiver:
                 except Exception as e:
                     self.logger.error(f"{thread_name}: Failed to create archive {tar_filename}: {str(e)}")
                     self.logger.exception(f"{thread_name}: Failed to create archive {tar_filename}: {str(e)}")
-                    self._update_stats(failed=len(batch.files)) #kyongki
+                    self._update_stats(failed=len(batch.files), category=stage) #kyongki
+                    self.tracer.instant('batch failed', batch=batch_id, stage=stage, error=str(e))
                     # Attempt to clean up partial files
                     for file in [tar_path, manifest_path]:
                         if os.path.exists(file):
@@ -615,24 +842,33 @@ class FS2S3Archiver:
     def _upload_to_s3(self, bucket, key, data, storageclass):
         """Upload data to S3"""
         try:
-            if isinstance(data, io.BytesIO):
-                self.s3_client.upload_fileobj(
-                    data,
-                    bucket,
-                    key.lstrip('/'),
-                    ExtraArgs={"StorageClass": storageclass}, 
-                    Config=self.transfer_config
-                )
+            if self.concurrency:
+                nbytes = data.getbuffer().nbytes if isinstance(data, io.BytesIO) else len(data)
+                self.concurrency.call('PUT', self._put_object, bucket, key, data, storageclass, nbytes=nbytes)
             else:
-                self.s3_client.put_object(
-                    Bucket=bucket,
-                    Key=key.lstrip('/'),
-                    Body=data,
-                    StorageClass=storageclass
-                )
+                self._put_object(bucket, key, data, storageclass)
         except Exception as e:
             raise Exception(f"Failed to upload to S3: {str(e)}") 
 
+    def _put_object(self, bucket, key, data, storageclass):
+        """Single upload attempt"""
+        if isinstance(data, io.BytesIO):
+            data.seek(0)
+            self.s3_client.upload_fileobj(
+                data,
+                bucket,
+                key.lstrip('/'),
+                ExtraArgs={"StorageClass": storageclass}, 
+                Config=self.transfer_config
+            )
+        else:
+            self.s3_client.put_object(
+                Bucket=bucket,
+                Key=key.lstrip('/'),
+                Body=data,
+                StorageClass=storageclass
+            )
+
 def main():
     parser = argparse.ArgumentParser(description='File System to S3 Archiver')
     parser.add_argument('--src-path', required=True, help='Source directory path')
@@ -648,6 +884,40 @@ def main():
     parser.add_argument('--input-file', help='Path to a file containing list of files to process')
     parser.add_argument('--tar-storageclass', default='STANDARD', help='Storage Class for TAR file')
     parser.add_argument('--manifest-storageclass', default='STANDARD', help='Storage Class for manifest file')
+    parser.add_argument('--adaptive-concurrency', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Adapt S3 request concurrency to throttling, using --num-threads as the ceiling')
+    parser.add_argument('--initial-concurrency', type=int, default=None,
+                      help='Starting S3 request concurrency with --adaptive-concurrency (default: --num-threads)')
+    parser.add_argument('--prefix-shards', type=int, default=0,
+                      help='Spread archives and manifests over N hashed sub-prefixes per date (0 = off)')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                      help='Serve live metrics on this HTTP port (/metrics, /metrics.json; 0 = off)')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                      help='Address the metrics endpoint listens on (0.0.0.0 for every interface)')
+    parser.add_argument('--metrics-snapshot', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Write a JSON metrics snapshot to the log directory every --metrics-interval seconds')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='Metrics sampling interval in seconds')
+    parser.add_argument('--dry-run', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Scan the source and report the batch plan, request cost and duration without archiving')
+    parser.add_argument('--save-plan', default=None,
+                      help='With --dry-run, save the batch plan to this file (.gz to compress)')
+    parser.add_argument('--plan-file', default=None, help='Execute a plan saved with --save-plan instead of scanning')
+    parser.add_argument('--plan-rates', type=parse_rates, default=None,
+                      help='Throughput assumed by the dry-run duration estimate: FILES_PER_SECOND,MB_PER_SECOND')
+    parser.add_argument('--manifest-format', choices=MANIFEST_FORMATS, default='csv',
+                      help='Manifest format: pipe-delimited csv, parquet (under manifests_parquet/, needs pyarrow) or both')
+    parser.add_argument('--bloom-filter', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Write a Bloom filter of the file names next to each manifest (under blooms/), for path-lookup.py')
+    parser.add_argument('--bloom-fp-rate', type=float, default=DEFAULT_FP_RATE,
+                      help='False positive rate of each Bloom filter; a path lookup reads about RATE x manifests in vain')
+    parser.add_argument('--dedup-index', default=None,
+                      help='SQLite dedup index: files whose content (md5, size) is already archived are not stored again')
+    parser.add_argument('--dedup-sync', type=lambda x: bool(util.strtobool(x)), default=True,
+                      help='Import new manifests under --dst-prefix into the dedup index before archiving')
+    parser.add_argument('--trace', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Write a Chrome/Perfetto trace of every stage, batch and thread to the log directory')
+    parser.add_argument('--trace-files', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Also trace every file (read, hash, tar); large for long runs')
     # StorageClass='STANDARD'|'REDUCED_REDUNDANCY'|'STANDARD_IA'|'ONEZONE_IA'|'INTELLIGENT_TIERING'|'GLACIER'|'DEEP_ARCHIVE'|'OUTPOSTS'|'GLACIER_IR'|'SNOW'|'EXPRESS_ONEZONE',
     
     args = parser.parse_args()
@@ -0,0 +1,111 @@
+"""
+Columnar manifests.
+
+With --manifest-format parquet (or both) the archivers write every manifest
+as a compressed Parquet file as well as (or instead of) the pipe-delimited
+CSV. It goes under a sibling prefix so the CSV table never picks it up:
+    {dst_prefix}/manifests/{date}/manifest_{batch_id}.csv
+    {dst_prefix}/manifests_parquet/{date}/manifest_{batch_id}.parquet
+
+Columns are typed (64-bit sizes and offsets, a timestamp for the archive
+date) and rows are sorted by filename, so the row group statistics let
+Athena and pyarrow skip row groups for filename filters and read only the
+columns a query uses.
+
+pyarrow is optional: it is only imported for the Parquet formats.
+"""
+import io
+import os
+from datetime import datetime
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+MANIFEST_FORMATS = ('csv', 'parquet', 'both')
+COMPRESSION = 'zstd'
+ROW_GROUP_SIZE = 128 * 1024
+# current_date as written by fss3/s3archiver, fsfs and s3s3
+DATE_FORMATS = ('%Y-%m-%d %H:%M:%S', '%Y-%m-%d', '%Y%m%d_%H%M%S')
+# Athena column names, as in search.py's CSV table
+COLUMNS = ('tarname', 'filename', 'current_date', 'size', 'start_byte', 'stop_byte', 'md5')
+
+
+def check_format(manifest_format):
+    """Validate --manifest-format; Parquet needs pyarrow"""
+    if manifest_format not in MANIFEST_FORMATS:
+        raise ValueError(f"--manifest-format must be one of {', '.join(MANIFEST_FORMATS)}")
+    if manifest_format != 'csv' and pa is None:
+        raise ValueError(f"--manifest-format {manifest_format} requires pyarrow (pip install pyarrow)")
+
+
+def writes_csv(manifest_format):
+    return manifest_format in ('csv', 'both')
+
+
+def writes_parquet(manifest_format):
+    return manifest_format in ('parquet', 'both')
+
+
+def parquet_path(manifest_path):
+    """Parquet key (or local path) for a CSV manifest key: manifests/ -> manifests_parquet/, .csv -> .parquet"""
+    head, sep, tail = manifest_path.rpartition('/manifests/')
+    if not sep:
+        head, sep, tail = manifest_path.rpartition(f'{os.sep}manifests{os.sep}')
+    if sep:
+        manifest_path = f"{head}{sep.replace('manifests', 'manifests_parquet')}{tail}"
+    return os.path.splitext(manifest_path)[0] + '.parquet'
+
+
+def schema():
+    return pa.schema([
+        ('tarname', pa.string()),
+        ('filename', pa.string()),
+        ('current_date', pa.timestamp('ms')),
+        ('size', pa.int64()),
+        ('start_byte', pa.int64()),
+        ('stop_byte', pa.int64()),
+        ('md5', pa.string()),
+    ])
+
+
+def _parse_date(value):
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def manifest_table(lines, delimiter='|'):
+    """Arrow table, sorted by filename, for manifest lines (header first) as the archivers build them"""
+    columns = {name: [] for name in COLUMNS}
+    dates = {}
+    for line in lines[1:]:
+        parts = line.split(delimiter)
+        if len(parts) < 7:
+            continue
+        # File names may contain the delimiter: the tar is first, the other fields last
+        date = parts[-5]
+        if date not in dates:
+            dates[date] = _parse_date(date)
+        columns['tarname'].append(parts[0])
+        columns['filename'].append(delimiter.join(parts[1:-5]))
+        columns['current_date'].append(dates[date])
+        columns['size'].append(int(parts[-4]))
+        columns['start_byte'].append(int(parts[-3]))
+        columns['stop_byte'].append(int(parts[-2]))
+        columns['md5'].append(parts[-1] or None)
+    table = pa.Table.from_pydict(columns, schema=schema())
+    return table.sort_by('filename')
+
+
+def to_parquet(lines, delimiter='|'):
+    """Parquet file contents (bytes) for manifest lines"""
+    buffer = io.BytesIO()
+    pq.write_table(manifest_table(lines, delimiter), buffer, compression=COMPRESSION,
+                   row_group_size=ROW_GROUP_SIZE)
+    return buffer.getvalue()
@@ -0,0 +1,163 @@
+"""
+Find the tar holding a file by its exact path, reading only a few manifests.
+
+The Bloom filter sidecars the archivers write with --bloom-filter
+(bloom_filter.py) are kept in a local cache and loaded into memory together.
+A path is checked against all of them at once; only the manifests whose
+filter matches, and manifests that have no filter (e.g. archived without
+--bloom-filter), are read and searched for the path.
+
+A sync downloads only the filters that are new or whose ETag changed and
+forgets those of deleted manifests.
+
+Usage:
+    python3 path-lookup.py --bucket my-bucket --prefix archive1 --path /data/x/y.jpg
+    python3 path-lookup.py --bucket my-bucket --prefix archive1 --paths-file paths.txt --sync false
+"""
+import argparse
+import concurrent.futures
+import logging
+import sqlite3
+import sys
+import time
+from distutils import util
+
+import boto3
+
+from bloom_filter import BloomSet, bloom_path
+from dedup_index import is_csv_manifest, manifest_rows_text
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blooms (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    data BLOB
+);
+CREATE TABLE IF NOT EXISTS manifests (
+    key TEXT PRIMARY KEY,
+    bloom_key TEXT
+);
+"""
+
+
+class PathLookup:
+    def __init__(self, args):
+        self.bucket = args.bucket
+        self.prefix = args.prefix.rstrip('/')
+        self.max_workers = args.max_workers
+
+        session = boto3.Session(profile_name=args.profile_name)
+        self.s3_client = session.client('s3', endpoint_url=args.endpoint)
+        self._conn = sqlite3.connect(args.cache)
+        self._conn.executescript(SCHEMA)
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler(sys.stderr)
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        self.logger.addHandler(handler)
+
+    def _list(self, prefix):
+        paginator = self.s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=prefix):
+            yield from page.get('Contents', [])
+
+    def sync(self):
+        """Refresh the manifest list and download new or changed filters"""
+        manifests = [obj['Key'] for obj in self._list(f"{self.prefix}/manifests/") if is_csv_manifest(obj['Key'])]
+        blooms = {obj['Key']: obj.get('ETag') for obj in self._list(f"{self.prefix}/blooms/")
+                  if obj['Key'].endswith('.bloom')}
+        known = dict(self._conn.execute('SELECT key, etag FROM blooms'))
+        changed = [key for key, etag in blooms.items() if known.get(key) != etag]
+
+        def fetch(key):
+            obj = self.s3_client.get_object(Bucket=self.bucket, Key=key)
+            return key, obj.get('ETag'), obj['Body'].read()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            with self._conn:
+                for key, etag, data in executor.map(fetch, changed):
+                    self._conn.execute('INSERT OR REPLACE INTO blooms VALUES (?, ?, ?)', (key, etag, data))
+        with self._conn:
+            self._conn.executemany('DELETE FROM blooms WHERE key = ?', [(k,) for k in known if k not in blooms])
+            self._conn.execute('DELETE FROM manifests')
+            self._conn.executemany('INSERT INTO manifests VALUES (?, ?)',
+                                   [(key, bloom_path(key) if bloom_path(key) in blooms else None) for key in manifests])
+        self.logger.info(f"Synced s3://{self.bucket}/{self.prefix}: {len(manifests):,} manifests, "
+                         f"{len(blooms):,} filters ({len(changed):,} downloaded)")
+
+    def load(self):
+        """Filters of the current manifests in memory, and the manifests without one"""
+        rows = self._conn.execute(
+            'SELECT m.key, b.data FROM manifests m LEFT JOIN blooms b ON b.key = m.bloom_key').fetchall()
+        filtered = [(key, data) for key, data in rows if data is not None]
+        self.unfiltered = [key for key, data in rows if data is None]
+        self.blooms = BloomSet([key for key, _ in filtered], [data for _, data in filtered])
+        self.logger.info(f"Loaded {len(filtered):,} filters ({self.blooms.nbytes():,} bytes), "
+                         f"{len(self.unfiltered):,} manifests without a filter")
+        # Every filter can give a false positive: the manifests a lookup reads in vain add up
+        self.logger.info(f"Expected manifest reads per path: {self.blooms.expected_false_matches():,.1f} "
+                         f"false positives + {len(self.unfiltered):,} without a filter")
+
+    def lookup(self, paths):
+        """Manifest lines of each path: {path: [line]}"""
+        start = time.perf_counter()
+        candidates = {path: set(self.blooms.matches(path) + self.unfiltered) for path in paths}
+        to_read = sorted({key for keys in candidates.values() for key in keys})
+        self.logger.info(f"{len(paths):,} paths matched {len(to_read):,} manifests in "
+                         f"{time.perf_counter() - start:.3f}s")
+
+        def read(key):
+            text = manifest_rows_text(self.s3_client.get_object(Bucket=self.bucket, Key=key)['Body'].read(), key)
+            return key, text.splitlines()[1:]
+
+        found = {path: [] for path in paths}
+        wanted = set(paths)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for key, lines in executor.map(read, to_read):
+                for line in lines:
+                    parts = line.split('|')
+                    # File names may contain the delimiter: the tar is first, the other fields last
+                    name = '|'.join(parts[1:-5])
+                    if len(parts) >= 7 and name in wanted and key in candidates[name]:
+                        found[name].append(line)
+        return found
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find the tars holding exact file paths using Bloom filter sidecars')
+    parser.add_argument('--bucket', required=True, help='S3 bucket holding the archives')
+    parser.add_argument('--prefix', required=True, help='Archive prefix (the --dst-prefix of the archiver)')
+    paths = parser.add_mutually_exclusive_group(required=True)
+    paths.add_argument('--path', action='append', help='File path as written in the manifests (repeatable)')
+    paths.add_argument('--paths-file', help='File with one path per line')
+    parser.add_argument('--cache', default='bloom-cache.db', help='Local SQLite cache of the filters')
+    parser.add_argument('--sync', type=util.strtobool, default=True, help='Download new filters before the lookup')
+    parser.add_argument('--max-workers', type=int, default=16, help='Parallel S3 GETs')
+    parser.add_argument('--profile-name', default=None, help='AWS profile name')
+    parser.add_argument('--endpoint', default=None, help='endpoint_url')
+    args = parser.parse_args()
+
+    if args.paths_file:
+        with open(args.paths_file) as f:
+            args.path = [line.rstrip('\n') for line in f if line.strip()]
+
+    lookup = PathLookup(args)
+    if args.sync:
+        lookup.sync()
+    lookup.load()
+    found = lookup.lookup(args.path)
+    print("tar_path|file_path|timestamp|file_size|start_position|end_position|md5_hash")
+    for path in args.path:
+        for line in found[path]:
+            print(line)
+        if not found[path]:
+            lookup.logger.info(f"Not found: {path}")
+    lookup.close()
+
+
+if __name__ == '__main__':
+    main()
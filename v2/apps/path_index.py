@@ -0,0 +1,467 @@
+"""
+Directory tree of the archived files.
+
+Built from the CSV manifests under {prefix}/manifests/ into a local SQLite
+file, it answers directory listings and subtree queries ("everything under
+/plant3/line2/2024-06/") without scanning manifests:
+
+    nodes       one row per directory: its path, parent and the files and bytes directly in it
+    node_tars   per directory and tar: files, bytes and the byte range they span in the tar
+    files       the manifest rows, stored under their directory
+    manifests   manifests imported (key, ETag), for incremental syncs
+    source      the bucket and prefix the index was built from
+
+A directory path is the file name up to and including its last '/', so
+directory path + name is the file name exactly as written in the manifest.
+The subtree of a directory is the range of paths starting with it, which
+the index on nodes.path answers directly; totals of a subtree are sums over
+that range.
+
+Subtree queries return rows ordered by tar and start byte, in the manifest
+format, ready for restore planning.
+
+The files are also indexed by md5 and by size, so finding every archived copy
+of a content is a point query, and size ranges are range scans. find()
+combines md5, size range, name substring and date range predicates.
+
+Repeated and incremental runs archive the same path many times. Every row
+keeps its archive time as seconds since the epoch, indexed per path, so the
+newest copy of a path, the copy current as of a date, or all its versions
+are a single index seek (versions()), returning the restore coordinates.
+
+Usage:
+    python3 path_index.py --index paths.db --bucket my-bucket --prefix archive1
+    python3 path_index.py --index paths.db --ls /plant3/line2/
+    python3 path_index.py --index paths.db --subtree /plant3/line2/2024-06/ --export restore.csv
+    python3 path_index.py --index paths.db --md5 9e107d9d372bb6826bd81d3542a419d6
+    python3 path_index.py --index paths.db --min-size 1000000000 --name .mp4 --start 2025-01-01 --end 2025-06-30
+    python3 path_index.py --index paths.db --file /plant3/line2/a.csv --as-of 2025-03-31
+"""
+import argparse
+import concurrent.futures
+import re
+import sqlite3
+import sys
+
+import boto3
+
+from dedup_index import is_csv_manifest, manifest_rows_text
+from trigram_index import NO_DATE, check_source, date_seconds, parse_date
+
+MANIFEST_HEADER = "tarname|filename|current_date|size|start_byte|stop_byte|md5"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS nodes (
+    id INTEGER PRIMARY KEY,
+    parent INTEGER,
+    path TEXT NOT NULL UNIQUE,
+    files INTEGER NOT NULL DEFAULT 0,
+    bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS nodes_parent ON nodes (parent);
+CREATE TABLE IF NOT EXISTS tars (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS files (
+    node_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    tar_id INTEGER NOT NULL,
+    start_byte INTEGER,
+    stop_byte INTEGER,
+    size INTEGER,
+    date TEXT,
+    md5 TEXT,
+    manifest_id INTEGER NOT NULL,
+    seconds INTEGER
+);
+CREATE INDEX IF NOT EXISTS files_node ON files (node_id, name);
+CREATE INDEX IF NOT EXISTS files_manifest ON files (manifest_id);
+CREATE INDEX IF NOT EXISTS files_md5 ON files (md5);
+CREATE INDEX IF NOT EXISTS files_size ON files (size);
+CREATE TABLE IF NOT EXISTS node_tars (
+    node_id INTEGER NOT NULL,
+    tar_id INTEGER NOT NULL,
+    files INTEGER,
+    bytes INTEGER,
+    first_byte INTEGER,
+    last_byte INTEGER,
+    PRIMARY KEY (node_id, tar_id)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS manifests (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    manifest_id INTEGER NOT NULL,
+    rows INTEGER
+);
+CREATE TABLE IF NOT EXISTS source (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL
+);
+"""
+
+
+def split_path(filename):
+    """(directory path, name): the directory keeps its trailing '/', '' for names without one"""
+    cut = filename.rfind('/') + 1
+    return filename[:cut], filename[cut:]
+
+
+def parent_path(path):
+    """Parent directory of a directory path; None for the root ''"""
+    if not path:
+        return None
+    return path[:path.rfind('/', 0, len(path) - 1) + 1]
+
+
+def subtree_range(path):
+    """(low, high) bounds of the paths in the subtree of a directory path"""
+    if not path:
+        return '', '\U0010ffff'
+    # '0' is the character after '/'
+    return path, path[:-1] + '0'
+
+
+def like_glob(pattern):
+    """
+    GLOB pattern for a LIKE pattern: case sensitive like Athena's LIKE, which SQLite's LIKE is not.
+    % and _ become * and ?; GLOB's own wildcards are escaped as one-character classes
+    """
+    special = {'*': '[*]', '?': '[?]', '[': '[[]', '%': '*', '_': '?'}
+    return ''.join(special.get(c, c) for c in pattern)
+
+
+def normalize_md5(value):
+    """Lowercase hex md5; ValueError for anything else"""
+    md5 = value.strip().lower()
+    if not re.fullmatch(r'[0-9a-f]{32}', md5):
+        raise ValueError(f"not an md5: {value}")
+    return md5
+
+
+def archive_seconds(value, cache):
+    """Archive time of a manifest date as seconds since the epoch, None if it does not parse"""
+    seconds = parse_date(value, cache)
+    return None if seconds == NO_DATE else int(seconds)
+
+
+def as_of_seconds(value):
+    """Seconds for an --as-of bound: YYYY-MM-DD (the whole day) or YYYY-MM-DD HH:MM:SS"""
+    if len(value) == 10:
+        return date_seconds(value, end_of_day=True)
+    seconds = parse_date(value, {})
+    if seconds == NO_DATE:
+        raise ValueError(f"not a date: {value}")
+    return int(seconds)
+
+
+def normalize_dir(path):
+    """Directory argument as a directory path: 'a/b' -> 'a/b/', '' stays the root"""
+    return path if not path or path.endswith('/') else path + '/'
+
+
+class PathIndex:
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.executescript(SCHEMA)
+        self._migrate()
+        self._node_ids = {}
+        self._tar_ids = {}
+
+    def _migrate(self):
+        """Add the archive time to index files created before it was kept"""
+        columns = [row[1] for row in self._conn.execute('PRAGMA table_info(files)')]
+        if 'seconds' not in columns:
+            dates = {}
+            with self._conn:
+                self._conn.execute('ALTER TABLE files ADD COLUMN seconds INTEGER')
+                self._conn.executemany('UPDATE files SET seconds = ? WHERE rowid = ?', (
+                    (archive_seconds(date, dates), rowid)
+                    for rowid, date in self._conn.execute('SELECT rowid, date FROM files').fetchall()))
+        self._conn.execute('CREATE INDEX IF NOT EXISTS files_version ON files (node_id, name, seconds)')
+
+    def _node_id(self, path):
+        """Id of a directory, created with its missing ancestors"""
+        if path in self._node_ids:
+            return self._node_ids[path]
+        row = self._conn.execute('SELECT id FROM nodes WHERE path = ?', (path,)).fetchone()
+        if row:
+            node_id = row[0]
+        else:
+            parent = parent_path(path)
+            parent_id = self._node_id(parent) if parent is not None else None
+            node_id = self._conn.execute('INSERT INTO nodes (parent, path) VALUES (?, ?)', (parent_id, path)).lastrowid
+        self._node_ids[path] = node_id
+        return node_id
+
+    def _tar_id(self, key):
+        if key not in self._tar_ids:
+            row = self._conn.execute('SELECT id FROM tars WHERE key = ?', (key,)).fetchone()
+            self._tar_ids[key] = row[0] if row else self._conn.execute(
+                'INSERT INTO tars (key) VALUES (?)', (key,)).lastrowid
+        return self._tar_ids[key]
+
+    def sync(self, s3_client, bucket, prefix, max_workers=16):
+        """Import the manifests under {prefix}/manifests/ that are new or changed; returns (manifests, rows, removed)"""
+        check_source(self._conn, bucket, prefix)
+        listed = {}
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix.rstrip('/')}/manifests/"):
+            for obj in page.get('Contents', []):
+                if is_csv_manifest(obj['Key']):
+                    listed[obj['Key']] = obj.get('ETag')
+        known = {key: (etag, manifest_id) for key, etag, manifest_id in
+                 self._conn.execute('SELECT key, etag, manifest_id FROM manifests')}
+        changed = [key for key, etag in listed.items() if key not in known or known[key][0] != etag]
+        removed = [key for key in known if key not in listed or key in changed]
+        next_id = (self._conn.execute('SELECT MAX(manifest_id) FROM manifests').fetchone()[0] or 0) + 1
+
+        def fetch(key):
+            obj = s3_client.get_object(Bucket=bucket, Key=key)
+            return key, obj.get('ETag'), manifest_rows_text(obj['Body'].read(), key)
+
+        touched = set()
+        with self._conn:
+            for key in removed:
+                manifest_id = known[key][1]
+                touched.update(n for n, in self._conn.execute(
+                    'SELECT DISTINCT node_id FROM files WHERE manifest_id = ?', (manifest_id,)))
+                self._conn.execute('DELETE FROM files WHERE manifest_id = ?', (manifest_id,))
+                self._conn.execute('DELETE FROM manifests WHERE key = ?', (key,))
+
+        rows = 0
+        dates = {}
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for manifest_id, (key, etag, text) in enumerate(executor.map(fetch, changed), next_id):
+                entries = []
+                for line in text.splitlines()[1:]:
+                    parts = line.split('|')
+                    if len(parts) < 7:
+                        continue
+                    # File names may contain the delimiter: the tar is first, the other fields last
+                    try:
+                        size, start, stop = int(parts[-4]), int(parts[-3]), int(parts[-2])
+                    except ValueError:
+                        continue
+                    directory, name = split_path('|'.join(parts[1:-5]))
+                    node_id = self._node_id(directory)
+                    touched.add(node_id)
+                    entries.append((node_id, name, self._tar_id(parts[0]), start, stop, size, parts[-5],
+                                    parts[-1].lower() or None, manifest_id, archive_seconds(parts[-5], dates)))
+                with self._conn:
+                    self._conn.executemany('INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', entries)
+                    self._conn.execute('INSERT INTO manifests VALUES (?, ?, ?, ?)', (key, etag, manifest_id, len(entries)))
+                rows += len(entries)
+
+        self._refresh(touched)
+        if self.logger:
+            self.logger.info(f"Path index {self.path}: {rows:,} rows from {len(changed):,} manifests, "
+                             f"{len(removed):,} manifests removed, {len(touched):,} directories updated")
+        return len(changed), rows, len(removed)
+
+    def _refresh(self, node_ids):
+        """Recompute the direct totals and tar ranges of directories from their files"""
+        node_ids = list(node_ids)
+        with self._conn:
+            for i in range(0, len(node_ids), 500):
+                chunk = node_ids[i:i + 500]
+                marks = ', '.join('?' * len(chunk))
+                self._conn.execute(f'DELETE FROM node_tars WHERE node_id IN ({marks})', chunk)
+                self._conn.execute(
+                    f'INSERT INTO node_tars SELECT node_id, tar_id, COUNT(*), SUM(size), MIN(start_byte), MAX(stop_byte) '
+                    f'FROM files WHERE node_id IN ({marks}) GROUP BY node_id, tar_id', chunk)
+                self._conn.execute(
+                    f'UPDATE nodes SET files = COALESCE((SELECT SUM(files) FROM node_tars WHERE node_id = nodes.id), 0), '
+                    f'bytes = COALESCE((SELECT SUM(bytes) FROM node_tars WHERE node_id = nodes.id), 0) '
+                    f'WHERE id IN ({marks})', chunk)
+
+    def list_dir(self, path, limit=1000):
+        """Subdirectories with their subtree totals, and up to limit files, of a directory"""
+        path = normalize_dir(path)
+        node = self._conn.execute('SELECT id FROM nodes WHERE path = ?', (path,)).fetchone()
+        if not node:
+            return [], []
+        directories = []
+        for child_path, in self._conn.execute('SELECT path FROM nodes WHERE parent = ? ORDER BY path', node):
+            files, size = self.totals(child_path)
+            # Directories whose manifests were all removed stay in the tree, empty
+            if files:
+                directories.append((child_path, files, size))
+        files = self._conn.execute(
+            'SELECT f.name, f.size, f.date, t.key, f.start_byte, f.stop_byte FROM files f '
+            'JOIN tars t ON t.id = f.tar_id WHERE f.node_id = ? ORDER BY f.name LIMIT ?', (node[0], limit)).fetchall()
+        return directories, files
+
+    def totals(self, path):
+        """(files, bytes) of a subtree"""
+        low, high = subtree_range(normalize_dir(path))
+        files, size = self._conn.execute(
+            'SELECT SUM(files), SUM(bytes) FROM nodes WHERE path >= ? AND path < ?', (low, high)).fetchone()
+        return files or 0, size or 0
+
+    def subtree_tars(self, path):
+        """Tars holding files of a subtree: [(tar, files, bytes, first_byte, last_byte)], by tar"""
+        low, high = subtree_range(normalize_dir(path))
+        return self._conn.execute(
+            'SELECT t.key, SUM(nt.files), SUM(nt.bytes), MIN(nt.first_byte), MAX(nt.last_byte) '
+            'FROM nodes n JOIN node_tars nt ON nt.node_id = n.id JOIN tars t ON t.id = nt.tar_id '
+            'WHERE n.path >= ? AND n.path < ? GROUP BY t.key ORDER BY t.key', (low, high)).fetchall()
+
+    def subtree_rows(self, path):
+        """Manifest lines of every file in a subtree, ordered by tar and start byte"""
+        low, high = subtree_range(normalize_dir(path))
+        cursor = self._conn.execute(
+            'SELECT t.key, n.path || f.name, f.date, f.size, f.start_byte, f.stop_byte, COALESCE(f.md5, \'\') '
+            'FROM nodes n JOIN files f ON f.node_id = n.id JOIN tars t ON t.id = f.tar_id '
+            'WHERE n.path >= ? AND n.path < ? ORDER BY t.key, f.start_byte', (low, high))
+        for row in cursor:
+            yield '|'.join(str(value) for value in row)
+
+    def find(self, md5=None, min_size=None, max_size=None, name=None, start_date=None, end_date=None):
+        """
+        Manifest rows (tar, filename, date, size, start_byte, stop_byte, md5) matching every given predicate,
+        by tar and start byte; name is a LIKE pattern matched anywhere in the file name, dates are YYYY-MM-DD
+        """
+        where, params = [], []
+        if md5:
+            where.append('f.md5 = ?')
+            params.append(normalize_md5(md5))
+        if min_size is not None:
+            where.append('f.size >= ?')
+            params.append(int(min_size))
+        if max_size is not None:
+            where.append('f.size <= ?')
+            params.append(int(max_size))
+        if name:
+            where.append('n.path || f.name GLOB ?')
+            params.append(like_glob(f'%{name}%'))
+        # Manifest dates come in each archiver's format; the range is checked on the parsed archive time
+        if start_date:
+            where.append('f.seconds >= ?')
+            params.append(date_seconds(start_date))
+        if end_date:
+            where.append('f.seconds <= ?')
+            params.append(date_seconds(end_date, end_of_day=True))
+        yield from self._conn.execute(
+            'SELECT t.key, n.path || f.name, f.date, f.size, f.start_byte, f.stop_byte, f.md5 '
+            'FROM files f JOIN nodes n ON n.id = f.node_id JOIN tars t ON t.id = f.tar_id '
+            f'{"WHERE " + " AND ".join(where) if where else ""} ORDER BY t.key, f.start_byte', params)
+
+    def versions(self, filename, as_of=None, latest=True):
+        """
+        Archived copies of a file as manifest rows (tar, filename, date, size, start_byte, stop_byte, md5),
+        newest first; only those archived up to as_of when given, only the newest one when latest
+        """
+        directory, name = split_path(filename)
+        node = self._conn.execute('SELECT id FROM nodes WHERE path = ?', (directory,)).fetchone()
+        if not node:
+            return []
+        where, params = 'f.node_id = ? AND f.name = ?', [node[0], name]
+        if as_of:
+            where += ' AND f.seconds <= ?'
+            params.append(as_of_seconds(as_of))
+        return self._conn.execute(
+            'SELECT t.key, ? || f.name, f.date, f.size, f.start_byte, f.stop_byte, COALESCE(f.md5, \'\') '
+            f'FROM files f JOIN tars t ON t.id = f.tar_id WHERE {where} '
+            f'ORDER BY f.seconds DESC, t.key DESC{" LIMIT 1" if latest else ""}',
+            [directory] + params).fetchall()
+
+    def close(self):
+        self._conn.close()
+
+
+def human_size(size):
+    for unit in ('B', 'KB', 'MB', 'GB', 'TB'):
+        if size < 1024 or unit == 'TB':
+            return f"{size:.1f}{unit}" if unit != 'B' else f"{size}B"
+        size /= 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query a directory tree of the archived files')
+    parser.add_argument('--index', required=True, help='SQLite index file (created if missing)')
+    parser.add_argument('--bucket', help='S3 bucket holding the archives; sync the index when given')
+    parser.add_argument('--prefix', help='Archive prefix (the --dst-prefix of the archiver)')
+    parser.add_argument('--max-workers', type=int, default=16, help='Parallel manifest downloads')
+    parser.add_argument('--ls', help='List a directory')
+    parser.add_argument('--subtree', help='Summarize a directory and everything under it')
+    parser.add_argument('--export', help='With --subtree or a content search, write the manifest rows (by tar and offset) to this file')
+    parser.add_argument('--md5', help='Find every archived copy of this content')
+    parser.add_argument('--min-size', type=int, default=None, help='Find files of at least this many bytes')
+    parser.add_argument('--max-size', type=int, default=None, help='Find files of at most this many bytes')
+    parser.add_argument('--name', help='With a content search, only file names containing this (LIKE pattern)')
+    parser.add_argument('--start', help='With a content search, first archive date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='With a content search, last archive date (YYYY-MM-DD)')
+    parser.add_argument('--file', action='append', default=[],
+                        help='Newest archived copy of this path (repeatable), as a manifest row for restore')
+    parser.add_argument('--files-from', help='Read --file paths from this file, one per line')
+    parser.add_argument('--as-of', help='With --file, the newest copy archived up to this date (YYYY-MM-DD [HH:MM:SS])')
+    parser.add_argument('--all-versions', action='store_true', help='With --file, every archived copy, newest first')
+    parser.add_argument('--profile-name', default=None, help='AWS profile name')
+    parser.add_argument('--endpoint', default=None, help='endpoint_url')
+    args = parser.parse_args()
+
+    index = PathIndex(args.index)
+    if args.bucket:
+        s3_client = boto3.Session(profile_name=args.profile_name).client('s3', endpoint_url=args.endpoint)
+        try:
+            manifests, rows, removed = index.sync(s3_client, args.bucket, args.prefix, args.max_workers)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"s3://{args.bucket}/{args.prefix}: {rows:,} rows from {manifests:,} manifests, {removed:,} removed")
+    if args.ls is not None:
+        directories, files = index.list_dir(args.ls)
+        for path, count, size in directories:
+            print(f"{path}\t{count:,} files\t{human_size(size)}")
+        for name, size, date, tar, start, stop in files:
+            print(f"{name}\t{human_size(size)}\t{date}\t{tar}:{start}-{stop}")
+    if args.subtree is not None:
+        files, size = index.totals(args.subtree)
+        tars = index.subtree_tars(args.subtree)
+        print(f"{normalize_dir(args.subtree)}: {files:,} files, {human_size(size)} in {len(tars):,} tars")
+        for tar, count, tar_bytes, first, last in tars:
+            print(f"  {tar}\t{count:,} files\t{human_size(tar_bytes)}\tbytes {first}-{last}")
+        if args.export:
+            with open(args.export, 'w') as f:
+                f.write(MANIFEST_HEADER + '\n')
+                for line in index.subtree_rows(args.subtree):
+                    f.write(line + '\n')
+            print(f"Wrote {args.export}", file=sys.stderr)
+    if args.md5 or args.min_size is not None or args.max_size is not None:
+        rows = index.find(args.md5, args.min_size, args.max_size, args.name, args.start, args.end)
+        out = open(args.export, 'w') if args.export else sys.stdout
+        out.write(MANIFEST_HEADER + '\n')
+        count = 0
+        for row in rows:
+            out.write('|'.join('' if value is None else str(value) for value in row) + '\n')
+            count += 1
+        if args.export:
+            out.close()
+        print(f"{count:,} files", file=sys.stderr)
+    files = list(args.file)
+    if args.files_from:
+        with open(args.files_from) as f:
+            files += [line.rstrip('\n') for line in f if line.strip()]
+    if files:
+        out = open(args.export, 'w') if args.export else sys.stdout
+        out.write(MANIFEST_HEADER + '\n')
+        missing = 0
+        for filename in files:
+            rows = index.versions(filename, args.as_of, latest=not args.all_versions)
+            missing += not rows
+            for row in rows:
+                out.write('|'.join(str(value) for value in row) + '\n')
+        if args.export:
+            out.close()
+        if missing:
+            print(f"{missing:,} of {len(files):,} files have no archived copy"
+                  f"{' as of ' + args.as_of if args.as_of else ''}", file=sys.stderr)
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
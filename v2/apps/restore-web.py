@@ -13,12 +13,14 @@ if 'selected_start_byte' not in st.session_state:
     st.session_state.selected_start_byte = None
 if 'selected_stop_byte' not in st.session_state:
     st.session_state.selected_stop_byte = None
+if 'selected_file_name' not in st.session_state:
+    st.session_state.selected_file_name = None
 if 'selected_index' not in st.session_state:
     st.session_state.selected_index = None
 if 'selected_bucket_name' not in st.session_state:
     st.session_state.selected_bucket_name= None
 
-def run_restore_script(bucket_name, key_name, start_byte, stop_byte):
+def run_restore_script(bucket_name, key_name, start_byte, stop_byte, file_name=None):
     program = "apps/restore.py"
     cmd = [
         'python3', program,
@@ -27,6 +29,9 @@ def run_restore_script(bucket_name, key_name, start_byte, stop_byte):
         '--start_byte', start_byte, 
         '--stop_byte', stop_byte
     ]
+    # Restore under the name in the manifest row: a deduplicated row points at a member archived under another name
+    if file_name:
+        cmd += ['--target_name', file_name]
     
     result = subprocess.run(cmd, capture_output=True, text=True)
     return result.stdout, result.stderr
@@ -37,11 +42,13 @@ bucket_name = st.text_input("Enter the bucket name:", value=st.session_state.sel
 tar_name = st.text_input("Enter the tar name (tar file):", value=st.session_state.selected_tar_name or "")
 start_byte = st.text_input("Enter the start byte:", value=st.session_state.selected_start_byte or "")
 stop_byte = st.text_input("Enter the stop byte:", value=st.session_state.selected_stop_byte or "")
+file_name = st.text_input("Enter the file name (optional; a deduplicated row is restored under this name):",
+                          value=st.session_state.selected_file_name or "")
 
 if st.button("Restore"):
     if tar_name and start_byte and stop_byte:
         st.info("Restoring... Please wait.")
-        stdout, stderr = run_restore_script(bucket_name, tar_name, start_byte, stop_byte)
+        stdout, stderr = run_restore_script(bucket_name, tar_name, start_byte, stop_byte, file_name)
         
         if stdout:
             st.success("Restore completed successfully!")
@@ -53,3 +60,40 @@ if st.button("Restore"):
             st.code(stderr)
     else:
         st.warning("Please fill in all the fields before restoring.")
+
+st.header("Bulk restore")
+
+def run_bulk_restore_script(bucket_name, input_file, max_gap):
+    program = "apps/bulk-restore.py"
+    cmd = [
+        'python3', program,
+        '--bucket', bucket_name,
+        '--input', input_file,
+        '--max-gap', max_gap
+    ]
+
+    result = subprocess.run(cmd, capture_output=True, text=True)
+    return result.stdout, result.stderr
+
+# Restore list: the search page CSV, the directory manifest from the browse page, or path_index.py --export
+restore_list = st.file_uploader("Restore list (search results or directory manifest)")
+max_gap = st.text_input("Merge files of a tar into one GET when at most this far apart:", value="1MB")
+
+if st.button("Restore all"):
+    if bucket_name and restore_list is not None:
+        input_file = os.path.join("restored_data", f".restore_list_{restore_list.name}")
+        os.makedirs("restored_data", exist_ok=True)
+        with open(input_file, 'wb') as f:
+            f.write(restore_list.getvalue())
+        with st.spinner("Restoring... Please wait."):
+            stdout, stderr = run_bulk_restore_script(bucket_name, input_file, max_gap)
+        os.remove(input_file)
+
+        # bulk-restore.py logs its progress and summary to stderr
+        if "Failed files: 0" in stderr:
+            st.success("Restore completed successfully!")
+        else:
+            st.error("Some files were not restored:")
+        st.code(stdout + stderr)
+    else:
+        st.warning("Please enter the bucket name and upload a restore list.")
@@ -1,47 +1,116 @@
+"""
+Restore a file from a byte range of a tar in S3.
+
+The range (start_byte..stop_byte of a manifest row) begins at the member's
+header. The response body is read as a tar stream: the headers give the data
+offset and length, and the data is copied to the output file in chunks while
+its MD5 is computed, so memory use does not depend on the file size.
+
+--target_name is the file name of the manifest row. A deduplicated row points
+at a member whose header holds the name the content was first archived as;
+that file is written under --target_name. Any other member keeps its own
+(relative) name, since the row has the source path of the same file.
+"""
 import boto3
 import tarfile
-import io
-import random
-import string
+import hashlib
+import os
+import sys
 import argparse
+from restore_plan import output_path
+
+CHUNK_SIZE = 64 * 1024
+
+
+def copy_member(tar, info, path, checksum=True):
+    """Copy the data of one member to path, through path.part; its MD5 (None without checksum)"""
+    md5 = hashlib.md5() if checksum else None
+    source = tar.extractfile(info)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    try:
+        with open(path + '.part', 'wb') as f:
+            while True:
+                chunk = source.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if md5:
+                    md5.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path + '.part')
+        raise
+    return md5.hexdigest() if md5 else None
+
+
+def restore_name(member_name, target_name=None):
+    """Name a member is restored under: target_name unless the row is the member's own file"""
+    if not target_name:
+        return member_name
+    row_name = target_name.replace('\\', '/')
+    if row_name == member_name or row_name.endswith('/' + member_name):
+        return member_name
+    return target_name
+
+
+def extract_members(fileobj, extract_path, md5=None, target_name=None):
+    """
+    Write the files of a tar stream under extract_path, the first under restore_name(target_name)
+    and checked against md5; their names
+    """
+    names = []
+    files = 0
+    with tarfile.open(fileobj=fileobj, mode='r|', bufsize=CHUNK_SIZE) as tar:
+        for info in tar:
+            name = restore_name(info.name, target_name) if info.isfile() and files == 0 else info.name
+            names.append(name)
+            path = output_path(extract_path, name)
+            if path is None:
+                raise ValueError(f"Refusing to restore {name} outside {extract_path}")
+            if info.isdir():
+                os.makedirs(path, exist_ok=True)
+                continue
+            if not info.isfile():
+                continue
+            files += 1
+            digest = copy_member(tar, info, path, checksum=bool(md5) and files == 1)
+            if digest and digest != md5.lower():
+                os.remove(path + '.part')
+                raise ValueError(f"MD5 mismatch for {name}: expected {md5.lower()}, got {digest}")
+            os.replace(path + '.part', path)
+            os.utime(path, (info.mtime, info.mtime))
+    return names
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bucket_name', help='s3 bucket name', action='store', required=True)
+    parser.add_argument('--key_name', help='tarfile in S3', action='store', required=True)
+    parser.add_argument('--start_byte', help='first block of subset file', action='store', required=True)
+    parser.add_argument('--stop_byte', help='last block of subset file', action='store', required=True)
+    parser.add_argument('--md5', help='md5 of the file in the manifest, checked while it is written', default=None)
+    parser.add_argument('--target_name', help='file name in the manifest, restored under this name', default=None)
+    args = parser.parse_args()
+
+    bucket_name = args.bucket_name
+    key_name = args.key_name
+    start_byte = int(args.start_byte)
+    stop_byte = int(args.stop_byte)
+    extract_path = "restored_data"
+
+    s3 = boto3.client('s3')
+    resp = s3.get_object(Bucket=bucket_name, Key=key_name, Range='bytes={}-{}'.format(start_byte, stop_byte))
+    body = resp['Body']
+    try:
+        names = extract_members(body, extract_path, args.md5, args.target_name)
+        print(names)
+    except (tarfile.TarError, ValueError) as e:
+        print(e)
+        print('Warning: \n \
+          Incomplete tar block or failed check, \n \
+          nothing was restored from this byte range')
+        sys.exit(1)
+    finally:
+        body.close()
 
-parser = argparse.ArgumentParser()
-parser.add_argument('--bucket_name', help='s3 bucket name', action='store', required=True)
-parser.add_argument('--key_name', help='tarfile in S3', action='store', required=True)
-parser.add_argument('--start_byte', help='first block of subset file', action='store', required=True)
-parser.add_argument('--stop_byte', help='last block of subset file', action='store', required=True)
-args = parser.parse_args()
-
-bucket_name = args.bucket_name
-key_name = args.key_name
-start_byte = int(args.start_byte)
-stop_byte = int(args.stop_byte)
-extract_path = "restored_data"
-
-# generate random 6 character
-def gen_rand_char():
-    char_set = string.ascii_uppercase + string.digits
-    return (''.join(random.sample(char_set*6, 6)))
-
-s3 = boto3.client('s3')
-resp = s3.get_object(Bucket=bucket_name, Key=key_name, Range='bytes={}-{}'.format(start_byte, stop_byte))
-content = resp['Body'].read()
-contentObj = io.BytesIO(content)
-tarf = tarfile.open(fileobj=contentObj)
-rand_char = str(gen_rand_char())
-
-temp_tarfile = 'temp_tarfile-%s.tar' % rand_char
-
-try:
-    names = tarf.getnames()
-    tarf.extractall(path=extract_path)
-    print(names)
-except Exception as e:
-    print(e)
-    print('Warning: \n \
-          Incompleted tar block is detected, \n \
-          but temp_tarfile is generated, \n \
-          you could recover some of files from temp_tarfile')
-    print('temp tarfile: %s' % temp_tarfile)
-    with open(temp_tarfile, 'wb') as outfile:
-        outfile.write(contentObj.getbuffer())
+if __name__ == '__main__':
+    main()
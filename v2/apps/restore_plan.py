@@ -0,0 +1,209 @@
+"""
+Restore planning: coalescing the byte ranges of many tar members into few GETs.
+
+Members of the same tar are sorted by offset, and neighbours are merged into
+one ranged GET when the gap between them is at most max_gap bytes: the gap is
+downloaded and skipped, which is cheaper than another request. A merged range
+stops growing at max_range bytes, so GETs stay parallel and a failed one is
+cheap to retry. Byte ranges do not address members of compressed tars
+(.tar.gz); those tars are read whole.
+
+When a restore needs much of a tar, its ranged GETs can cost more than reading
+the whole tar in parallel parts. choose_downloads compares, per tar,
+    ranged: bytes read by its GETs + GETs * request_cost
+    whole:  tar size + ceil(tar size / part_size) * request_cost
+with request_cost in bytes (what one request costs, expressed as bytes read),
+and keeps the cheaper one.
+
+Restore lists are read from any of:
+    manifest rows with their header (tarname|filename|current_date|size|start_byte|stop_byte|md5),
+        e.g. path_index.py --export, the browse page download, an archiver's manifest
+        or path-lookup.py output (tar_path|file_path|...)
+    search.py output (index|tarfile_location|filename|start_byte|stop_byte|date)
+    the search page's CSV download (index,tarfile_location,filename,start_bytes,stop_bytes,date)
+"""
+import csv
+import math
+import os
+import re
+from argparse import ArgumentTypeError
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+MANIFEST_HEADERS = ('tarname|', 'tarfile_name|', 'tar_path|')
+
+
+@dataclass(frozen=True)
+class Member:
+    tar: str
+    filename: str
+    start_byte: int
+    stop_byte: int
+    size: Optional[int] = None
+    md5: Optional[str] = None
+
+    @property
+    def length(self):
+        return self.stop_byte - self.start_byte + 1
+
+
+@dataclass
+class RangeGet:
+    """One GET: bytes start..stop (inclusive) of a tar, or the whole tar when stop is None"""
+    tar: str
+    start: int
+    stop: Optional[int]
+    members: List[Member] = field(default_factory=list)
+
+    @property
+    def length(self):
+        return None if self.stop is None else self.stop - self.start + 1
+
+    @property
+    def wanted(self):
+        """Bytes of the members, counting members at the same offset once"""
+        return sum(m.length for m in {m.start_byte: m for m in self.members}.values())
+
+
+def parse_size(size_str):
+    """Convert human readable size string (0, 512KB, 8MB, 1GB) to bytes"""
+    size_str = size_str.strip().upper()
+    units = {'B': 1, 'K': 1024, 'KB': 1024, 'M': 1024 ** 2, 'MB': 1024 ** 2,
+             'G': 1024 ** 3, 'GB': 1024 ** 3, 'T': 1024 ** 4, 'TB': 1024 ** 4}
+    if size_str.isdigit():
+        return int(size_str)
+    match = re.fullmatch(r'(\d+(?:\.\d+)?)\s*([A-Z]+)', size_str)
+    if not match or match.group(2) not in units:
+        raise ArgumentTypeError(f"Invalid size format: {size_str}. Example formats: 0, 512KB, 8MB, 1GB")
+    return int(float(match.group(1)) * units[match.group(2)])
+
+
+def output_path(output_dir, filename):
+    """Path under output_dir for an archived file name; None if it would escape output_dir"""
+    relative = os.path.normpath(filename.replace('\\', '/').lstrip('/'))
+    if relative in ('', '.') or relative == '..' or relative.startswith('../'):
+        return None
+    return os.path.join(output_dir, relative)
+
+
+def is_range_addressable(tar):
+    """Members of uncompressed tars can be fetched by byte range"""
+    return tar.endswith('.tar')
+
+
+def read_restore_list(path):
+    """Members listed in a restore list file, each once; ValueError if none of its lines is a member"""
+    with open(path, newline='') as f:
+        lines = [line.rstrip('\r\n') for line in f if line.strip()]
+    if not lines:
+        return []
+
+    members = []
+    header = lines[0].lower().replace(' ', '')
+    if header.startswith(MANIFEST_HEADERS):
+        for line in lines[1:]:
+            parts = line.split('|')
+            if len(parts) < 7:
+                continue
+            # File names may contain the delimiter: the tar is first, the other fields last
+            members.append(Member(parts[0], '|'.join(parts[1:-5]), int(parts[-3]), int(parts[-2]),
+                                  int(parts[-4]), parts[-1].lower() or None))
+    elif 'tarfile_location' in header and ',' in header:
+        for row in csv.DictReader(lines):
+            members.append(Member(row['tarfile_location'], row['filename'],
+                                  int(row['start_bytes']), int(row['stop_bytes'])))
+    else:
+        for line in lines:
+            parts = line.split('|')
+            # search.py prints a message instead of rows when nothing matched
+            if len(parts) < 6 or not parts[0].isdigit():
+                continue
+            members.append(Member(parts[1], '|'.join(parts[2:-3]), int(parts[-3]), int(parts[-2])))
+    if not members:
+        raise ValueError(f"{path}: no files to restore in {len(lines):,} lines; expected manifest rows with "
+                         f"their header, search.py output or the search page CSV")
+    # The same row can be listed twice, e.g. by a search during manifest compaction
+    return list(dict.fromkeys(members))
+
+
+def coalesce(members, max_gap=1024 * 1024, max_range=256 * 1024 * 1024):
+    """RangeGets covering all members, per tar by offset; neighbours closer than max_gap share a GET"""
+    by_tar = {}
+    for member in members:
+        by_tar.setdefault(member.tar, []).append(member)
+
+    gets = []
+    for tar in sorted(by_tar):
+        items = sorted(by_tar[tar], key=lambda m: (m.start_byte, m.filename))
+        if not is_range_addressable(tar):
+            gets.append(RangeGet(tar, 0, None, items))
+            continue
+        current = None
+        for member in items:
+            if (current is not None and member.start_byte - current.stop - 1 <= max_gap
+                    and max(current.stop, member.stop_byte) - current.start + 1 <= max_range):
+                current.stop = max(current.stop, member.stop_byte)
+                current.members.append(member)
+            else:
+                current = RangeGet(tar, member.start_byte, member.stop_byte, [member])
+                gets.append(current)
+    return gets
+
+
+@dataclass
+class TarChoice:
+    """Cost of reading one tar's members by ranged GETs or as a whole tar"""
+    tar: str
+    files: int
+    wanted: int
+    tar_size: int
+    ranged_gets: int
+    ranged_bytes: int
+    ranged_cost: int
+    whole_parts: int
+    whole_cost: int
+    whole: bool
+
+
+def whole_parts(tar_size, part_size):
+    return max(1, math.ceil(tar_size / part_size))
+
+
+def choose_downloads(gets, tar_sizes, request_cost=1024 * 1024, part_size=16 * 1024 * 1024, strategy='auto'):
+    """
+    Per tar of tar_sizes, keep its ranged GETs or replace them with one whole-tar GET (stop None),
+    whichever costs less ('ranged' and 'whole' force the choice); returns (gets, choices)
+    """
+    by_tar = {}
+    for get in gets:
+        by_tar.setdefault(get.tar, []).append(get)
+
+    planned = []
+    choices = []
+    for tar, tar_gets in by_tar.items():
+        if tar not in tar_sizes or any(get.stop is None for get in tar_gets):
+            planned.extend(tar_gets)
+            continue
+        tar_size = tar_sizes[tar]
+        ranged_bytes = sum(get.length for get in tar_gets)
+        parts = whole_parts(tar_size, part_size)
+        choice = TarChoice(
+            tar=tar,
+            files=sum(len(get.members) for get in tar_gets),
+            wanted=sum(get.wanted for get in tar_gets),
+            tar_size=tar_size,
+            ranged_gets=len(tar_gets),
+            ranged_bytes=ranged_bytes,
+            ranged_cost=ranged_bytes + len(tar_gets) * request_cost,
+            whole_parts=parts,
+            whole_cost=tar_size + parts * request_cost,
+            whole=False,
+        )
+        choice.whole = strategy == 'whole' or (strategy == 'auto' and choice.whole_cost < choice.ranged_cost)
+        choices.append(choice)
+        if choice.whole:
+            members = sorted((m for get in tar_gets for m in get.members), key=lambda m: (m.start_byte, m.filename))
+            planned.append(RangeGet(tar, 0, None, members))
+        else:
+            planned.extend(tar_gets)
+    return planned, choices
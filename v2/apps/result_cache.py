@@ -0,0 +1,109 @@
+"""
+In-memory cache of search results with TTL, LRU eviction and fingerprint revalidation.
+
+Every entry stores the fingerprint of the manifests it was computed from
+(search.manifest_fingerprint). A hit younger than `revalidate` seconds is
+returned as is; an older one is returned only if the fingerprint is still the
+same, so new or compacted manifests of the newest searched days invalidate it.
+Entries older than `ttl` seconds are dropped regardless, which also covers
+changes to older days.
+
+Used by search-service.py:
+    cache = ResultCache(max_entries=256, ttl=600, revalidate=30)
+    df = cache.get(key, lambda: manifest_fingerprint(...))
+    if df is None:
+        df = query(...)
+        cache.put(key, df, fingerprint)
+"""
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Hashable, Optional, Tuple
+
+import pandas as pd
+
+
+def search_key(
+    bucket_name: str,
+    prefix: str,
+    key_name: str,
+    start_date: str,
+    end_date: str,
+    manifest_format: str = 'csv',
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    md5: Optional[str] = None
+) -> Tuple:
+    """
+    Normalized cache key of a search; LIKE is case sensitive, so the value is kept as is
+    """
+    start = datetime.strptime(start_date, '%Y-%m-%d').date().isoformat()
+    end = datetime.strptime(end_date, '%Y-%m-%d').date().isoformat()
+    return (bucket_name, prefix.strip('/'), manifest_format, key_name, start, end,
+            None if min_size is None else int(min_size), None if max_size is None else int(max_size),
+            md5.strip().lower() if md5 else None)
+
+
+class ResultCache:
+    def __init__(self, max_entries: int = 256, ttl: float = 600, revalidate: float = 30,
+                 clock: Callable[[], float] = time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.revalidate = revalidate
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # key: [DataFrame, fingerprint, created, last validated]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, fingerprint: Callable[[], str]) -> Optional[pd.DataFrame]:
+        """
+        Cached result for key, or None; fingerprint() is called only when the entry is due for revalidation
+        """
+        now = self.clock()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or now - entry[2] > self.ttl:
+                self._entries.pop(key, None)
+                self.misses += 1
+                return None
+            if now - entry[3] <= self.revalidate:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+        # Listing the manifests is done outside the lock
+        current = fingerprint()
+        with self._lock:
+            if self._entries.get(key) is not entry:
+                self.misses += 1
+                return None
+            if current != entry[1]:
+                del self._entries[key]
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            entry[3] = self.clock()
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, df: pd.DataFrame, fingerprint: str) -> None:
+        now = self.clock()
+        with self._lock:
+            self._entries[key] = [df, fingerprint, now, now]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses,
+                    'invalidations': self.invalidations}
@@ -0,0 +1,216 @@
+"""
+Live metrics for archive runs.
+
+RunMetrics reads the archiver's RunStats (counters, per-stage busy time,
+idle time, in-flight uploads, failures by category and latency histograms).
+When enabled it serves them over HTTP (Prometheus text format on /metrics,
+JSON on /metrics.json) and/or writes a JSON snapshot file every interval.
+"""
+import json
+import os
+import resource
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+STAGES = ('scan', 'read', 'hash', 'tar', 'upload')
+
+
+def memory_rss_bytes():
+    """Resident set size of this process"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Peak RSS (KB on Linux) where /proc is not available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class RunMetrics:
+    def __init__(self, stats, collect=None, logger=None, port=0, snapshot_file=None, interval=10.0,
+                 host='127.0.0.1'):
+        """
+        stats: RunStats of the archiver
+        collect: optional callable returning extra gauges as a dict (queue_depth)
+        """
+        self.stats = stats
+        self.collect = collect or dict
+        self.logger = logger
+        self.port = port
+        self.host = host
+        self.snapshot_file = snapshot_file
+        self.interval = interval
+
+        self._lock = threading.Lock()
+        self._start = time.time()
+        self._last_sample = (time.monotonic(), 0, 0)
+        self._rates = {'files_per_second': 0.0, 'bytes_per_second': 0.0}
+
+        self._stop_event = threading.Event()
+        self._server = None
+        self._threads = []
+
+    @property
+    def enabled(self):
+        return bool(self.port or self.snapshot_file)
+
+    # Reading
+    def snapshot(self):
+        """Current metrics as a dict"""
+        counters = self.stats.totals()
+        gauges = self.collect()
+        busy = dict.fromkeys(STAGES, 0.0)
+        busy.update(self.stats.busy())
+        with self._lock:
+            rates = dict(self._rates)
+        uptime = time.time() - self._start
+        return {
+            'timestamp': time.time(),
+            'uptime_seconds': uptime,
+            'files_total': counters.get('files', 0),
+            'failed_files_total': counters.get('failed', 0),
+            'tars_total': counters.get('tars', 0),
+            'manifests_total': counters.get('manifests', 0),
+            'bytes_total': counters.get('bytes', 0),
+            'files_per_second': rates['files_per_second'],
+            'bytes_per_second': rates['bytes_per_second'],
+            'avg_files_per_second': counters.get('files', 0) / uptime if uptime else 0.0,
+            'avg_bytes_per_second': counters.get('bytes', 0) / uptime if uptime else 0.0,
+            'queue_depth': gauges.get('queue_depth', 0),
+            'uploads_in_flight': counters['uploads_in_flight'],
+            'stage_busy_seconds': busy,
+            'idle_seconds': self.stats.idle(),
+            'failures': self.stats.failures(),
+            'latency_seconds': self.stats.histograms(),
+            'memory_rss_bytes': memory_rss_bytes(),
+        }
+
+    def render_prometheus(self):
+        """Metrics in Prometheus text exposition format"""
+        snap = self.snapshot()
+        lines = []
+
+        def metric(name, kind, help_text, samples):
+            lines.append(f"# HELP sfas_{name} {help_text}")
+            lines.append(f"# TYPE sfas_{name} {kind}")
+            for labels, value in samples:
+                label_text = ','.join(f'{k}="{v}"' for k, v in labels.items())
+                lines.append(f"sfas_{name}{{{label_text}}} {value}" if label_text else f"sfas_{name} {value}")
+
+        metric('files_total', 'counter', 'Files archived', [({}, snap['files_total'])])
+        metric('failed_files_total', 'counter', 'Files that failed', [({}, snap['failed_files_total'])])
+        metric('tars_total', 'counter', 'Tar files created', [({}, snap['tars_total'])])
+        metric('manifests_total', 'counter', 'Manifest files created', [({}, snap['manifests_total'])])
+        metric('bytes_total', 'counter', 'Bytes archived', [({}, snap['bytes_total'])])
+        metric('files_per_second', 'gauge', 'Files per second over the last interval',
+               [({}, f"{snap['files_per_second']:.3f}")])
+        metric('bytes_per_second', 'gauge', 'Bytes per second over the last interval',
+               [({}, f"{snap['bytes_per_second']:.3f}")])
+        metric('queue_depth', 'gauge', 'Batches waiting for a consumer', [({}, snap['queue_depth'])])
+        metric('uploads_in_flight', 'gauge', 'Uploads in progress', [({}, snap['uploads_in_flight'])])
+        metric('stage_busy_seconds_total', 'counter', 'Time spent per stage, summed over threads',
+               [({'stage': k}, f"{v:.6f}") for k, v in snap['stage_busy_seconds'].items()])
+        metric('idle_seconds_total', 'counter', 'Time spent waiting on the batch queue, summed over threads',
+               [({'role': k}, f"{v:.6f}") for k, v in snap['idle_seconds'].items()])
+        metric('failures_total', 'counter', 'Failures by category',
+               [({'category': k}, v) for k, v in snap['failures'].items()])
+        metric('latency_seconds', 'summary', 'Latency per file or batch and stage (bucket upper bounds)',
+               [({'name': name, 'quantile': q}, f"{h[label]:.6f}")
+                for name, h in snap['latency_seconds'].items()
+                for label, q in (('p50', '0.5'), ('p90', '0.9'), ('p99', '0.99'))])
+        for name, h in snap['latency_seconds'].items():
+            lines.append(f'sfas_latency_seconds_sum{{name="{name}"}} {h["sum"]:.6f}')
+            lines.append(f'sfas_latency_seconds_count{{name="{name}"}} {h["count"]}')
+        metric('memory_rss_bytes', 'gauge', 'Resident memory of the archiver', [({}, snap['memory_rss_bytes'])])
+        metric('uptime_seconds', 'gauge', 'Seconds since the run started', [({}, f"{snap['uptime_seconds']:.3f}")])
+        return '\n'.join(lines) + '\n'
+
+    # Background work
+    def _sample(self):
+        counters = self.stats.totals()
+        now = time.monotonic()
+        last_time, last_files, last_bytes = self._last_sample
+        elapsed = now - last_time
+        if elapsed <= 0:
+            return
+        with self._lock:
+            self._rates = {
+                'files_per_second': (counters.get('files', 0) - last_files) / elapsed,
+                'bytes_per_second': (counters.get('bytes', 0) - last_bytes) / elapsed,
+            }
+        self._last_sample = (now, counters.get('files', 0), counters.get('bytes', 0))
+
+    def write_snapshot(self):
+        """Write the current snapshot atomically"""
+        if not self.snapshot_file:
+            return
+        tmp_file = f"{self.snapshot_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_file, self.snapshot_file)
+
+    def _sampler(self):
+        while not self._stop_event.wait(self.interval):
+            try:
+                self._sample()
+                self.write_snapshot()
+            except Exception as e:
+                if self.logger:
+                    self.logger.warning(f"Failed to update metrics snapshot: {str(e)}")
+
+    def start(self):
+        """Start the sampler and, if a port is set, the HTTP endpoint"""
+        if not self.enabled:
+            return
+        sampler = threading.Thread(target=self._sampler, name="metrics-sampler", daemon=True)
+        sampler.start()
+        self._threads.append(sampler)
+
+        if self.port:
+            self._server = ThreadingHTTPServer((self.host, self.port), _handler_for(self))
+            server_thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+            server_thread.start()
+            self._threads.append(server_thread)
+            if self.logger:
+                self.logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+        if self.snapshot_file and self.logger:
+            self.logger.info(f"Writing metrics snapshots to {self.snapshot_file}")
+
+    def stop(self):
+        """Write a final snapshot and stop background threads"""
+        if not self.enabled:
+            return
+        self._stop_event.set()
+        self._sample()
+        self.write_snapshot()
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+
+
+def _handler_for(metrics):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/metrics':
+                body = metrics.render_prometheus().encode('utf-8')
+                content_type = 'text/plain; version=0.0.4'
+            elif self.path == '/metrics.json':
+                body = json.dumps(metrics.snapshot()).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # Keep scrapes out of the archiver log
+            pass
+
+    return MetricsHandler
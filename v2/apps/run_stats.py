@@ -0,0 +1,183 @@
+"""
+Contention-free run statistics for the archivers.
+
+Every thread writes to its own shard, so the hot path never takes a lock;
+readers sum the shards. Latency histograms use power-of-two microsecond
+buckets, so recording an observation is a bit_length() and a list increment.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+HISTOGRAM_BUCKETS = 64  # int(seconds * 1e6).bit_length() stays below 64
+
+
+class _Shard:
+    __slots__ = ('files', 'failed', 'tars', 'manifests', 'bytes', 'uploads_in_flight',
+                 'busy', 'idle', 'failures', 'file_histograms', 'batch_histograms', 'thread_name')
+
+    def __init__(self, thread_name):
+        self.thread_name = thread_name
+        self.files = 0
+        self.failed = 0
+        self.tars = 0
+        self.manifests = 0
+        self.bytes = 0
+        self.uploads_in_flight = 0
+        self.busy = {}
+        self.idle = {}
+        self.failures = {}
+        self.file_histograms = {}
+        self.batch_histograms = {}
+
+
+class RunStats:
+    def __init__(self):
+        self._local = threading.local()
+        self._shards = []
+        self._register_lock = threading.Lock()
+
+    def shard(self):
+        """Counters owned by the calling thread"""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = _Shard(threading.current_thread().name)
+            with self._register_lock:
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    # Recording (lock free, calling thread's shard only)
+    def update(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0, category=None):
+        shard = self.shard()
+        shard.files += files
+        shard.tars += tars
+        shard.manifests += manifests
+        shard.bytes += bytes_transferred
+        if failed:
+            shard.failed += failed
+            category = category or 'other'
+            shard.failures[category] = shard.failures.get(category, 0) + failed
+
+    def add_failure(self, category, count=1):
+        """Count a failure that is not part of the failed-files total"""
+        failures = self.shard().failures
+        failures[category] = failures.get(category, 0) + count
+
+    def add_busy(self, stage, seconds):
+        """Busy time for one batch in a stage"""
+        shard = self.shard()
+        shard.busy[stage] = shard.busy.get(stage, 0.0) + seconds
+        self._observe(shard.batch_histograms, stage, seconds)
+
+    def add_idle(self, role, seconds):
+        idle = self.shard().idle
+        idle[role] = idle.get(role, 0.0) + seconds
+
+    def record_file(self, stage, seconds):
+        """Latency of one file in a stage"""
+        # Hot path: called several times per file, so _observe is inlined
+        try:
+            histogram = self._local.shard.file_histograms[stage]
+        except (AttributeError, KeyError):
+            histogram = self.shard().file_histograms.setdefault(stage, [0] * HISTOGRAM_BUCKETS + [0.0])
+        histogram[int(seconds * 1000000).bit_length()] += 1
+        histogram[HISTOGRAM_BUCKETS] += seconds
+
+    @staticmethod
+    def _observe(histograms, name, seconds):
+        try:
+            histogram = histograms[name]
+        except KeyError:
+            histogram = histograms[name] = [0] * HISTOGRAM_BUCKETS + [0.0]
+        histogram[int(seconds * 1000000).bit_length()] += 1
+        histogram[HISTOGRAM_BUCKETS] += seconds
+
+    @contextmanager
+    def upload(self):
+        """Track an upload as in flight and time it"""
+        shard = self.shard()
+        shard.uploads_in_flight += 1
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            shard.uploads_in_flight -= 1
+            self.add_busy('upload', time.perf_counter() - start)
+
+    # Reading (sums the shards)
+    def _snapshot_shards(self):
+        with self._register_lock:
+            return list(self._shards)
+
+    def totals(self):
+        totals = {'files': 0, 'failed': 0, 'tars': 0, 'manifests': 0, 'bytes': 0, 'uploads_in_flight': 0}
+        for shard in self._snapshot_shards():
+            totals['files'] += shard.files
+            totals['failed'] += shard.failed
+            totals['tars'] += shard.tars
+            totals['manifests'] += shard.manifests
+            totals['bytes'] += shard.bytes
+            totals['uploads_in_flight'] += shard.uploads_in_flight
+        return totals
+
+    def _merge(self, attr):
+        merged = {}
+        for shard in self._snapshot_shards():
+            for key, value in list(getattr(shard, attr).items()):
+                merged[key] = merged.get(key, 0) + value
+        return merged
+
+    def busy(self):
+        return self._merge('busy')
+
+    def idle(self):
+        return self._merge('idle')
+
+    def failures(self):
+        return self._merge('failures')
+
+    def histograms(self):
+        """Merged histograms as {name: {count, sum, mean, p50, p90, p99, max}} in seconds"""
+        merged = {}
+        for shard in self._snapshot_shards():
+            named = [(f"file.{stage}", h) for stage, h in list(shard.file_histograms.items())]
+            named += [(f"batch.{stage}", h) for stage, h in list(shard.batch_histograms.items())]
+            for name, histogram in named:
+                target = merged.setdefault(name, [0] * HISTOGRAM_BUCKETS + [0.0])
+                for i, value in enumerate(list(histogram)):
+                    target[i] += value
+        return {name: self._summarize(histogram) for name, histogram in sorted(merged.items())}
+
+    @staticmethod
+    def _summarize(histogram):
+        counts = histogram[:HISTOGRAM_BUCKETS]
+        total = sum(counts)
+        summary = {'count': total, 'sum': histogram[HISTOGRAM_BUCKETS]}
+        summary['mean'] = summary['sum'] / total if total else 0.0
+        for label, quantile in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99), ('max', 1.0)):
+            summary[label] = 0.0
+            if not total:
+                continue
+            threshold = quantile * total
+            cumulative = 0
+            for bucket, count in enumerate(counts):
+                cumulative += count
+                if count and cumulative >= threshold:
+                    # Upper bound of the bucket
+                    summary[label] = (1 << bucket) / 1e6
+                    break
+        return summary
+
+    def format_histograms(self):
+        """One summary line per histogram for the run log"""
+        lines = []
+        for name, h in self.histograms().items():
+            if h['count']:
+                lines.append(
+                    f"{name}: n={h['count']:,} mean={h['mean'] * 1000:.2f}ms "
+                    f"p50<={h['p50'] * 1000:.2f}ms p90<={h['p90'] * 1000:.2f}ms "
+                    f"p99<={h['p99'] * 1000:.2f}ms max<={h['max'] * 1000:.2f}ms"
+                )
+        return lines
@@ -0,0 +1,113 @@
+"""
+Timeline tracing for archive runs.
+
+Tracer records one span per stage, batch and thread (scan, queue wait, read,
+hash, tar, upload) and writes them in the Chrome trace event format, which
+chrome://tracing and https://ui.perfetto.dev open directly. Every thread
+appends to its own buffer, so tracing adds no lock to the hot path; the
+buffers are merged when the trace is written at the end of the run.
+
+Per-file spans are off by default: a long run would produce millions of
+them. Enable them (file_spans=True) when the per-batch view is not enough.
+"""
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+class Tracer:
+    def __init__(self, trace_file=None, file_spans=False):
+        self.trace_file = trace_file
+        self.file_spans = bool(trace_file and file_spans)
+        self._origin = time.perf_counter()
+        self._local = threading.local()
+        self._buffers = []
+        self._register_lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.trace_file)
+
+    def _buffer(self):
+        try:
+            return self._local.buffer
+        except AttributeError:
+            thread = threading.current_thread()
+            with self._register_lock:
+                tid = len(self._buffers) + 1
+                buffer = (tid, thread.name, [])
+                self._buffers.append(buffer)
+            self._local.buffer = buffer
+            return buffer
+
+    def complete(self, name, start, end, cat='stage', **args):
+        """Record a span from two time.perf_counter() readings"""
+        if not self.trace_file:
+            return
+        tid, _, events = self._buffer()
+        events.append({
+            'name': name,
+            'cat': cat,
+            'ph': 'X',
+            'ts': round((start - self._origin) * 1e6, 3),
+            'dur': round((end - start) * 1e6, 3),
+            'tid': tid,
+            'args': args,
+        })
+
+    def file_span(self, name, start, end, **args):
+        """Record a per-file span, if per-file spans are enabled"""
+        if self.file_spans:
+            self.complete(name, start, end, 'file', **args)
+
+    @contextmanager
+    def span(self, name, cat='stage', **args):
+        """Record the enclosed block as a span"""
+        if not self.trace_file:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.complete(name, start, time.perf_counter(), cat, **args)
+
+    def instant(self, name, cat='event', **args):
+        """Record a point in time (e.g. a failure)"""
+        if not self.trace_file:
+            return
+        tid, _, events = self._buffer()
+        events.append({
+            'name': name,
+            'cat': cat,
+            'ph': 'i',
+            's': 't',
+            'ts': round((time.perf_counter() - self._origin) * 1e6, 3),
+            'tid': tid,
+            'args': args,
+        })
+
+    def write(self):
+        """Write the trace file and return its path"""
+        if not self.trace_file:
+            return None
+        pid = os.getpid()
+        with self._register_lock:
+            buffers = list(self._buffers)
+        events = [{'name': 'process_name', 'ph': 'M', 'pid': pid, 'args': {'name': 'archiver'}}]
+        for tid, thread_name, thread_events in buffers:
+            events.append({'name': 'thread_name', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'name': thread_name}})
+            events.append({'name': 'thread_sort_index', 'ph': 'M', 'pid': pid, 'tid': tid,
+                           'args': {'sort_index': tid}})
+            for event in list(thread_events):
+                event['pid'] = pid
+                events.append(event)
+
+        tmp_file = f"{self.trace_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        os.replace(tmp_file, self.trace_file)
+        return self.trace_file
@@ -0,0 +1,246 @@
+"""
+Adaptive (AIMD) concurrency control for S3 GET and PUT requests.
+
+Each request type gets its own limiter. A limiter doubles its limit while
+throughput keeps improving (slow start), then grows additively while the limit
+is saturated and latency holds steady, and cuts the limit multiplicatively as
+soon as S3 answers with 503 SlowDown or the error rate / latency rises without
+any throughput gain.
+
+The archivers issue one request per worker thread, so their ceiling is the
+thread count and the limiter starts there: it only backs off under throttling
+and climbs back additively once S3 recovers.
+"""
+import random
+import threading
+import time
+
+THROTTLE_CODES = {
+    'SlowDown', 'Throttling', 'ThrottlingException', 'RequestLimitExceeded',
+    'TooManyRequests', 'TooManyRequestsException', 'ServiceUnavailable', '503'
+}
+
+# botocore operation name -> request type
+OPERATION_TYPES = {
+    'GetObject': 'GET',
+    'HeadObject': 'GET',
+    'PutObject': 'PUT',
+    'CreateMultipartUpload': 'PUT',
+    'UploadPart': 'PUT',
+    'CompleteMultipartUpload': 'PUT',
+}
+
+
+def is_throttle_error(exc):
+    """Check whether an exception is S3 request throttling"""
+    response = getattr(exc, 'response', None)
+    if isinstance(response, dict):
+        code = str(response.get('Error', {}).get('Code', ''))
+        status = response.get('ResponseMetadata', {}).get('HTTPStatusCode')
+        if code in THROTTLE_CODES or status == 503:
+            return True
+    # boto3 transfer errors (S3UploadFailedError) only keep the message text
+    message = str(exc)
+    return any(f"({code})" in message for code in THROTTLE_CODES)
+
+
+class AdaptiveLimiter:
+    """AIMD limiter for one request type"""
+
+    def __init__(self, name, initial, minimum=1, maximum=64, window=2.0,
+                 decrease_factor=0.5, max_error_rate=0.05, latency_tolerance=2.0):
+        self.name = name
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = min(max(initial, self.minimum), self.maximum)
+        self.window = window
+        self.decrease_factor = decrease_factor
+        self.max_error_rate = max_error_rate
+        self.latency_tolerance = latency_tolerance
+
+        self._cond = threading.Condition()
+        self._in_flight = 0
+        self._slow_start = True
+        self._best_throughput = 0.0
+        self._base_latency = None
+
+        # Totals for the final report
+        self.total_requests = 0
+        self.total_throttles = 0
+        self.total_errors = 0
+        self.increases = 0
+        self.decreases = 0
+        self._limit_seconds = 0.0
+        self._run_seconds = 0.0
+
+        self._reset_window(time.monotonic())
+
+    def _reset_window(self, now):
+        self._win_start = now
+        self._win_requests = 0
+        self._win_bytes = 0
+        self._win_latency = 0.0
+        self._win_throttles = 0
+        self._win_errors = 0
+        self._win_saturated = False
+
+    @property
+    def in_flight(self):
+        return self._in_flight
+
+    def acquire(self):
+        """Block until a request slot is free"""
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+            if self._in_flight >= self.limit:
+                self._win_saturated = True
+
+    def release(self, latency, nbytes=0, throttled=False, failed=False):
+        """Return a request slot and record its outcome"""
+        with self._cond:
+            self._in_flight -= 1
+            self.total_requests += 1
+            self._win_requests += 1
+            if throttled:
+                self._win_throttles += 1
+                self.total_throttles += 1
+            elif failed:
+                self._win_errors += 1
+                self.total_errors += 1
+            else:
+                self._win_bytes += nbytes
+                self._win_latency += latency
+            self._maybe_adjust(time.monotonic())
+            self._cond.notify_all()
+
+    def note_throttle(self):
+        """Record a throttled attempt that botocore retried internally"""
+        with self._cond:
+            self._win_throttles += 1
+            self.total_throttles += 1
+
+    def _maybe_adjust(self, now):
+        elapsed = now - self._win_start
+        if elapsed < self.window or self._win_requests == 0:
+            return
+
+        self._limit_seconds += self.limit * elapsed
+        self._run_seconds += elapsed
+
+        succeeded = self._win_requests - self._win_throttles - self._win_errors
+        error_rate = (self._win_throttles + self._win_errors) / self._win_requests
+        # Small objects are bound by request rate, tars by bandwidth
+        throughput = (self._win_bytes if self._win_bytes else succeeded) / elapsed
+        latency = self._win_latency / succeeded if succeeded else None
+        if latency is not None:
+            self._base_latency = latency if self._base_latency is None else min(self._base_latency, latency)
+
+        improved = throughput >= self._best_throughput * 1.05
+        latency_rising = (latency is not None and self._base_latency
+                          and latency > self._base_latency * self.latency_tolerance)
+
+        if self._win_throttles or error_rate > self.max_error_rate:
+            self._decrease(self.decrease_factor)
+        elif latency_rising and not improved:
+            self._decrease(0.9)
+        elif self._win_saturated:
+            if self._slow_start and not improved and self._best_throughput:
+                # Throughput stopped growing: leave slow start
+                self._slow_start = False
+            else:
+                new_limit = self.limit * 2 if self._slow_start else self.limit + 1
+                new_limit = min(new_limit, self.maximum)
+                if new_limit > self.limit:
+                    self.limit = new_limit
+                    self.increases += 1
+
+        self._best_throughput = max(self._best_throughput * 0.98, throughput)
+        self._reset_window(now)
+
+    def _decrease(self, factor):
+        new_limit = max(self.minimum, int(self.limit * factor))
+        self._slow_start = False
+        if new_limit < self.limit:
+            self.limit = new_limit
+            self.decreases += 1
+            # Throughput measured at the old limit is no longer reachable
+            self._best_throughput *= factor
+
+    def average_limit(self):
+        """Time-weighted average limit over the run"""
+        if self._run_seconds == 0:
+            return float(self.limit)
+        return self._limit_seconds / self._run_seconds
+
+    def summary(self):
+        return (
+            f"{self.name}: settled concurrency {self.limit} "
+            f"(avg {self.average_limit():.1f}, max {self.maximum}), "
+            f"requests {self.total_requests:,}, throttled {self.total_throttles:,}, "
+            f"errors {self.total_errors:,}, increases {self.increases}, decreases {self.decreases}"
+        )
+
+
+class AdaptiveConcurrency:
+    """Separate AIMD limiters for GETs and PUTs with throttle-aware retries"""
+
+    def __init__(self, maximum, initial=None, logger=None, max_retries=8,
+                 base_delay=0.2, max_delay=20.0):
+        if initial is None:
+            initial = maximum
+        self.limiters = {
+            'GET': AdaptiveLimiter('GET', initial, maximum=maximum),
+            'PUT': AdaptiveLimiter('PUT', initial, maximum=maximum),
+        }
+        self.logger = logger
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def attach(self, s3_client):
+        """Count throttled attempts that botocore retries on its own"""
+        s3_client.meta.events.register('needs-retry.s3', self._on_needs_retry)
+
+    def _on_needs_retry(self, response=None, operation=None, **kwargs):
+        if not response or operation is None:
+            return None
+        op = OPERATION_TYPES.get(operation.name)
+        if op is None:
+            return None
+        http_response, parsed = response
+        code = str(parsed.get('Error', {}).get('Code', '')) if isinstance(parsed, dict) else ''
+        if http_response.status_code == 503 or code in THROTTLE_CODES:
+            self.limiters[op].note_throttle()
+        # Leave the retry decision to botocore
+        return None
+
+    def call(self, op, fn, *args, nbytes=0, **kwargs):
+        """Run an S3 request under the limiter for op, retrying on throttling"""
+        limiter = self.limiters[op]
+        for attempt in range(self.max_retries + 1):
+            limiter.acquire()
+            start = time.monotonic()
+            throttled = failed = False
+            try:
+                return fn(*args, **kwargs)
+            except Exception as e:
+                throttled = is_throttle_error(e)
+                failed = not throttled
+                if failed or attempt == self.max_retries:
+                    raise
+            finally:
+                limiter.release(time.monotonic() - start, nbytes, throttled, failed)
+
+            # Full jitter backoff
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+            if self.logger:
+                self.logger.warning(
+                    f"{op} throttled by S3, retrying in {delay:.2f}s "
+                    f"(concurrency now {limiter.limit})"
+                )
+            time.sleep(delay)
+
+    def summary(self):
+        return [limiter.summary() for limiter in self.limiters.values() if limiter.total_requests]
@@ -20,6 +20,12 @@ import time
 import argparse
 from argparse import ArgumentTypeError
 from distutils import util
+from run_stats import RunStats
+from run_trace import Tracer
+from s3_concurrency import AdaptiveConcurrency
+from archive_plan import PlanRecorder, check_plan, iter_plan_batches, parse_rates
+from bloom_filter import DEFAULT_FP_RATE, bloom_path, check_bloom, to_bloom
+from manifest_parquet import MANIFEST_FORMATS, check_format, parquet_path, to_parquet, writes_csv, writes_parquet
 
 def parse_size(size_str: str) -> int:
     """Convert human readable size string to bytes"""
@@ -95,6 +101,13 @@ class FS2S3Archiver:
         self.num_threads = args.num_threads
         self.compress = args.compress
         self.profile_name = args.profile_name
+        self.adaptive_concurrency = args.adaptive_concurrency
+        self.initial_concurrency = args.initial_concurrency
+        self.dry_run = args.dry_run
+        self.plan_file = args.plan_file
+        self.manifest_format = args.manifest_format
+        self.bloom_filter = args.bloom_filter
+        self.bloom_fp_rate = args.bloom_fp_rate
 
         # Set S3 client
         self.s3_client = self._get_s3_client()
@@ -131,32 +144,63 @@ class FS2S3Archiver:
         self.logger.addHandler(file_handler)
         self.logger.addHandler(console_handler)
         
+        # Adaptive concurrency: --num-threads becomes the ceiling for S3 requests
+        self.concurrency = None
+        if self.adaptive_concurrency:
+            self.concurrency = AdaptiveConcurrency(self.num_threads, initial=self.initial_concurrency, logger=self.logger)
+            self.concurrency.attach(self.s3_client)
+            self.logger.info(f"Using adaptive concurrency: starting at {self.concurrency.limiters['GET'].limit}, "
+                             f"up to {self.num_threads} concurrent S3 requests")
+
         # Validate options
         if self.max_files_per_tar is not None and self.max_size_per_tar is not None:
             raise ValueError("Cannot specify both --max-files and --max-size")
-        if self.max_files_per_tar is None and self.max_size_per_tar is None:
+        if self.max_files_per_tar is None and self.max_size_per_tar is None and not self.plan_file:
             raise ValueError("Must specify either --max-files or --max-size")
+        if args.save_plan and not self.dry_run:
+            raise ValueError("--save-plan requires --dry-run")
+        check_format(self.manifest_format)
+        if self.bloom_filter:
+            check_bloom(self.bloom_fp_rate, self.manifest_format)
+        if self.plan_file:
+            plan = check_plan(self.plan_file, 's3archiver', self.src_prefix)
+            self.logger.info(f"Executing saved plan {self.plan_file} instead of scanning the source")
             
-        # Log the chosen strategy
-        if self.max_files_per_tar is not None:
+        # Log the chosen strategy (a saved plan already fixed its batches)
+        if self.plan_file:
+            self.logger.info(f"Using the plan's strategy: {plan['strategy']}")
+        elif self.max_files_per_tar is not None:
             self.logger.info(f"Using file count strategy: {self.max_files_per_tar} files per archive")
         else:
             self.logger.info(f"Using size strategy: {self.get_size_display(self.max_size_per_tar)} per archive")
         
         # Initialize locks and events
         self.tar_sequence_lock = threading.Lock()
-        self._stats_lock = threading.Lock()
         self.stop_event = threading.Event()
         
-        # Initialize counters
-        self._total_files = 0
-        self._failed_files = 0
-        self._total_tar_files = 0
-        self._total_manifest_files = 0
-        self._total_bytes_transferred = 0
+        # Initialize counters (per-thread shards, summed on read)
+        self.stats = RunStats()
         
         # Queue for producer/consumer pattern
         self.file_batch_queue = queue.Queue(maxsize=self.num_threads * 2)
+        if self.dry_run:
+            # Batches go to the planner instead of the consumers
+            if self.plan_file:
+                strategy = plan['strategy']
+            elif self.max_files_per_tar is not None:
+                strategy = f"{self.max_files_per_tar} files per archive"
+            else:
+                strategy = f"{self.get_size_display(self.max_size_per_tar)} per archive"
+            self.file_batch_queue = PlanRecorder(
+                's3archiver', self.src_prefix, f"s3://{self.dst_bucket}/{self.dst_prefix}",
+                strategy, self.num_threads, ('full_path', 'rel_path', 'size'), 'rel_path', 'full_path',
+                # Manifest rows name {dst_prefix}/archives/archive_20250101_120000_0001.tar
+                tar_key_length=len(self.dst_prefix) + 41,
+                multipart_threshold=self.transfer_config.multipart_threshold,
+                multipart_chunksize=self.transfer_config.multipart_chunksize,
+                save_plan=args.save_plan,
+                rates=args.plan_rates
+            )
         
         # Set timestamp for file naming
         self.current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -168,6 +212,11 @@ class FS2S3Archiver:
         # Set delimiter for manifest files
         self.DELIMITER = '|'
 
+        # Timeline trace (Chrome trace format), written when the run ends
+        self.tracer = Tracer(
+            os.path.join(self.directories['logs'], f'trace_{self.current_time}.json') if args.trace else None
+        )
+
     def _get_s3_client(self):
         """Initialize s3 client"""
         session = boto3.Session(profile_name=self.profile_name)
@@ -191,36 +240,34 @@ class FS2S3Archiver:
         return directories
 
     def _update_stats(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0):
-        """Thread-safe statistics update"""
-        with self._stats_lock:
-            self._total_files += files
-            self._failed_files += failed
-            self._total_tar_files += tars
-            self._total_manifest_files += manifests
-            self._total_bytes_transferred += bytes_transferred
+        """Lock-free statistics update"""
+        self.stats.update(files, failed, tars, manifests, bytes_transferred)
 
     @property
     def total_files(self):
-        return self._total_files
+        return self.stats.totals()['files']
     
     @property
     def failed_files(self):
-        return self._failed_files
+        return self.stats.totals()['failed']
     
     @property
     def total_tar_files(self):
-        return self._total_tar_files
+        return self.stats.totals()['tars']
     
     @property
     def total_manifest_files(self):
-        return self._total_manifest_files
+        return self.stats.totals()['manifests']
     
     @property
     def total_bytes_transferred(self):
-        return self._total_bytes_transferred
+        return self.stats.totals()['bytes']
 
     def start_processing(self):
         """Start the producer and consumer threads"""
+        if self.dry_run:
+            self._dry_run()
+            return
         self.start_time = time.time()
         
         # Create and start consumer threads first
@@ -237,7 +284,7 @@ class FS2S3Archiver:
             
         # Create and start producer thread
         self.producer_thread = threading.Thread(
-            target=self._file_list_producer,
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
             name="producer"
         )
         self.producer_thread.start()
@@ -246,6 +293,7 @@ class FS2S3Archiver:
         self.producer_thread.join()
         for consumer in self.consumer_threads:
             consumer.join()
+        trace_file = self.tracer.write()
 
         # Log final statistics
         elapsed_time = time.time() - self.start_time
@@ -262,8 +310,26 @@ class FS2S3Archiver:
         if elapsed_time > 0:
             transfer_rate = self.total_bytes_transferred / elapsed_time
             self.logger.info(f"Average transfer rate: {self.get_size_display(transfer_rate)}/s")
+        for line in self.stats.format_histograms():
+            self.logger.info(f"Latency {line}")
+        if self.concurrency:
+            for line in self.concurrency.summary():
+                self.logger.info(f"Adaptive concurrency {line}")
+        if trace_file:
+            self.logger.info(f"Trace written to {trace_file}")
         self.logger.info(f"####################################")
 
+    def _dry_run(self):
+        """Run the producer into the planner and report the plan"""
+        self.logger.info("Dry run: scanning the source without reading or uploading any file")
+        producer = threading.Thread(
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
+            name="producer"
+        )
+        producer.start()
+        producer.join()
+        self.file_batch_queue.complete(self.directories['logs'], self.current_time, self.logger)
+
     @staticmethod
     def get_size_display(size_in_bytes):
         """Convert bytes to human readable format"""
@@ -403,6 +469,36 @@ class FS2S3Archiver:
                 except queue.Full:
                     pass
 
+    def _plan_producer(self):
+        """Producer that replays the batches of a saved plan"""
+        try:
+            for batch_number, total_size, files in iter_plan_batches(self.plan_file, 's3archiver', self.src_prefix):
+                batch = FileBatch(
+                    files=[FileInfo(**f) for f in files],
+                    batch_number=batch_number,
+                    total_size=total_size,
+                    file_count=len(files)
+                )
+                while not self.stop_event.is_set():
+                    try:
+                        self.file_batch_queue.put(batch, timeout=5.0)
+                        break
+                    except queue.Full:
+                        time.sleep(1)
+                if self.stop_event.is_set():
+                    break
+        except Exception as e:
+            self.logger.error(f"Producer error: {str(e)}", exc_info=True)
+            self.stop_event.set()
+        # Send completion signals to consumers
+        for _ in range(self.num_threads):
+            while not self.stop_event.is_set():
+                try:
+                    self.file_batch_queue.put(None, timeout=5.0)
+                    break
+                except queue.Full:
+                    time.sleep(1)
+
     def _tar_creator_consumer(self):
         """Consumes file batches from the queue and creates tar archives"""
         thread_name = threading.current_thread().name
@@ -421,10 +517,13 @@ class FS2S3Archiver:
         while not self.stop_event.is_set():
             try:
                 # Get batch from queue
+                wait_start = time.perf_counter()
                 try:
                     batch = self.file_batch_queue.get(timeout=1.0)
                 except queue.Empty:
                     continue
+                finally:
+                    self.tracer.complete('queue wait', wait_start, time.perf_counter(), 'idle')
                 
                 if batch is None:
                     self.logger.debug(f"{thread_name}: Received completion signal")
@@ -451,6 +550,7 @@ class FS2S3Archiver:
                     )
                     
                     # First pass: calculate MD5 hashes
+                    stage_start = time.perf_counter()
                     file_hashes = {}
                     for file_info in batch.files:
                         try:
@@ -462,6 +562,8 @@ class FS2S3Archiver:
                             failed_files.append(file_info.full_path)
 
                     # Create tar file with positioning information
+                    self.tracer.complete('read+hash', stage_start, time.perf_counter(), batch=tar_filename, files=batch.file_count)
+                    stage_start = time.perf_counter()
 
                     #with tarfile.open(tar_path, 'w:'+ compress) as tar: ## kyongki
                     with tarfile.open(fileobj=tar_buffer, mode='w:'+ compress) as tar:
@@ -499,11 +601,23 @@ class FS2S3Archiver:
                     # Write manifest file
                     content_log = '\n'.join(manifest_content)
                     manifest_string_buffer.write(content_log)
+                    self.tracer.complete('tar', stage_start, time.perf_counter(), batch=tar_filename, files=batch.file_count)
 
                     # Upload files
-                    self._upload_with_retry(tar_buffer, tar_path)
-                    manifest_buffer = io.BytesIO(manifest_string_buffer.getvalue().encode())
-                    self._upload_with_retry(manifest_buffer, manifest_path)
+                    with self.tracer.span('upload tar', batch=tar_filename, key=tar_path):
+                        self._upload_with_retry(tar_buffer, tar_path)
+                    if writes_csv(self.manifest_format):
+                        manifest_buffer = io.BytesIO(manifest_string_buffer.getvalue().encode())
+                        with self.tracer.span('upload manifest', batch=tar_filename, key=manifest_path):
+                            self._upload_with_retry(manifest_buffer, manifest_path)
+                    if writes_parquet(self.manifest_format):
+                        parquet_key = parquet_path(manifest_path)
+                        with self.tracer.span('upload manifest', batch=tar_filename, key=parquet_key):
+                            self._upload_with_retry(io.BytesIO(to_parquet(manifest_content, self.DELIMITER)), parquet_key)
+                    if self.bloom_filter:
+                        bloom_key = bloom_path(manifest_path)
+                        with self.tracer.span('upload manifest', batch=tar_filename, key=bloom_key):
+                            self._upload_with_retry(io.BytesIO(to_bloom(manifest_content, self.DELIMITER, self.bloom_fp_rate)), bloom_key)
                     
                     # Update statistics
                     self._update_stats(
@@ -522,6 +636,7 @@ class FS2S3Archiver:
                 except Exception as e:
                     self.logger.error(f"{thread_name}: Failed to create archive {tar_filename}: {str(e)}")
                     self.logger.exception(f"{thread_name}: Failed to create archive {tar_filename}: {str(e)}")
+                    self.tracer.instant('batch failed', batch=tar_filename, error=str(e))
                     # Attempt to clean up partial files
                     for file in [tar_path, manifest_path]:
                         if os.path.exists(file):
@@ -540,6 +655,16 @@ class FS2S3Archiver:
 
     def _upload_with_retry(self, file_obj, s3_key, max_retries=5):
         """Upload to S3 with retry logic"""
+        if self.concurrency:
+            # Throttling backoff is handled by the adaptive controller
+            try:
+                self.concurrency.call('PUT', self._upload_once, file_obj, s3_key,
+                                      nbytes=file_obj.getbuffer().nbytes)
+            except Exception:
+                self.logger.error(f"Failed to upload {s3_key}")
+                self.failed_files += 1
+                raise
+            return
         for attempt in range(max_retries):
             try:
                 file_obj.seek(0)
@@ -560,6 +685,16 @@ class FS2S3Archiver:
                     self.failed_files += 1
                     raise
 
+    def _upload_once(self, file_obj, s3_key):
+        """Single upload attempt"""
+        file_obj.seek(0)
+        self.s3_client.upload_fileobj(
+            file_obj,
+            self.dst_bucket,
+            s3_key,
+            Config=self.transfer_config
+        )
+
 
 def main():
     parser = argparse.ArgumentParser(description='Archive files from source to destination')
@@ -567,7 +702,7 @@ def main():
     parser.add_argument('--dst-prefix', required=True, help='Destination S3 prefix ')
     parser.add_argument('--dst-bucket', required=True, help='Destination S3 bucket')
     
-    group = parser.add_mutually_exclusive_group(required=True)
+    group = parser.add_mutually_exclusive_group()
     group.add_argument('--max-files', type=int, help='Maximum files per archive')
     group.add_argument(
         '--max-size', 
@@ -578,8 +713,29 @@ def main():
     parser.add_argument('--num-threads', type=int, default=4, help='Number of consumer threads')
     parser.add_argument('--compress', type=util.strtobool, default=False, help='GZip Compress for tarfile, True or False')
     parser.add_argument('--profile-name', required=False, help='aws cli profile')
+    parser.add_argument('--adaptive-concurrency', type=lambda x: bool(util.strtobool(x)), default=False,
+                        help='Adapt S3 request concurrency to throttling, using --num-threads as the ceiling')
+    parser.add_argument('--initial-concurrency', type=int, default=None,
+                        help='Starting S3 request concurrency with --adaptive-concurrency (default: --num-threads)')
+    parser.add_argument('--manifest-format', choices=MANIFEST_FORMATS, default='csv',
+                        help='Manifest format: pipe-delimited csv, parquet (under manifests_parquet/, needs pyarrow) or both')
+    parser.add_argument('--bloom-filter', type=util.strtobool, default=False,
+                        help='Write a Bloom filter of the file names next to each manifest (under blooms/), for path-lookup.py')
+    parser.add_argument('--bloom-fp-rate', type=float, default=DEFAULT_FP_RATE,
+                        help='False positive rate of each Bloom filter; a path lookup reads about RATE x manifests in vain')
+    parser.add_argument('--dry-run', type=util.strtobool, default=False,
+                        help='Scan the source and report the batch plan, request cost and duration without archiving')
+    parser.add_argument('--save-plan', default=None,
+                        help='With --dry-run, save the batch plan to this file (.gz to compress)')
+    parser.add_argument('--plan-file', default=None, help='Execute a plan saved with --save-plan instead of scanning')
+    parser.add_argument('--plan-rates', type=parse_rates, default=None,
+                        help='Throughput assumed by the dry-run duration estimate: FILES_PER_SECOND,MB_PER_SECOND')
+    parser.add_argument('--trace', type=util.strtobool, default=False,
+                        help='Write a Chrome/Perfetto trace of every stage, batch and thread to the log directory')
     
     args = parser.parse_args()
+    if args.max_files is None and args.max_size is None and not args.plan_file:
+        parser.error("one of the arguments --max-files --max-size is required")
     
     archiver = FS2S3Archiver(args)
     archiver.start_processing()
@@ -17,6 +17,14 @@ import time
 import argparse
 from argparse import ArgumentTypeError
 from distutils import util
+from run_stats import RunStats
+from s3_concurrency import AdaptiveConcurrency
+from archive_layout import archive_keys
+from run_metrics import RunMetrics
+from run_trace import Tracer
+from archive_plan import PlanRecorder, check_plan, iter_plan_batches, parse_rates
+from bloom_filter import DEFAULT_FP_RATE, bloom_path, check_bloom, to_bloom
+from manifest_parquet import MANIFEST_FORMATS, check_format, parquet_path, to_parquet, writes_csv, writes_parquet
 
 def parse_size(size_str: str) -> int:
     """Convert human readable size string to bytes"""
@@ -91,8 +99,17 @@ class S3toS3Archiver:
         self.compress = args.compress
         self.current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
         self.profile_name = args.profile_name
+        self.endpoint = args.endpoint
         self.tar_storageclass = args.tar_storageclass
         self.manifest_storageclass = args.manifest_storageclass
+        self.adaptive_concurrency = args.adaptive_concurrency
+        self.initial_concurrency = args.initial_concurrency
+        self.prefix_shards = args.prefix_shards
+        self.dry_run = args.dry_run
+        self.plan_file = args.plan_file
+        self.manifest_format = args.manifest_format
+        self.bloom_filter = args.bloom_filter
+        self.bloom_fp_rate = args.bloom_fp_rate
 
         # Configure S3 client with higher max pool connections
         config = Config(
@@ -104,7 +121,7 @@ class S3toS3Archiver:
         
         # Set S3 client
         session = boto3.Session(profile_name=self.profile_name)
-        self.s3_client = session.client('s3', config=config)
+        self.s3_client = session.client('s3', config=config, endpoint_url=self.endpoint)
         
         self.transfer_config = TransferConfig(
             max_concurrency=256,
@@ -140,32 +157,68 @@ class S3toS3Archiver:
         self.logger.addHandler(file_handler)
         self.logger.addHandler(console_handler)
         
+        # Adaptive concurrency: --num-threads becomes the ceiling for S3 requests
+        self.concurrency = None
+        if self.adaptive_concurrency:
+            self.concurrency = AdaptiveConcurrency(self.num_threads, initial=self.initial_concurrency, logger=self.logger)
+            self.concurrency.attach(self.s3_client)
+            self.logger.info(f"Using adaptive concurrency: starting at {self.concurrency.limiters['GET'].limit}, "
+                             f"up to {self.num_threads} concurrent S3 requests")
+
         # Validate options
         if self.max_files_per_tar is not None and self.max_size_per_tar is not None:
             raise ValueError("Cannot specify both --max-files and --max-size")
-        if self.max_files_per_tar is None and self.max_size_per_tar is None:
+        if self.max_files_per_tar is None and self.max_size_per_tar is None and not self.plan_file:
             raise ValueError("Must specify either --max-files or --max-size")
+        if self.prefix_shards < 0:
+            raise ValueError("--prefix-shards must be 0 or greater")
+        if args.save_plan and not self.dry_run:
+            raise ValueError("--save-plan requires --dry-run")
+        check_format(self.manifest_format)
+        if self.bloom_filter:
+            check_bloom(self.bloom_fp_rate, self.manifest_format)
+        if self.plan_file:
+            plan = check_plan(self.plan_file, 's3s3', f"s3://{self.src_bucket}/{self.src_prefix}")
+            self.logger.info(f"Executing saved plan {self.plan_file} instead of listing the source")
             
-        # Log the chosen strategy
-        if self.max_files_per_tar is not None:
+        # Log the chosen strategy (a saved plan already fixed its batches)
+        if self.plan_file:
+            self.logger.info(f"Using the plan's strategy: {plan['strategy']}")
+        elif self.max_files_per_tar is not None:
             self.logger.info(f"Using file count strategy: {self.max_files_per_tar} files per archive")
         else:
             self.logger.info(f"Using size strategy: {self.get_size_display(self.max_size_per_tar)} per archive")
         
         # Initialize locks and events
         self.tar_sequence_lock = threading.Lock()
-        self._stats_lock = threading.Lock()
         self.stop_event = threading.Event()
         
-        # Initialize counters
-        self._total_files = 0
-        self._failed_files = 0
-        self._total_tar_files = 0
-        self._total_manifest_files = 0
-        self._total_bytes_transferred = 0
+        # Initialize counters (per-thread shards, summed on read)
+        self.stats = RunStats()
         
         # Queue for producer/consumer pattern
         self.file_batch_queue = queue.Queue(maxsize=self.num_threads * 2)
+        if self.dry_run:
+            # Batches go to the planner instead of the consumers
+            if self.plan_file:
+                strategy = plan['strategy']
+            elif self.max_files_per_tar is not None:
+                strategy = f"{self.max_files_per_tar} files per archive"
+            else:
+                strategy = f"{self.get_size_display(self.max_size_per_tar)} per archive"
+            self.file_batch_queue = PlanRecorder(
+                's3s3', f"s3://{self.src_bucket}/{self.src_prefix}", f"s3://{self.dst_bucket}/{self.dst_prefix}",
+                strategy, self.num_threads, ('bucket', 'key', 'size'), 'key', 'key',
+                dst_prefix=self.dst_prefix,
+                tar_storageclass=self.tar_storageclass,
+                manifest_storageclass=self.manifest_storageclass,
+                multipart_threshold=self.transfer_config.multipart_threshold,
+                multipart_chunksize=self.transfer_config.multipart_chunksize,
+                source_gets=True,
+                disk_mtime=False,
+                save_plan=args.save_plan,
+                rates=args.plan_rates
+            )
         
         # Set timestamp for file naming
         #self.current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
@@ -177,6 +230,24 @@ class S3toS3Archiver:
         # Set delimiter for manifest files
         self.DELIMITER = '|'
 
+        # Live metrics (HTTP endpoint and/or periodic JSON snapshot)
+        self.metrics = RunMetrics(
+            self.stats,
+            self._collect_metrics,
+            logger=self.logger,
+            port=args.metrics_port,
+            snapshot_file=os.path.join(self.directories['logs'], f'metrics_{self.current_time}.json') if args.metrics_snapshot else None,
+            interval=args.metrics_interval,
+            host=args.metrics_host
+        )
+
+        # Timeline trace (Chrome trace format), written when the run ends
+        self.tracer = Tracer(
+            os.path.join(self.directories['logs'], f'trace_{self.current_time}.json') if args.trace else None,
+            file_spans=args.trace_files
+        )
+        self._scan_mark = None
+
     def _create_directories(self):
         """Create necessary directories for archives, manifests, and logs"""
         directories = {
@@ -209,7 +280,13 @@ class S3toS3Archiver:
             total_size=current_size,
             file_count=len(batch_files)
         )
+        put_start = time.perf_counter()
+        self.stats.add_busy('scan', put_start - self._scan_mark)
+        self.tracer.complete('scan', self._scan_mark, put_start, batch=batch_number, files=len(batch_files))
         self.file_batch_queue.put(batch)
+        self._scan_mark = time.perf_counter()
+        self.stats.add_idle('producer', self._scan_mark - put_start)
+        self.tracer.complete('queue put', put_start, self._scan_mark, 'idle', batch=batch_number)
 
     def _file_list_producer(self):
         """List objects from source S3 bucket and create batches"""
@@ -217,6 +294,7 @@ class S3toS3Archiver:
             batch_files = []
             current_size = 0
             batch_number = 1
+            self._scan_mark = time.perf_counter()
             
             paginator = self.s3_client.get_paginator('list_objects_v2')
             
@@ -260,18 +338,62 @@ class S3toS3Archiver:
             for _ in range(self.num_threads):
                 self.file_batch_queue.put(None)
 
+    def _plan_producer(self):
+        """Producer that replays the batches of a saved plan"""
+        try:
+            for batch_number, total_size, files in iter_plan_batches(
+                    self.plan_file, 's3s3', f"s3://{self.src_bucket}/{self.src_prefix}"):
+                if self.stop_event.is_set():
+                    return
+                self.file_batch_queue.put(FileBatch(
+                    files=[FileInfo(**f) for f in files],
+                    batch_number=batch_number,
+                    total_size=total_size,
+                    file_count=len(files)
+                ))
+        except Exception as e:
+            self.logger.error(f"Error in producer: {str(e)}")
+            self.stop_event.set()
+        finally:
+            # Signal consumers to stop
+            for _ in range(self.num_threads):
+                self.file_batch_queue.put(None)
+
     def _download_s3_object(self, file_info):
         """Download single object from S3 to memory"""
         try:
-            response = self.s3_client.get_object(
-                Bucket=file_info.bucket,
-                Key=file_info.key
-            )
-            return response['Body'].read()
+            if self.concurrency:
+                return self.concurrency.call('GET', self._get_object, file_info, nbytes=file_info.size)
+            return self._get_object(file_info)
         except Exception as e:
             self.logger.error(f"Failed to download {file_info.key}: {str(e)}")
             return None
 
+    def _get_object(self, file_info):
+        """Single download attempt"""
+        response = self.s3_client.get_object(
+            Bucket=file_info.bucket,
+            Key=file_info.key
+        )
+        return response['Body'].read()
+
+    def _put(self, fn, nbytes, **kwargs):
+        """Run an upload call, under the PUT limiter when adaptive concurrency is on"""
+        if self.concurrency:
+            return self.concurrency.call('PUT', fn, nbytes=nbytes, **kwargs)
+        return fn(**kwargs)
+
+    def _upload_tar(self, tar_buffer, tar_key, t_sc):
+        """Single tar upload attempt"""
+        tar_buffer.seek(0)
+        self.s3_client.upload_fileobj(
+            tar_buffer,
+            self.dst_bucket,
+            tar_key,
+            ExtraArgs = { 'StorageClass': t_sc}, 
+            Config=self.transfer_config
+        )
+
     def _create_manifest_entry(self, file_info, content, tar_key, start_pos, end_pos):
         """Create a manifest entry for a file with position information"""
         hash_enabled = True
@@ -300,20 +422,32 @@ class S3toS3Archiver:
 
     def _tar_creator_consumer(self):
         """Consumer thread that creates tar archives from S3 objects"""
+        stats = self.stats
+        tracer = self.tracer
         while not self.stop_event.is_set():
+            wait_start = time.perf_counter()
             batch = self.file_batch_queue.get()
+            wait_end = time.perf_counter()
+            self.stats.add_idle('consumer', wait_end - wait_start)
+            tracer.complete('queue wait', wait_start, wait_end, 'idle')
             if batch is None:
                 break
 
-            # Generate tar filename
+            # Generate tar and manifest keys
             mid_prefix = self.current_time.split('_')[0]
-            tar_key = f"{self.dst_prefix}/archives/{mid_prefix}/archive_{self.current_time}_{batch.batch_number}.tar"
-            if self.compress:
-                tar_key += ".gz"
+            tar_key, manifest_key = archive_keys(
+                self.dst_prefix,
+                mid_prefix,
+                f"{self.current_time}_{batch.batch_number}",
+                '.tar.gz' if self.compress else '.tar',
+                self.prefix_shards
+            )
 
             tar_buffer = io.BytesIO()
             manifest_entries = []
             current_pos = 0  # Track position in tar file
+            read_time = hash_time = tar_time = 0.0
+            build_start = time.perf_counter()
             
             with tarfile.open(
                 fileobj=tar_buffer,
@@ -323,9 +457,14 @@ class S3toS3Archiver:
                 for file_info in batch.files:
                     try:
                         # Download object from S3
+                        t0 = time.perf_counter()
                         content = self._download_s3_object(file_info)
+                        t1 = time.perf_counter()
+                        read_time += t1 - t0
+                        stats.record_file('read', t1 - t0)
+                        tracer.file_span('read', t0, t1, key=file_info.key, size=file_info.size)
                         if content is None:
-                            self._update_stats(failed=1)
+                            self._update_stats(failed=1, category='read')
                             continue
 
                         # Create tar info
@@ -350,6 +489,10 @@ class S3toS3Archiver:
                         
                         # Update current position
                         current_pos = end_pos
+                        t2 = time.perf_counter()
+                        tar_time += t2 - t1
+                        stats.record_file('tar', t2 - t1)
+                        tracer.file_span('tar', t1, t2, key=file_info.key)
                         
                         # Create manifest entry with position information
                         manifest_entry = self._create_manifest_entry(
@@ -360,79 +503,121 @@ class S3toS3Archiver:
                             end_pos
                         )
                         manifest_entries.append(manifest_entry)
+                        t3 = time.perf_counter()
+                        hash_time += t3 - t2
+                        stats.record_file('hash', t3 - t2)
+                        tracer.file_span('hash', t2, t3, key=file_info.key)
                         
-                        self._update_stats(files=1, bytes_transferred=file_info.size)
+                        stats.update(files=1, bytes_transferred=file_info.size)
                     
                     except Exception as e:
                         self.logger.error(f"Error processing {file_info.key}: {str(e)}")
-                        self._update_stats(failed=1)
+                        self._update_stats(failed=1, category='tar')
+
+            self.stats.add_busy('read', read_time)
+            self.stats.add_busy('hash', hash_time)
+            self.stats.add_busy('tar', tar_time)
+            # GETs, tar and hash are interleaved per object: one span per batch with the split in args
+            tracer.complete(
+                'read+tar+hash', build_start, time.perf_counter(), batch=batch.batch_number,
+                files=batch.file_count, read_seconds=round(read_time, 6),
+                tar_seconds=round(tar_time, 6), hash_seconds=round(hash_time, 6)
+            )
 
             # Upload tar file and manifest
             if manifest_entries:
-                self._upload_archive_and_manifest(tar_buffer, manifest_entries, batch.batch_number, tar_key, self.tar_storageclass, self.manifest_storageclass)
+                self._upload_archive_and_manifest(tar_buffer, manifest_entries, batch.batch_number, tar_key, manifest_key, self.tar_storageclass, self.manifest_storageclass)
                 self.logger.info(f"{tar_key}: uploaded")
 
-    def _upload_archive_and_manifest(self, tar_buffer, manifest_entries, batch_number, tar_key, t_sc, m_sc):
+    def _upload_archive_and_manifest(self, tar_buffer, manifest_entries, batch_number, tar_key, manifest_key, t_sc, m_sc):
         """Upload tar archive and manifest to destination S3"""
-        mid_prefix = self.current_time.split('_')[0]
         try:
-            manifest_key = f"{self.dst_prefix}/manifests/{mid_prefix}/manifest_{self.current_time}_{batch_number}.csv"
-
-            # Upload tar file
-            tar_buffer.seek(0)
-            self.s3_client.upload_fileobj(
-                tar_buffer,
-                self.dst_bucket,
-                tar_key,
-                ExtraArgs = { 'StorageClass': t_sc}, 
-                Config=self.transfer_config
-            )
-            self._update_stats(tars=1)
-
-            # Add header to manifest
-            manifest_header = "tar_path|file_path|timestamp|file_size|start_position|end_position|md5_hash"
-            manifest_content = manifest_header + '\n' + '\n'.join(manifest_entries)
-            
-            # Upload manifest
-            self.s3_client.put_object(
-                Bucket=self.dst_bucket,
-                Key=manifest_key,
-                StorageClass=m_sc, 
-                Body=manifest_content.encode('utf-8')
-            )
-            self._update_stats(manifests=1)
-
+            with self.stats.upload():
+                self._upload_archive_and_manifest_once(tar_buffer, manifest_entries, tar_key, manifest_key, t_sc, m_sc)
         except Exception as e:
             self.logger.error(f"Failed to upload archive/manifest {batch_number}: {str(e)}")
-
-    def _update_stats(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0):
-        """Thread-safe statistics update"""
-        with self._stats_lock:
-            self._total_files += files
-            self._failed_files += failed
-            self._total_tar_files += tars
-            self._total_manifest_files += manifests
-            self._total_bytes_transferred += bytes_transferred
+            self.stats.add_failure('upload', len(manifest_entries))
+            self.tracer.instant('batch failed', batch=batch_number, stage='upload', error=str(e))
+
+    def _upload_archive_and_manifest_once(self, tar_buffer, manifest_entries, tar_key, manifest_key, t_sc, m_sc):
+        """Upload the tar archive, then its manifest"""
+        # Upload tar file
+        with self.tracer.span('upload tar', key=tar_key):
+            self._put(self._upload_tar, tar_buffer.getbuffer().nbytes,
+                      tar_buffer=tar_buffer, tar_key=tar_key, t_sc=t_sc)
+        self._update_stats(tars=1)
+
+        # Add header to manifest
+        manifest_header = "tar_path|file_path|timestamp|file_size|start_position|end_position|md5_hash"
+        
+        # Upload manifest
+        if writes_csv(self.manifest_format):
+            manifest_content = manifest_header + '\n' + '\n'.join(manifest_entries)
+            manifest_body = manifest_content.encode('utf-8')
+            with self.tracer.span('upload manifest', key=manifest_key):
+                self._put(
+                    self.s3_client.put_object,
+                    len(manifest_body),
+                    Bucket=self.dst_bucket,
+                    Key=manifest_key,
+                    StorageClass=m_sc, 
+                    Body=manifest_body
+                )
+        if writes_parquet(self.manifest_format):
+            parquet_body = to_parquet([manifest_header] + manifest_entries, self.DELIMITER)
+            parquet_key = parquet_path(manifest_key)
+            with self.tracer.span('upload manifest', key=parquet_key):
+                self._put(
+                    self.s3_client.put_object,
+                    len(parquet_body),
+                    Bucket=self.dst_bucket,
+                    Key=parquet_key,
+                    StorageClass=m_sc,
+                    Body=parquet_body
+                )
+        if self.bloom_filter:
+            bloom_body = to_bloom([manifest_header] + manifest_entries, self.DELIMITER, self.bloom_fp_rate)
+            bloom_key = bloom_path(manifest_key)
+            with self.tracer.span('upload manifest', key=bloom_key):
+                self._put(
+                    self.s3_client.put_object,
+                    len(bloom_body),
+                    Bucket=self.dst_bucket,
+                    Key=bloom_key,
+                    StorageClass=m_sc,
+                    Body=bloom_body
+                )
+        self._update_stats(manifests=1)
+
+    def _update_stats(self, files=0, failed=0, tars=0, manifests=0, bytes_transferred=0, category=None):
+        """Lock-free statistics update"""
+        self.stats.update(files, failed, tars, manifests, bytes_transferred, category)
+
+    def _collect_metrics(self):
+        """Gauges for the metrics endpoint that are not part of RunStats"""
+        return {
+            'queue_depth': self.file_batch_queue.qsize(),
+        }
 
     @property
     def total_files(self):
-        return self._total_files
+        return self.stats.totals()['files']
     
     @property
     def failed_files(self):
-        return self._failed_files
+        return self.stats.totals()['failed']
     
     @property
     def total_tar_files(self):
-        return self._total_tar_files
+        return self.stats.totals()['tars']
     
     @property
     def total_manifest_files(self):
-        return self._total_manifest_files
+        return self.stats.totals()['manifests']
     
     @property
     def total_bytes_transferred(self):
-        return self._total_bytes_transferred
+        return self.stats.totals()['bytes']
 
     def format_duration(self, seconds):
        """Convert seconds to human readable duration format"""
@@ -451,7 +636,11 @@ class S3toS3Archiver:
 
     def start_processing(self):
         """Start the producer and consumer threads"""
+        if self.dry_run:
+            self._dry_run()
+            return
         self.start_time = time.time()
+        self.metrics.start()
         
         # Create and start consumer threads first
         self.consumer_threads = [
@@ -467,7 +656,7 @@ class S3toS3Archiver:
             
         # Create and start producer thread
         self.producer_thread = threading.Thread(
-            target=self._file_list_producer,
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
             name="producer"
         )
         self.producer_thread.start()
@@ -476,6 +665,8 @@ class S3toS3Archiver:
         self.producer_thread.join()
         for consumer in self.consumer_threads:
             consumer.join()
+        self.metrics.stop()
+        trace_file = self.tracer.write()
 
         # Log final statistics
         elapsed_time = time.time() - self.start_time
@@ -496,8 +687,26 @@ class S3toS3Archiver:
         if elapsed_time > 0:
             transfer_rate = self.total_bytes_transferred / elapsed_time
             self.logger.info(f"Average transfer rate: {self.get_size_display(transfer_rate)}/s")
+        for line in self.stats.format_histograms():
+            self.logger.info(f"Latency {line}")
+        if self.concurrency:
+            for line in self.concurrency.summary():
+                self.logger.info(f"Adaptive concurrency {line}")
+        if trace_file:
+            self.logger.info(f"Trace written to {trace_file}")
         self.logger.info(f"####################################")
 
+    def _dry_run(self):
+        """Run the producer into the planner and report the plan"""
+        self.logger.info("Dry run: listing the source without reading or uploading any object")
+        producer = threading.Thread(
+            target=self._plan_producer if self.plan_file else self._file_list_producer,
+            name="producer"
+        )
+        producer.start()
+        producer.join()
+        self.file_batch_queue.complete(self.directories['logs'], self.current_time, self.logger)
+
     @staticmethod
     def get_size_display(size_in_bytes):
         """Convert bytes to human readable format"""
@@ -525,8 +734,39 @@ def main():
     parser.add_argument('--num-threads', type=int, default=10, help='Number of worker threads')
     parser.add_argument('--compress', type=util.strtobool, default=False, help='GZip Compress for tarfile, True or False')
     parser.add_argument('--profile-name', help='AWS profile name to use')
+    parser.add_argument('--endpoint', default=None, help='endpoint_url (e.g. a local S3-compatible server)')
     parser.add_argument('--tar-storageclass', default='STANDARD', help='Storage Class for TAR file')
     parser.add_argument('--manifest-storageclass', default='STANDARD', help='Storage Class for manifest file')
+    parser.add_argument('--adaptive-concurrency', type=lambda x: bool(util.strtobool(x)), default=False,
+                        help='Adapt S3 request concurrency to throttling, using --num-threads as the ceiling')
+    parser.add_argument('--initial-concurrency', type=int, default=None,
+                        help='Starting S3 request concurrency with --adaptive-concurrency (default: --num-threads)')
+    parser.add_argument('--prefix-shards', type=int, default=0,
+                        help='Spread archives and manifests over N hashed sub-prefixes per date (0 = off)')
+    parser.add_argument('--metrics-port', type=int, default=0,
+                        help='Serve live metrics on this HTTP port (/metrics, /metrics.json; 0 = off)')
+    parser.add_argument('--metrics-host', default='127.0.0.1',
+                        help='Address the metrics endpoint listens on (0.0.0.0 for every interface)')
+    parser.add_argument('--metrics-snapshot', type=util.strtobool, default=False,
+                        help='Write a JSON metrics snapshot to the log directory every --metrics-interval seconds')
+    parser.add_argument('--metrics-interval', type=float, default=10.0, help='Metrics sampling interval in seconds')
+    parser.add_argument('--manifest-format', choices=MANIFEST_FORMATS, default='csv',
+                        help='Manifest format: pipe-delimited csv, parquet (under manifests_parquet/, needs pyarrow) or both')
+    parser.add_argument('--bloom-filter', type=util.strtobool, default=False,
+                        help='Write a Bloom filter of the file names next to each manifest (under blooms/), for path-lookup.py')
+    parser.add_argument('--bloom-fp-rate', type=float, default=DEFAULT_FP_RATE,
+                        help='False positive rate of each Bloom filter; a path lookup reads about RATE x manifests in vain')
+    parser.add_argument('--dry-run', type=util.strtobool, default=False,
+                        help='List the source and report the batch plan, request cost and duration without archiving')
+    parser.add_argument('--save-plan', default=None,
+                        help='With --dry-run, save the batch plan to this file (.gz to compress)')
+    parser.add_argument('--plan-file', default=None, help='Execute a plan saved with --save-plan instead of listing')
+    parser.add_argument('--plan-rates', type=parse_rates, default=None,
+                        help='Throughput assumed by the dry-run duration estimate: FILES_PER_SECOND,MB_PER_SECOND')
+    parser.add_argument('--trace', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Write a Chrome/Perfetto trace of every stage, batch and thread to the log directory')
+    parser.add_argument('--trace-files', type=lambda x: bool(util.strtobool(x)), default=False,
+                      help='Also trace every object (read, tar, hash); large for long runs')
     # StorageClass='STANDARD'|'REDUCED_REDUNDANCY'|'STANDARD_IA'|'ONEZONE_IA'|'INTELLIGENT_TIERING'|'GLACIER'|'DEEP_ARCHIVE'|'OUTPOSTS'|'GLACIER_IR'|'SNOW'|'EXPRESS_ONEZONE',
 
     args = parser.parse_args()
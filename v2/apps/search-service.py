@@ -0,0 +1,458 @@
+"""
+Long-lived search service.
+
+search-web.py used to start `python3 apps/search.py` for every search, paying
+for interpreter start, the pandas/boto3/awswrangler imports and new clients
+each time. This process keeps all of that warm: one boto3 session, the set of
+manifest tables already known to exist, and the local trigram indexes open,
+so a search costs only the query itself.
+
+Athena results are kept in an LRU cache (result_cache.py) keyed on the
+normalized search. An entry expires after --cache-ttl seconds and is dropped
+sooner when the manifests of the newest searched days change (checked at most
+every --cache-revalidate seconds), so repeated searches cost no Athena query.
+With --result-reuse-minutes, Athena's own query result reuse also covers
+searches repeated after the service restarts.
+
+A search with "page_size" returns its first page and a cursor. The rest of the
+result is read from Athena's result file only as further pages are requested,
+so the time to the first row and the memory used do not grow with the result.
+The total is counted by a separate query running alongside and is reported
+once known. A paged result read to the end is cached when it has at most
+--cache-max-rows rows.
+
+JSON API on localhost:
+    GET  /health  -> {"status", "cache": {"entries", "hits", "misses", "invalidations"}, "cursors"}
+    POST /search  {"bucket", "prefix", "search_value", "start_value", "end_value",
+                   "manifest_format": "csv"|"parquet", "min_size", "max_size", "md5", "local_index": false,
+                   "page_size"}
+         -> {"rows": [{"tarfile_location", "filename", "start_byte", "stop_byte", "date"}],
+             "count", "elapsed", "cached"}
+            and with page_size: "offset", "total" (null until counted), "cursor" (null on the last page)
+    POST /search/next  {"cursor"}
+         -> the next page, same fields
+
+With "local_index": true the search is answered by the trigram index of the
+bucket and prefix under --local-index-dir. A search with "md5" is answered by
+the path index under --path-index-dir (path_index.py), where finding every
+archived copy of a content is a point query; without it, Athena filters on
+md5. Local indexes are synced at most every --sync-interval seconds.
+
+Usage:
+    python3 search-service.py --port 8502 --local-index-dir ./indexes
+"""
+import argparse
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import boto3
+import numpy as np
+import pandas as pd
+
+from path_index import PathIndex, normalize_md5
+from result_cache import ResultCache, search_key
+from search import (count_keys_in_range, ensure_manifest_table, has_undated_manifests, iter_keys_in_range,
+                    manifest_fingerprint, manifest_table_name, query_keys_in_range)
+from trigram_index import TrigramIndex, parse_date
+
+REQUIRED = ('bucket', 'prefix', 'start_value', 'end_value')
+COLUMNS = ['tarfile_location', 'filename', 'start_byte', 'stop_byte', 'date']
+
+
+class Cursor:
+    """
+    Pages of one search result, pulled from its chunk iterator as they are requested
+    """
+    def __init__(self, chunks, page_size, total=None, keep_rows=0, on_complete=None):
+        self.chunks = chunks
+        self.page_size = page_size
+        self.offset = 0
+        self.done = False
+        self.lock = threading.Lock()
+        self.touched = time.monotonic()
+        # int, or a Future of the count query
+        self._total = total
+        self._buffer = []
+        self._buffered = 0
+        self._exhausted = False
+        # Pages served so far, for on_complete, while they stay under keep_rows
+        self._keep_rows = keep_rows
+        self._kept = []
+        self._on_complete = on_complete
+
+    @property
+    def total(self):
+        if isinstance(self._total, Future):
+            if not self._total.done() or self._total.exception() is not None:
+                return self.offset if self.done else None
+            return self._total.result()
+        return self._total
+
+    def _fill(self, rows):
+        while self._buffered < rows and not self._exhausted:
+            try:
+                chunk = next(self.chunks)
+            except StopIteration:
+                self._exhausted = True
+                break
+            if len(chunk):
+                self._buffer.append(chunk)
+                self._buffered += len(chunk)
+
+    def next_page(self):
+        self.touched = time.monotonic()
+        self._fill(self.page_size)
+        if self._buffer:
+            df = pd.concat(self._buffer, ignore_index=True) if len(self._buffer) > 1 else self._buffer[0]
+        else:
+            df = pd.DataFrame(columns=COLUMNS)
+        page, rest = df.iloc[:self.page_size], df.iloc[self.page_size:]
+        self._buffer = [rest] if len(rest) else []
+        self._buffered = len(rest)
+        # Look one chunk ahead so the last page is known as the last one
+        self._fill(1)
+        self.offset += len(page)
+        self.done = self._exhausted and not self._buffer
+
+        if self._on_complete is not None:
+            if self.offset <= self._keep_rows:
+                self._kept.append(page)
+                if self.done:
+                    self._on_complete(pd.concat(self._kept, ignore_index=True))
+            else:
+                self._kept = []
+                self._on_complete = None
+        return page
+
+
+class SearchService:
+    def __init__(self, args):
+        self.database = args.database
+        self.workgroup = args.workgroup
+        self.local_index_dir = args.local_index_dir
+        self.path_index_dir = args.path_index_dir
+        self.sync_interval = args.sync_interval
+        self.result_reuse_minutes = args.result_reuse_minutes
+        self.cache_max_rows = args.cache_max_rows
+        self.cursor_ttl = args.cursor_ttl
+        self.table_recheck = args.table_recheck
+        self.profile_name = args.profile_name
+        # Clients are thread-safe and shared; Sessions are not, so each thread gets its own (session)
+        self.s3_client = boto3.Session(profile_name=args.profile_name).client('s3')
+        self._thread = threading.local()
+
+        # (bucket, prefix, format): (undated, time the layout was checked)
+        self._tables = {}
+        self._tables_lock = threading.Lock()
+        # index path: [TrigramIndex or PathIndex, lock, time of the last sync]
+        self._indexes = {}
+        self._indexes_lock = threading.Lock()
+        self.cache = ResultCache(args.cache_entries, args.cache_ttl, args.cache_revalidate)
+        self._cursors = {}
+        self._cursors_lock = threading.Lock()
+        # Count queries run alongside the first page
+        self._counts = ThreadPoolExecutor(max_workers=4)
+
+        self.logger = logging.getLogger(__name__)
+        self.logger.setLevel(logging.INFO)
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter('%(asctime)s - %(levelname)s - %(message)s'))
+        self.logger.addHandler(handler)
+
+    @property
+    def session(self):
+        """boto3 Session of the calling thread, for awswrangler"""
+        session = getattr(self._thread, 'session', None)
+        if session is None:
+            session = self._thread.session = boto3.Session(profile_name=self.profile_name)
+        return session
+
+    def _parse(self, request):
+        missing = [name for name in REQUIRED if not request.get(name)]
+        if missing:
+            raise ValueError(f"missing {', '.join(missing)}")
+        for name in ('start_value', 'end_value'):
+            datetime.strptime(request[name], '%Y-%m-%d')
+        manifest_format = request.get('manifest_format', 'csv')
+        if manifest_format not in ('csv', 'parquet'):
+            raise ValueError("manifest_format must be csv or parquet")
+        return {
+            'bucket': request['bucket'],
+            'prefix': request['prefix'],
+            'key_name': request.get('search_value') or '',
+            'start_date': request['start_value'],
+            'end_date': request['end_value'],
+            'manifest_format': manifest_format,
+            'min_size': None if request.get('min_size') is None else int(request['min_size']),
+            'max_size': None if request.get('max_size') is None else int(request['max_size']),
+            'md5': normalize_md5(request['md5']) if request.get('md5') else None,
+        }
+
+    def _table(self, search):
+        """Manifest table of a search and whether it is the unpartitioned table of undated manifests"""
+        location = (search['bucket'], search['prefix'], search['manifest_format'])
+        table_name = manifest_table_name(*location)
+        options = dict(database=self.database, table_name=table_name, bucket_name=search['bucket'],
+                       prefix=search['prefix'], manifest_format=search['manifest_format'], workgroup=self.workgroup,
+                       boto3_session=self.session, s3_client=self.s3_client)
+        now = time.monotonic()
+        with self._tables_lock:
+            entry = self._tables.get(location)
+            if entry is None:
+                # The layout recorded in the table
+                entry = self._tables[location] = (ensure_manifest_table(**options), now)
+            elif now - entry[1] > self.table_recheck:
+                # s3archiver.py can start writing undated manifests to a prefix: recreate the table then
+                undated = has_undated_manifests(self.s3_client, *location)
+                if undated != entry[0]:
+                    ensure_manifest_table(undated=undated, **options)
+                entry = self._tables[location] = (undated, now)
+        return table_name, entry[0]
+
+    def _cached(self, search, undated):
+        """Cache key, fingerprint function and cached result (or None) of an Athena search"""
+        key = search_key(search['bucket'], search['prefix'], search['key_name'], search['start_date'],
+                         search['end_date'], search['manifest_format'], search['min_size'], search['max_size'],
+                         search['md5'])
+
+        def fingerprint():
+            return manifest_fingerprint(self.s3_client, search['bucket'], search['prefix'], search['start_date'],
+                                        search['end_date'], search['manifest_format'], undated)
+
+        return key, fingerprint, self.cache.get(key, fingerprint)
+
+    def search(self, request):
+        """DataFrame of the rows matching a search request, and whether it came from the cache"""
+        search = self._parse(request)
+        df = self._local(search, request)
+        if df is not None:
+            return df, False
+
+        table_name, undated = self._table(search)
+        key, fingerprint, df = self._cached(search, undated)
+        if df is not None:
+            return df, True
+        # Fingerprint taken before the query: manifests landing during it invalidate the entry
+        current = fingerprint()
+        df = query_keys_in_range(
+            self.database, table_name, search['key_name'], search['start_date'], search['end_date'],
+            self.workgroup, search['min_size'], search['max_size'], boto3_session=self.session,
+            result_reuse_minutes=self.result_reuse_minutes, fingerprint=current, md5=search['md5'],
+            undated=undated
+        )
+        self.cache.put(key, df, current)
+        return df, False
+
+    def open_cursor(self, request, page_size):
+        """Token of a new cursor over the rows matching a search request, and whether it came from the cache"""
+        if page_size <= 0:
+            raise ValueError("page_size must be positive")
+        search = self._parse(request)
+        cached = False
+        df = self._local(search, request)
+        if df is not None:
+            cursor = Cursor(iter([df]), page_size, total=len(df))
+        else:
+            table_name, undated = self._table(search)
+            key, fingerprint, df = self._cached(search, undated)
+            if df is not None:
+                cursor, cached = Cursor(iter([df]), page_size, total=len(df)), True
+            else:
+                current = fingerprint()
+                query = (self.database, table_name, search['key_name'], search['start_date'], search['end_date'],
+                         self.workgroup, search['min_size'], search['max_size'])
+                options = {'result_reuse_minutes': self.result_reuse_minutes,
+                           'fingerprint': current, 'md5': search['md5'], 'undated': undated}
+                # The count runs on a pool thread, with that thread's session
+                total = self._counts.submit(lambda: count_keys_in_range(*query, boto3_session=self.session, **options))
+                chunks = iter_keys_in_range(*query, page_size=page_size, boto3_session=self.session, **options)
+                cursor = Cursor(chunks, page_size, total=total, keep_rows=self.cache_max_rows,
+                                on_complete=lambda rows: self.cache.put(key, rows, current))
+
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._cursors_lock:
+            for expired in [t for t, c in self._cursors.items() if now - c.touched > self.cursor_ttl]:
+                del self._cursors[expired]
+            self._cursors[token] = cursor
+        return token, cached
+
+    def next_page(self, token):
+        """Next page of an open cursor, its offset and the cursor; the cursor is dropped after its last page"""
+        with self._cursors_lock:
+            cursor = self._cursors.get(token)
+        if cursor is None:
+            raise KeyError(token)
+        with cursor.lock:
+            page = cursor.next_page()
+            if cursor.done:
+                with self._cursors_lock:
+                    self._cursors.pop(token, None)
+            return page, cursor.offset - len(page), cursor
+
+    def _local(self, search, request):
+        """Result from a local index, or None when the search goes to Athena"""
+        if search['md5'] and self.path_index_dir:
+            return self._search_paths(search)
+        if request.get('local_index'):
+            if search['md5']:
+                raise ValueError("the trigram index has no md5; run the service with --path-index-dir")
+            return self._search_local(search)
+        return None
+
+    def _query_index(self, path, open_index, search, query):
+        """query(index) on the open index at path, synced with new manifests at most every sync_interval"""
+        with self._indexes_lock:
+            if path not in self._indexes:
+                self._indexes[path] = [open_index(path, self.logger), threading.Lock(), 0.0]
+            entry = self._indexes[path]
+        index, lock, synced = entry
+        with lock:
+            if time.monotonic() - synced > self.sync_interval:
+                index.sync(self.s3_client, search['bucket'], search['prefix'])
+                entry[2] = time.monotonic()
+            return query(index)
+
+    def _search_local(self, search):
+        if not self.local_index_dir:
+            raise ValueError("local_index needs the service to run with --local-index-dir")
+        path = os.path.join(self.local_index_dir, manifest_table_name(search['bucket'], search['prefix']))
+        return self._query_index(path, TrigramIndex, search, lambda index: index.search(
+            search['key_name'], search['start_date'], search['end_date'], search['min_size'], search['max_size']))
+
+    def _search_paths(self, search):
+        path = os.path.join(self.path_index_dir, f"{manifest_table_name(search['bucket'], search['prefix'])}.db")
+        rows = self._query_index(path, PathIndex, search, lambda index: list(index.find(
+            search['md5'], search['min_size'], search['max_size'], search['key_name'],
+            search['start_date'], search['end_date'])))
+        dates = {}
+        return pd.DataFrame({
+            'tarfile_location': [row[0] for row in rows],
+            'filename': [row[1] for row in rows],
+            'start_byte': [row[4] for row in rows],
+            'stop_byte': [row[5] for row in rows],
+            'date': np.array([parse_date(row[2], dates) for row in rows], dtype='int64').astype('datetime64[s]'),
+        }, columns=COLUMNS)
+
+    def close(self):
+        self._counts.shutdown(wait=False, cancel_futures=True)
+        for index, lock, _ in self._indexes.values():
+            with lock:
+                index.close()
+
+
+def records(df):
+    """JSON rows of a result DataFrame"""
+    df = df[COLUMNS].astype({'date': str, 'start_byte': 'int64', 'stop_byte': 'int64'})
+    return df.to_dict('records')
+
+
+class SearchHandler(BaseHTTPRequestHandler):
+    service = None
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/health':
+            self._reply(200, {'status': 'ok', 'cache': self.service.cache.stats(),
+                              'cursors': len(self.service._cursors)})
+        else:
+            self._reply(404, {'error': f'unknown path {self.path}'})
+
+    def do_POST(self):
+        if self.path not in ('/search', '/search/next'):
+            self._reply(404, {'error': f'unknown path {self.path}'})
+            return
+        start = time.perf_counter()
+        token = None
+        cached = False
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+            if self.path == '/search/next':
+                token = request.get('cursor') or ''
+            elif request.get('page_size'):
+                token, cached = self.service.open_cursor(request, int(request['page_size']))
+            if token is not None:
+                page, offset, cursor = self.service.next_page(token)
+            else:
+                page, cached = self.service.search(request)
+        except KeyError:
+            self._reply(404, {'error': 'unknown or expired cursor'})
+            return
+        except ValueError as e:
+            self._reply(400, {'error': str(e)})
+            return
+        except Exception as e:
+            self.service.logger.error(f"Search failed: {e}")
+            self._reply(500, {'error': str(e)})
+            return
+
+        elapsed = time.perf_counter() - start
+        body = {'rows': records(page), 'count': len(page), 'elapsed': round(elapsed, 3), 'cached': cached}
+        if token is not None:
+            body.update({'offset': offset, 'total': cursor.total, 'cursor': None if cursor.done else token})
+        self._reply(200, body)
+        if self.path == '/search':
+            self.service.logger.info(f"Search '{request.get('search_value') or request.get('md5') or ''}' s3://{request['bucket']}/{request['prefix']}: "
+                                     f"{len(page):,} rows in {elapsed:.3f}s{' (cached)' if cached else ''}")
+
+    def log_message(self, format, *args):
+        # Requests are logged by do_POST
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Search service keeping clients and indexes warm')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=8502, help='Port to listen on')
+    parser.add_argument('--database', default='default', help='Glue database of the manifest tables')
+    parser.add_argument('--workgroup', default='primary', help='Athena workgroup')
+    parser.add_argument('--local-index-dir', default=None,
+                        help='Directory of the trigram indexes, one per bucket and prefix, for "local_index" searches')
+    parser.add_argument('--path-index-dir', default=None,
+                        help='Directory of the path indexes, one per bucket and prefix, for md5 searches')
+    parser.add_argument('--sync-interval', type=float, default=60,
+                        help='Seconds between syncs of a local index with new manifests')
+    parser.add_argument('--cache-entries', type=int, default=256, help='Search results kept in memory')
+    parser.add_argument('--cache-ttl', type=float, default=600, help='Seconds a cached search result is kept')
+    parser.add_argument('--cache-revalidate', type=float, default=30,
+                        help='Seconds a cached result is served before the manifests are listed again to check it')
+    parser.add_argument('--cache-max-rows', type=int, default=100000,
+                        help='Largest paged result kept in the cache once read to the end')
+    parser.add_argument('--cursor-ttl', type=float, default=600,
+                        help='Seconds an unused cursor of a paged search is kept')
+    parser.add_argument('--result-reuse-minutes', type=int, default=60,
+                        help='Athena query result reuse for the same search and manifests (0 disables)')
+    parser.add_argument('--table-recheck', type=float, default=300,
+                        help='Seconds before a prefix is checked again for undated manifests, which need the unpartitioned table')
+    parser.add_argument('--profile-name', default=None, help='AWS profile name')
+    args = parser.parse_args()
+
+    SearchHandler.service = SearchService(args)
+    server = ThreadingHTTPServer((args.host, args.port), SearchHandler)
+    SearchHandler.service.logger.info(f"Search service listening on http://{args.host}:{args.port}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        SearchHandler.service.close()
+
+
+if __name__ == '__main__':
+    main()
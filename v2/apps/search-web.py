@@ -3,6 +3,13 @@ import subprocess
 import pandas as pd
 import io
 import os
+import json
+import urllib.error
+import urllib.request
+
+import boto3
+
+from path_index import MANIFEST_HEADER, PathIndex, human_size, parent_path
 
 # Initialize session state variables if they don't exist
 if 'parsed_df' not in st.session_state:
@@ -15,10 +22,54 @@ if 'selected_start_byte' not in st.session_state:
     st.session_state.selected_start_byte = None
 if 'selected_stop_byte' not in st.session_state:
     st.session_state.selected_stop_byte = None
+if 'selected_file_name' not in st.session_state:
+    st.session_state.selected_file_name = None
 if 'selected_index' not in st.session_state:
     st.session_state.selected_index = None
+if 'browse_path' not in st.session_state:
+    st.session_state.browse_path = ''
+# Paged results from the search service
+if 'search_cursor' not in st.session_state:
+    st.session_state.search_cursor = None
+if 'search_offset' not in st.session_state:
+    st.session_state.search_offset = 0
+if 'search_total' not in st.session_state:
+    st.session_state.search_total = None
+
+# Long-lived search service (apps/search-service.py); without it every search starts apps/search.py
+SEARCH_SERVICE_URL = os.environ.get('SEARCH_SERVICE_URL', 'http://127.0.0.1:8502')
+
+def service_request(path, body):
+    """
+    POST to the search service; the JSON reply, or None when it is not running
+    """
+    request = urllib.request.Request(f"{SEARCH_SERVICE_URL}{path}", data=json.dumps(body).encode('utf-8'),
+                                     headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(request, timeout=300) as response:
+            return json.loads(response.read())
+    except urllib.error.HTTPError as e:
+        st.error(f"Search service: {json.loads(e.read()).get('error', e.reason)}")
+        return {'rows': [], 'offset': 0, 'total': 0, 'cursor': None}
+    except (urllib.error.URLError, ConnectionError):
+        return None
+
+def service_page(reply):
+    """
+    One page of a search service reply, with the same columns as parse_output
+    """
+    offset = reply.get('offset', 0)
+    st.session_state.search_cursor = reply.get('cursor')
+    st.session_state.search_offset = offset
+    st.session_state.search_total = reply.get('total', len(reply['rows']))
+
+    pd.set_option('display.max_colwidth', None)
+    df = pd.DataFrame(reply['rows'], columns=['tarfile_location', 'filename', 'start_byte', 'stop_byte', 'date'])
+    df = df.rename(columns={'start_byte': 'start_bytes', 'stop_byte': 'stop_bytes'}).astype(str)
+    df.insert(0, 'index', [str(i) for i in range(offset, offset + len(df))])
+    return df
 
-def run_search(bucket_name, prefix, search_value, start_value, end_value):
+def run_search(bucket_name, prefix, search_value, start_value, end_value, manifest_format='csv', filters=None):
     program = "apps/search.py"
 
     cmd = [
@@ -28,7 +79,10 @@ def run_search(bucket_name, prefix, search_value, start_value, end_value):
         "--search_value", search_value,
         "--start_value", start_value,
         "--end_value", end_value,
+        "--manifest_format", manifest_format,
     ]
+    for name, value in (filters or {}).items():
+        cmd += [f"--{name}", str(value)]
 
     result = subprocess.run(cmd, capture_output=True, text=True)
     return result.stdout
@@ -76,12 +130,14 @@ def update_selection():
         st.session_state.selected_tar_name = selected_row['tarfile_location']
         st.session_state.selected_start_byte = selected_row['start_bytes']
         st.session_state.selected_stop_byte = selected_row['stop_bytes']
+        st.session_state.selected_file_name = selected_row['filename']
 
 st.title("Searching files in Amazon S3")
 
 # Input for bucket name and prefix
 bucket_name = st.text_input("Enter S3 bucket(ex, your-bucket-name)")
 prefix = st.text_input("Enter Prefix(ex: prefix1/nextprefix)")
+manifest_format = st.radio("Manifest format", ["csv", "parquet"], horizontal=True)
 
 # define sidebar
 #page = st.sidebar.selectbox("Menu", ["Search", "Restore"])
@@ -101,43 +157,167 @@ with col2:
 start_value = start_value.strftime("%Y-%m-%d")
 end_value = end_value.strftime("%Y-%m-%d")
 
+# Content and size predicates, combined with the name and dates
+with st.expander("Content and size filters"):
+    md5_value = st.text_input("MD5 (finds every archived copy of this content)").strip()
+    col1, col2 = st.columns(2)
+    with col1:
+        min_size = st.number_input("Min size (bytes)", min_value=0, value=0, step=1)
+    with col2:
+        max_size = st.number_input("Max size (bytes, 0 for no limit)", min_value=0, value=0, step=1)
+filters = {}
+if md5_value:
+    filters['md5'] = md5_value
+if min_size:
+    filters['min_size'] = int(min_size)
+if max_size:
+    filters['max_size'] = int(max_size)
+
+page_size = st.selectbox("Rows per page", [100, 1000, 10000], index=1)
+
 if st.button("Search"):
 
-    if bucket_name and prefix and search_value:
+    if bucket_name and prefix and (search_value or md5_value):
         with st.spinner("Running archiver..."):
-            result = run_search(bucket_name, prefix, search_value, start_value, end_value)
-        parsed_df = parse_output(result)
-    
-        st.session_state.parsed_df = parse_output(result)
-    
-        if not st.session_state.parsed_df.empty:
-            st.subheader("Parsed Results")
-            st.dataframe(st.session_state.parsed_df)
-            
-            # Use the callback to update session state
-            st.selectbox(
-                'Select file:', 
-                st.session_state.parsed_df.index,
-                key='selected_index',
-                on_change=update_selection
-            )
-            
-            if st.session_state.selected_index is not None:
-                st.write(f"Selected index: {st.session_state.selected_index}")
-                st.write(f"Selected tar name: {st.session_state.selected_tar_name}")
-                st.write(f"Selected start byte: {st.session_state.selected_start_byte}")
-                st.write(f"Selected stop byte: {st.session_state.selected_stop_byte}")
-    
-            # Add download button for CSV
-            csv = parsed_df.to_csv(index=False)
-            st.download_button(
-                label="Download results as CSV",
-                data=csv,
-                file_name="search_results.csv",
-                mime="text/csv",
-            )
-    
-        else:
-            st.info("No results found or unable to parse the output.")
+            reply = service_request('/search', {
+                'bucket': bucket_name,
+                'prefix': prefix,
+                'search_value': search_value,
+                'start_value': start_value,
+                'end_value': end_value,
+                'manifest_format': manifest_format,
+                'page_size': page_size,
+                **filters,
+            })
+            if reply is not None:
+                parsed_df = service_page(reply)
+            else:
+                # No search service: whole result from apps/search.py, shown as one page
+                result = run_search(bucket_name, prefix, search_value, start_value, end_value, manifest_format,
+                                    filters)
+                parsed_df = parse_output(result)
+                st.session_state.search_cursor = None
+                st.session_state.search_offset = 0
+                st.session_state.search_total = len(parsed_df)
+
+        st.session_state.parsed_df = parsed_df
     else:
-        st.warning("Please enter all required fields: Bucket Name, Prefix, and Search Value.")
+        st.warning("Please enter all required fields: Bucket Name, Prefix, and Search Value or MD5.")
+
+if st.session_state.parsed_df is not None:
+    parsed_df = st.session_state.parsed_df
+
+    if not parsed_df.empty:
+        st.subheader("Parsed Results")
+        first = st.session_state.search_offset + 1
+        total = st.session_state.search_total
+        st.caption(f"Rows {first:,}-{first + len(parsed_df) - 1:,} of "
+                   f"{'(counting...)' if total is None else f'{total:,}'}")
+        st.dataframe(parsed_df)
+
+        if st.session_state.search_cursor and st.button("Next page"):
+            with st.spinner("Reading next page..."):
+                reply = service_request('/search/next', {'cursor': st.session_state.search_cursor})
+            if reply is None:
+                st.error("Search service is not running; search again.")
+            else:
+                st.session_state.parsed_df = service_page(reply)
+                st.rerun()
+
+        # Use the callback to update session state
+        st.selectbox(
+            'Select file:', 
+            parsed_df.index,
+            key='selected_index',
+            on_change=update_selection
+        )
+        
+        if st.session_state.selected_index is not None:
+            st.write(f"Selected index: {st.session_state.selected_index}")
+            st.write(f"Selected tar name: {st.session_state.selected_tar_name}")
+            st.write(f"Selected start byte: {st.session_state.selected_start_byte}")
+            st.write(f"Selected stop byte: {st.session_state.selected_stop_byte}")
+            st.write(f"Selected file name: {st.session_state.selected_file_name}")
+
+        # Add download button for CSV
+        csv = parsed_df.to_csv(index=False)
+        st.download_button(
+            label="Download this page as CSV",
+            data=csv,
+            file_name="search_results.csv",
+            mime="text/csv",
+        )
+
+    else:
+        st.info("No results found or unable to parse the output.")
+
+st.header("Browse archived files")
+
+# Directory tree built from the manifests by apps/path_index.py
+index_file = st.text_input("Path index file", value="paths.db")
+if st.button("Sync path index"):
+    if bucket_name and prefix:
+        with st.spinner("Reading new manifests..."):
+            index = PathIndex(index_file)
+            try:
+                manifests, rows, removed = index.sync(boto3.client('s3'), bucket_name, prefix)
+                st.success(f"{rows:,} rows from {manifests:,} new manifests, {removed:,} removed")
+            except ValueError as e:
+                # The index file was built from another bucket or prefix
+                st.error(str(e))
+            finally:
+                index.close()
+    else:
+        st.warning("Please enter Bucket Name and Prefix.")
+
+if os.path.exists(index_file):
+    index = PathIndex(index_file)
+    browse_path = st.session_state.browse_path
+    directories, files = index.list_dir(browse_path)
+    total_files, total_bytes = index.totals(browse_path)
+    st.write(f"**{browse_path or '(root)'}**: {total_files:,} files, {human_size(total_bytes)}")
+
+    options = ([".."] if browse_path else []) + [path for path, _, _ in directories]
+    if options:
+        col1, col2 = st.columns([4, 1])
+        with col1:
+            target = st.selectbox("Directory", options, label_visibility="collapsed")
+        with col2:
+            if st.button("Open"):
+                st.session_state.browse_path = parent_path(browse_path) if target == ".." else target
+                st.rerun()
+    if directories:
+        st.dataframe(pd.DataFrame(
+            [(path, count, human_size(size)) for path, count, size in directories],
+            columns=['directory', 'files', 'size']
+        ), hide_index=True)
+    if files:
+        st.dataframe(pd.DataFrame(
+            files, columns=['name', 'size', 'date', 'tarfile_location', 'start_bytes', 'stop_bytes']
+        ), hide_index=True)
+
+    # Everything under this directory, grouped by tar, for restore
+    tars = index.subtree_tars(browse_path)
+    if tars:
+        st.subheader("Tars holding this directory")
+        st.dataframe(pd.DataFrame(
+            tars, columns=['tarfile_location', 'files', 'bytes', 'first_byte', 'last_byte']
+        ), hide_index=True)
+        st.download_button(
+            label="Download directory manifest for restore",
+            data=MANIFEST_HEADER + '\n' + '\n'.join(index.subtree_rows(browse_path)) + '\n',
+            file_name="subtree_manifest.csv",
+            mime="text/csv",
+        )
+
+    # Every archived copy of one file, newest first, with its restore coordinates
+    version_path = st.text_input("File versions (full path as archived)")
+    if version_path:
+        versions = index.versions(version_path, latest=False)
+        if versions:
+            st.dataframe(pd.DataFrame(
+                versions, columns=['tarfile_location', 'filename', 'date', 'size', 'start_bytes', 'stop_bytes', 'md5']
+            ), hide_index=True)
+        else:
+            st.info("No archived copy of this path.")
+    index.close()
@@ -3,24 +3,83 @@ import pandas as pd
 from io import StringIO
 from datetime import datetime
 import argparse
+import hashlib
 import sys
+from datetime import timedelta
 import awswrangler as wr
-from typing import Optional, List, Dict
+from path_index import PathIndex, normalize_md5
+from typing import Optional, List, Dict, Tuple, Iterator, Union
 
 
 # Initialize S3 client
 s3 = boto3.client('s3')
 
+# Partition projection: Athena derives the partitions from the manifests/{date}/
+# layout, so the table is created once and never needs MSCK REPAIR or a crawler
+PROJECTION_START = '20200101'
+
+# Table parameter recording whether the table is the unpartitioned one of undated manifests
+LAYOUT_PARAMETER = 'undated_manifests'
+
+# Rows per page when results are streamed
+PAGE_SIZE = 10000
+
+# Days whose manifests make up the result cache fingerprint: the newest one, and the
+# one before for runs that started the day before and are still writing manifests
+RECENT_PARTITIONS = 2
+
+def manifest_table_name(bucket_name: str, prefix: str, manifest_format: str = 'csv') -> str:
+    """
+    One persistent table per bucket, prefix and manifest format
+    """
+    location = f"{bucket_name}_{prefix.strip('/')}".lower()
+    safe = ''.join(c if c.isalnum() else '_' for c in location)[:80]
+    digest = hashlib.md5(f"{bucket_name}/{prefix.strip('/')}".encode('utf-8')).hexdigest()[:8]
+    suffix = '_parquet' if manifest_format == 'parquet' else ''
+    return f"sfas_manifests_{safe}_{digest}{suffix}"
+
+def partition_projection(s3_location: str, projection_start: str = PROJECTION_START) -> Dict:
+    """
+    Date partition 'dt' projected from {s3_location}{yyyyMMdd}/; prefix shards below the date are read recursively
+    """
+    return {
+        'projection_types': {'dt': 'date'},
+        'projection_ranges': {'dt': f'{projection_start},NOW'},
+        'projection_formats': {'dt': 'yyyyMMdd'},
+        'projection_intervals': {'dt': '1'},
+        'projection_storage_location_template': f'{s3_location}${{dt}}/',
+    }
+
+def manifest_directory(prefix: str, manifest_format: str = 'csv') -> str:
+    """
+    Key prefix of the manifests of a format, with a trailing slash
+    """
+    directory = 'manifests_parquet' if manifest_format == 'parquet' else 'manifests'
+    return f"{prefix.strip('/')}/{directory}/"
+
+def has_undated_manifests(s3_client, bucket_name: str, prefix: str, manifest_format: str = 'csv') -> bool:
+    """
+    Whether manifests sit directly under manifests/ without a date directory (the s3archiver.py layout);
+    the projected date partitions never read them
+    """
+    base = manifest_directory(prefix, manifest_format)
+    response = s3_client.list_objects_v2(Bucket=bucket_name, Prefix=f"{base}manifest_", MaxKeys=1)
+    return response.get('KeyCount', 0) > 0
+
 # Create Athena table
 def create_manifest_table(
     database: str,
     table_name: str,
     bucket_name: str,
     prefix: str,
-    workgroup: str = 'primary'
+    workgroup: str = 'primary',
+    projection_start: str = PROJECTION_START,
+    boto3_session: Optional[boto3.Session] = None,
+    undated: bool = False
 ) -> None:
     """
-    Create Athena table for manifest data with recursive directory scanning
+    Create Athena table for manifest data, partitioned by date with partition projection;
+    unpartitioned with undated, reading every manifest below manifests/
     """
     # Remove trailing slash if present
     prefix = prefix.rstrip('/')
@@ -39,119 +98,524 @@ def create_manifest_table(
         "md5": "string"
     }
     
-    # Define table properties with recursive directory walk
+    # Define table properties
     table_properties = {
         'delimiter': '|',
         'skip.header.line.count': '1',
         'classification': 'csv',
         'typeOfData': 'file',
-        'recursiveDirectoryWalk': 'true'
+        LAYOUT_PARAMETER: str(undated).lower()
     }
     
     try:
-        # Delete existing table if it exists
-        wr.catalog.delete_table_if_exists(
-            database=database,
-            table=table_name
-        )
-        
-        # Create table using Wrangler's catalog function
-        response = wr.catalog.create_csv_table(
+        # Replace the table if it exists (only on setup, never per search)
+        wr.catalog.create_csv_table(
             database=database,
             table=table_name,
             path=s3_location,
             columns_types=columns_types,
+            partitions_types=None if undated else {'dt': 'string'},
             sep='|',
             skip_header_line_count=1,
             table_type="EXTERNAL_TABLE",
-            parameters=table_properties
+            parameters=table_properties,
+            mode='overwrite',
+            athena_partition_projection_settings=None if undated else partition_projection(s3_location, projection_start),
+            boto3_session=boto3_session
         )
-        #print(f"Table {table_name} created successfully")
-        
-        # Count files in the location using correct method
-        paths = wr.s3.list_objects(s3_location)
-        csv_files = [path for path in paths if path.endswith('.csv')]
-        #print(f"Found {len(csv_files)} CSV files in the location")
-        
     except Exception as e:
         print(f"Error creating table {table_name}: {e}")
         raise
 
-def search_keys_in_range(
+# Create Athena table over Parquet manifests (--manifest-format parquet/both)
+def create_parquet_manifest_table(
+    database: str,
+    table_name: str,
+    bucket_name: str,
+    prefix: str,
+    workgroup: str = 'primary',
+    projection_start: str = PROJECTION_START,
+    boto3_session: Optional[boto3.Session] = None,
+    undated: bool = False
+) -> None:
+    """
+    Create Athena table for Parquet manifests; typed columns, only the queried columns are read
+    """
+    prefix = prefix.rstrip('/')
+    s3_location = f's3://{bucket_name}/{prefix}/manifests_parquet/'
+
+    columns_types = {
+        "tarname": "string",
+        "filename": "string",
+        "current_date": "timestamp",
+        "size": "bigint",
+        "start_byte": "bigint",
+        "stop_byte": "bigint",
+        "md5": "string"
+    }
+
+    try:
+        wr.catalog.create_parquet_table(
+            database=database,
+            table=table_name,
+            path=s3_location,
+            columns_types=columns_types,
+            partitions_types=None if undated else {'dt': 'string'},
+            table_type="EXTERNAL_TABLE",
+            compression="zstd",
+            parameters={LAYOUT_PARAMETER: str(undated).lower()},
+            mode='overwrite',
+            athena_partition_projection_settings=None if undated else partition_projection(s3_location, projection_start),
+            boto3_session=boto3_session
+        )
+    except Exception as e:
+        print(f"Error creating table {table_name}: {e}")
+        raise
+
+def ensure_manifest_table(
     database: str,
+    table_name: str,
+    bucket_name: str,
+    prefix: str,
+    manifest_format: str = 'csv',
+    workgroup: str = 'primary',
+    projection_start: str = PROJECTION_START,
+    replace: bool = False,
+    boto3_session: Optional[boto3.Session] = None,
+    undated: Optional[bool] = None,
+    s3_client=None
+) -> bool:
+    """
+    Create the persistent table on first use (or when replace is set) and return whether it is the
+    unpartitioned table of undated manifests. The layout is probed in S3 only when the table is created
+    and is recorded in a table parameter, which a search reads; a given undated recreates the table with it
+    """
+    if undated is None and not replace and wr.catalog.does_table_exist(
+            database=database, table=table_name, boto3_session=boto3_session):
+        recorded = wr.catalog.get_table_parameters(
+            database=database, table=table_name, boto3_session=boto3_session).get(LAYOUT_PARAMETER)
+        # Tables created before the layout was recorded are probed once and recreated
+        if recorded is not None:
+            return recorded == 'true'
+    if undated is None:
+        undated = has_undated_manifests(s3_client or s3, bucket_name, prefix, manifest_format)
+    create = create_parquet_manifest_table if manifest_format == 'parquet' else create_manifest_table
+    create(
+        database=database,
+        table_name=table_name,
+        bucket_name=bucket_name,
+        prefix=prefix,
+        workgroup=workgroup,
+        projection_start=projection_start,
+        boto3_session=boto3_session,
+        undated=undated,
+    )
+    return undated
+
+def partition_range(start_date: str, end_date: str) -> Tuple[str, str]:
+    """
+    First and last dt partition of a search; one extra day before the range because
+    the date directory is the day a run started and current_date can be later
+    """
+    first_partition = (datetime.strptime(start_date, '%Y-%m-%d') - timedelta(days=1)).strftime('%Y%m%d')
+    last_partition = datetime.strptime(end_date, '%Y-%m-%d').strftime('%Y%m%d')
+    return first_partition, last_partition
+
+def recent_partitions(
+    s3_client,
+    bucket_name: str,
+    base: str,
+    delimiter: str,
+    first_partition: str,
+    last_partition: str,
+    count: int = RECENT_PARTITIONS
+) -> List[str]:
+    """
+    The newest count common prefixes below base (one per day: date directories with '/',
+    undated manifest_{yyyyMMdd}_ runs with '_') whose date is in the partition range
+    """
+    recent = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=base, Delimiter=delimiter,
+                                   StartAfter=f"{base}{first_partition}"):
+        for common in page.get('CommonPrefixes', []):
+            if common['Prefix'][len(base):len(base) + 8] > last_partition:
+                return recent
+            recent = (recent + [common['Prefix']])[-count:]
+        # Keys sort after the days too: undated manifest_ keys come after every date directory
+        if any(obj['Key'][len(base):len(base) + 8] > last_partition for obj in page.get('Contents', [])):
+            return recent
+    return recent
+
+def manifest_fingerprint(
+    s3_client,
+    bucket_name: str,
+    prefix: str,
+    start_date: str,
+    end_date: str,
+    manifest_format: str = 'csv',
+    undated: bool = False
+) -> str:
+    """
+    Hash of the keys and ETags of the manifests of the newest days in the searched range (and of
+    the newest undated runs with undated); changes when manifests are added, replaced or compacted there.
+    Older days are found with one delimiter listing, one entry per day, and are not listed themselves
+    """
+    first_partition, last_partition = partition_range(start_date, end_date)
+    base = manifest_directory(prefix, manifest_format)
+    groups = recent_partitions(s3_client, bucket_name, base, '/', first_partition, last_partition)
+    if undated:
+        groups += recent_partitions(s3_client, bucket_name, f"{base}manifest_", '_', first_partition, last_partition)
+    digest = hashlib.md5()
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for group in groups:
+        digest.update(f"{group}\n".encode('utf-8'))
+        for page in paginator.paginate(Bucket=bucket_name, Prefix=group):
+            for obj in page.get('Contents', []):
+                key = obj['Key']
+                if key.rsplit('/', 1)[-1].startswith('_'):
+                    continue
+                digest.update(f"{key}|{obj['ETag']}\n".encode('utf-8'))
+    return digest.hexdigest()
+
+def keys_in_range_sql(
     table_name: str,
     key_name: str,
     start_date: str,
     end_date: str,
-    workgroup: str = 'primary'
-) -> Optional[List[Dict]]:
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    md5: Optional[str] = None,
+    undated: bool = False
+) -> str:
     """
-    Search for keys within a date range from the manifest table
+    SELECT of the manifest rows matching a key within a date range, ordered by tar;
+    the unpartitioned table of undated manifests has no dt column to prune on
     """
-    try:
-        # Construct query with parameters and column aliases
-        query = f"""
-        SELECT 
-            tarname AS tarfile_location,
-            filename AS filename,
-            start_byte AS start_byte,
-            stop_byte AS stop_byte,
-            current_date AS date
-        FROM {table_name}
-        WHERE filename LIKE '%{key_name}%'
-        AND current_date BETWEEN TIMESTAMP '{start_date} 00:00:00' 
-        AND TIMESTAMP '{end_date} 23:59:59'
-        ORDER BY tarname ASC
-        """
-        
-        # Execute query
-        df = wr.athena.read_sql_query(
+    first_partition, last_partition = partition_range(start_date, end_date)
+    partitions = '' if undated else f"dt BETWEEN '{first_partition}' AND '{last_partition}'\n    AND "
+    filters = ''
+    if min_size is not None:
+        filters += f"AND size >= {int(min_size)} "
+    if max_size is not None:
+        filters += f"AND size <= {int(max_size)} "
+    if md5:
+        filters += f"AND md5 = '{normalize_md5(md5)}' "
+
+    # Construct query with parameters and column aliases
+    return f"""
+    SELECT DISTINCT
+        tarname AS tarfile_location,
+        filename AS filename,
+        start_byte AS start_byte,
+        stop_byte AS stop_byte,
+        current_date AS date
+    FROM {table_name}
+    WHERE {partitions}filename LIKE '%{key_name}%'
+    AND current_date BETWEEN TIMESTAMP '{start_date} 00:00:00'
+    AND TIMESTAMP '{end_date} 23:59:59'
+    {filters}
+    ORDER BY tarname ASC
+    """
+
+def read_athena(
+    query: str,
+    database: str,
+    workgroup: str = 'primary',
+    boto3_session: Optional[boto3.Session] = None,
+    result_reuse_minutes: Optional[int] = None,
+    fingerprint: Optional[str] = None,
+    chunksize: Optional[int] = None
+) -> Union[pd.DataFrame, Iterator[pd.DataFrame]]:
+    """
+    Run a query; with chunksize, an iterator of DataFrames read from the result file as they are consumed
+    """
+    if not result_reuse_minutes and not chunksize:
+        return wr.athena.read_sql_query(
             sql=query,
             database=database,
-            workgroup=workgroup
+            workgroup=workgroup,
+            boto3_session=boto3_session
         )
-        
-        if df.empty:
+
+    # Athena reuses the results of an identical query string; the manifest
+    # fingerprint makes the string change as soon as the manifests do
+    reuse = None
+    if result_reuse_minutes:
+        if fingerprint:
+            query = f"-- manifests {fingerprint}\n{query}"
+        reuse = {'ResultReuseByAgeConfiguration': {'Enabled': True, 'MaxAgeInMinutes': int(result_reuse_minutes)}}
+    # Without CTAS the result is a single file in query order, which reuse and chunked reads both need
+    return wr.athena.read_sql_query(
+        sql=query,
+        database=database,
+        workgroup=workgroup,
+        boto3_session=boto3_session,
+        ctas_approach=False,
+        chunksize=chunksize,
+        result_reuse_configuration=reuse
+    )
+
+def query_keys_in_range(
+    database: str,
+    table_name: str,
+    key_name: str,
+    start_date: str,
+    end_date: str,
+    workgroup: str = 'primary',
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    boto3_session: Optional[boto3.Session] = None,
+    result_reuse_minutes: Optional[int] = None,
+    fingerprint: Optional[str] = None,
+    md5: Optional[str] = None,
+    undated: bool = False
+) -> pd.DataFrame:
+    """
+    Rows of the manifest table matching a key within a date range
+    """
+    query = keys_in_range_sql(table_name, key_name, start_date, end_date, min_size, max_size, md5, undated)
+    return read_athena(query, database, workgroup, boto3_session, result_reuse_minutes, fingerprint)
+
+def iter_keys_in_range(
+    database: str,
+    table_name: str,
+    key_name: str,
+    start_date: str,
+    end_date: str,
+    workgroup: str = 'primary',
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    page_size: int = PAGE_SIZE,
+    boto3_session: Optional[boto3.Session] = None,
+    result_reuse_minutes: Optional[int] = None,
+    fingerprint: Optional[str] = None,
+    md5: Optional[str] = None,
+    undated: bool = False
+) -> Iterator[pd.DataFrame]:
+    """
+    Same rows as query_keys_in_range, page_size rows at a time; memory does not grow with the result
+    """
+    query = keys_in_range_sql(table_name, key_name, start_date, end_date, min_size, max_size, md5, undated)
+    return read_athena(query, database, workgroup, boto3_session, result_reuse_minutes, fingerprint,
+                       chunksize=page_size)
+
+def count_keys_in_range(
+    database: str,
+    table_name: str,
+    key_name: str,
+    start_date: str,
+    end_date: str,
+    workgroup: str = 'primary',
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    boto3_session: Optional[boto3.Session] = None,
+    result_reuse_minutes: Optional[int] = None,
+    fingerprint: Optional[str] = None,
+    md5: Optional[str] = None,
+    undated: bool = False
+) -> int:
+    """
+    Number of rows query_keys_in_range would return, without transferring them
+    """
+    select = keys_in_range_sql(table_name, key_name, start_date, end_date, min_size, max_size, md5, undated)
+    query = f"SELECT COUNT(*) AS total FROM ({select.replace('ORDER BY tarname ASC', '')})"
+    df = read_athena(query, database, workgroup, boto3_session, result_reuse_minutes, fingerprint)
+    return int(df['total'].iloc[0])
+
+def search_keys_in_range(
+    database: str,
+    table_name: str,
+    key_name: str,
+    start_date: str,
+    end_date: str,
+    workgroup: str = 'primary',
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    result_reuse_minutes: Optional[int] = None,
+    fingerprint: Optional[str] = None,
+    page_size: int = PAGE_SIZE,
+    md5: Optional[str] = None,
+    undated: bool = False
+) -> Optional[int]:
+    """
+    Search for keys within a date range from the manifest table, printing each page as it is read
+    """
+    try:
+        pages = iter_keys_in_range(database, table_name, key_name, start_date, end_date, workgroup,
+                                   min_size, max_size, page_size, result_reuse_minutes=result_reuse_minutes,
+                                   fingerprint=fingerprint, md5=md5, undated=undated)
+        rows = 0
+        for df in pages:
+            # Print results in CSV format for web interface, numbered across pages
+            df.index = range(rows, rows + len(df))
+            df.to_csv(sys.stdout, sep='|', index=True,  header=False)
+            sys.stdout.flush()
+            rows += len(df)
+
+        if rows == 0:
             print(f"No records found for key '{key_name}' between {start_date} and {end_date}")
             return None
-        
-        # Convert DataFrame to list of dictionaries
-        #results = df.to_dict('records')
-        #print(f"\nFound {len(results)} matching records:")
-        # Print results in CSV format for web interface
-        df.to_csv(sys.stdout, sep='|', index=True,  header=False)
-        return df
-        
+        return rows
+
     except Exception as e:
         print(f"Error searching keys: {e}")
         return None
 
+def search_local_index(
+    index_path: str,
+    bucket_name: str,
+    prefix: str,
+    key_name: str,
+    start_date: str,
+    end_date: str,
+    sync: bool = True,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None
+) -> Optional[pd.DataFrame]:
+    """
+    Same search as search_keys_in_range, answered from a local trigram index (trigram_index.py)
+    """
+    from trigram_index import TrigramIndex
+
+    index = TrigramIndex(index_path)
+    try:
+        if sync:
+            index.sync(s3, bucket_name, prefix)
+        df = index.search(key_name, start_date, end_date, min_size, max_size)
+    finally:
+        index.close()
+
+    if df.empty:
+        print(f"No records found for key '{key_name}' between {start_date} and {end_date}")
+        return None
+    df.to_csv(sys.stdout, sep='|', index=True,  header=False)
+    return df
+
+def search_path_index(
+    index_path: str,
+    bucket_name: str,
+    prefix: str,
+    key_name: str,
+    start_date: str,
+    end_date: str,
+    sync: bool = True,
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    md5: Optional[str] = None
+) -> Optional[int]:
+    """
+    Content search (md5, sizes, name, dates) answered from a local path index (path_index.py)
+    """
+    index = PathIndex(index_path)
+    rows = 0
+    try:
+        if sync:
+            index.sync(s3, bucket_name, prefix)
+        for tar, filename, date, size, start_byte, stop_byte, _ in index.find(md5, min_size, max_size, key_name,
+                                                                              start_date, end_date):
+            print(f"{rows}|{tar}|{filename}|{start_byte}|{stop_byte}|{date}")
+            rows += 1
+    finally:
+        index.close()
+
+    if rows == 0:
+        print(f"No records found for key '{key_name}' between {start_date} and {end_date}")
+        return None
+    return rows
+
 def parse_arguments():
     parser = argparse.ArgumentParser(description='Search S3 CSV files')
     parser.add_argument('--bucket', required=True, help='S3 bucket name')
     parser.add_argument('--prefix', help='S3 prefix for CSV files')
-    parser.add_argument('--search_value', required=True, help='Search value for keyword search)')
+    parser.add_argument('--search_value', default='', help='Search value for keyword search (default: any name)')
     parser.add_argument('--start_value', required=True, help='start_datefor date search')
     parser.add_argument('--end_value', required=True, help='End value for date search')
+    parser.add_argument('--manifest_format', choices=['csv', 'parquet'], default='csv',
+                        help='Search the CSV manifests or the Parquet manifests (manifests_parquet/)')
+    parser.add_argument('--setup_table', action='store_true',
+                        help='Create (or replace) the partition-projected manifest table, then search')
+    parser.add_argument('--projection_start', default=PROJECTION_START,
+                        help='First date (yyyyMMdd) of the projected date partitions, used with --setup_table')
+    parser.add_argument('--min_size', type=int, default=None, help='Smallest file size in bytes')
+    parser.add_argument('--max_size', type=int, default=None, help='Largest file size in bytes')
+    parser.add_argument('--md5', default=None, help='Only files with this content (every archived copy)')
+    parser.add_argument('--local_index', help='Search a local trigram index directory instead of Athena')
+    parser.add_argument('--path_index', help='Search a local path index file (path_index.py) instead of Athena; '
+                                             'md5 lookups are point queries')
+    parser.add_argument('--no_sync', action='store_true',
+                        help='With --local_index or --path_index, search without fetching new manifests first')
+    parser.add_argument('--result_reuse_minutes', type=int, default=0,
+                        help='Reuse the Athena results of the same search for up to N minutes while the manifests are unchanged (0 disables)')
+    parser.add_argument('--page_size', type=int, default=PAGE_SIZE,
+                        help='Rows read from the Athena result and printed at a time')
     return parser.parse_args()
 
 # Main execution
 if __name__ == "__main__":
     args = parse_arguments()
 
+    if args.path_index:
+        try:
+            search_path_index(
+                index_path=args.path_index,
+                bucket_name=args.bucket,
+                prefix=args.prefix,
+                key_name=args.search_value,
+                start_date=args.start_value,
+                end_date=args.end_value,
+                sync=not args.no_sync,
+                min_size=args.min_size,
+                max_size=args.max_size,
+                md5=args.md5,
+            )
+        except ValueError as e:
+            # The index holds another bucket or prefix
+            sys.exit(str(e))
+        sys.exit(0)
+
+    if args.md5 and args.local_index:
+        sys.exit("The trigram index has no md5 column; use --path_index or Athena for --md5")
+
+    if args.local_index:
+        try:
+            search_local_index(
+                index_path=args.local_index,
+                bucket_name=args.bucket,
+                prefix=args.prefix,
+                key_name=args.search_value,
+                start_date=args.start_value,
+                end_date=args.end_value,
+                sync=not args.no_sync,
+                min_size=args.min_size,
+                max_size=args.max_size,
+            )
+        except ValueError as e:
+            # The index holds another bucket or prefix
+            sys.exit(str(e))
+        sys.exit(0)
+
     # Define global variables
     DATABASE="default"
-    TABLE_NAME="SFAS_Manifests_Table"
+    TABLE_NAME=manifest_table_name(args.bucket, args.prefix, args.manifest_format)
     WORKGROUP = "primary"
     
-    # Create manifest table 
-    create_manifest_table(
+    # Manifest table: created once, reused by every search; undated manifests (s3archiver.py)
+    # are only read by an unpartitioned table, as recorded in the table
+    UNDATED = ensure_manifest_table(
         database=DATABASE,
         table_name=TABLE_NAME,
         bucket_name=args.bucket,
         prefix=args.prefix,
+        manifest_format=args.manifest_format,
         workgroup=WORKGROUP,
+        projection_start=args.projection_start,
+        replace=args.setup_table,
         )
+    fingerprint = None
+    if args.result_reuse_minutes:
+        fingerprint = manifest_fingerprint(s3, args.bucket, args.prefix, args.start_value, args.end_value,
+                                           args.manifest_format, UNDATED)
     # Get results
     result = search_keys_in_range(
         database=DATABASE,
@@ -160,6 +624,13 @@ if __name__ == "__main__":
         start_date=args.start_value,
         end_date=args.end_value,
         workgroup=WORKGROUP,
+        min_size=args.min_size,
+        max_size=args.max_size,
+        result_reuse_minutes=args.result_reuse_minutes,
+        fingerprint=fingerprint,
+        page_size=args.page_size,
+        md5=args.md5,
+        undated=UNDATED,
     )
 
 
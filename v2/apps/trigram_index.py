@@ -0,0 +1,548 @@
+"""
+Local substring index over archived file names.
+
+search.py matches files with `filename LIKE '%key%'`, which makes Athena scan
+every manifest row of the date range. This index answers the same question
+locally: a trigram inverted index over the file names of the CSV manifests
+under {prefix}/manifests/, with the manifest row fields needed to filter by
+date and size and to print the search result.
+
+Layout of the index directory:
+    state.db                  bucket and prefix indexed, manifests (key, ETag, segment), retired manifest ids
+    segments/{name}/          one immutable segment per sync, every file a .npy opened memory-mapped
+        paths.npy, paths_offsets.npy   distinct file names (UTF-8, concatenated) in sorted order
+        tars.npy, tars_offsets.npy     distinct tar keys
+        rows.npy                       manifest rows (path, tar, manifest, date, size, start, stop), by path
+        trigrams.npy                   distinct trigrams of the file names (3 UTF-8 bytes as one integer)
+        postings_offsets.npy, postings.npy   sorted path ids of each trigram
+
+A sync reads only manifests that are new or whose ETag changed (parallel GETs)
+into new segments of at most SEGMENT_ROWS rows each; rows of changed or deleted
+manifests are dropped at query time and for good at the next merge. Segments
+are merged once there are more than MAX_SEGMENTS. A merge is a k-way merge of
+the sorted segments, written MERGE_ROWS rows (or postings) at a time, so
+neither a sync nor a merge holds the whole index in memory.
+
+A query is a LIKE pattern ('%' and '_' are wildcards as in Athena). The
+trigrams of its literal parts select candidate file names, which are then
+checked against the pattern itself, so the result is the rows Athena returns.
+
+Usage:
+    python3 trigram_index.py --index ./index --bucket my-bucket --prefix archive1
+    python3 trigram_index.py --index ./index --bucket my-bucket --prefix archive1 --search file0001 \\
+        --start 2025-01-01 --end 2025-01-31
+"""
+import argparse
+import concurrent.futures
+import heapq
+import os
+import re
+import shutil
+import sqlite3
+import sys
+from datetime import datetime
+
+import boto3
+import numpy as np
+import pandas as pd
+
+from dedup_index import is_csv_manifest, manifest_rows_text
+from manifest_parquet import DATE_FORMATS
+
+MAX_SEGMENTS = 16
+# Rows parsed into one segment by a sync, and rows or postings a merge holds at once
+SEGMENT_ROWS = 1000000
+MERGE_ROWS = 4000000
+EPOCH = datetime(1970, 1, 1)
+NO_DATE = np.iinfo(np.int64).min
+ROW_DTYPE = np.dtype([
+    ('path', '<u4'), ('tar', '<u4'), ('manifest', '<u4'),
+    ('date', '<i8'), ('size', '<i8'), ('start', '<i8'), ('stop', '<i8'),
+])
+RESULT_COLUMNS = ['tarfile_location', 'filename', 'start_byte', 'stop_byte', 'date']
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS manifests (
+    key TEXT PRIMARY KEY,
+    etag TEXT,
+    manifest_id INTEGER NOT NULL,
+    segment TEXT,
+    rows INTEGER
+);
+CREATE TABLE IF NOT EXISTS retired (
+    manifest_id INTEGER PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS source (
+    bucket TEXT NOT NULL,
+    prefix TEXT NOT NULL
+);
+"""
+
+
+def check_source(conn, bucket, prefix):
+    """
+    Tie an index to one bucket and prefix: a sync against another would retire every manifest
+    it holds. The first sync records them; ValueError on a mismatch
+    """
+    prefix = prefix.strip('/')
+    row = conn.execute('SELECT bucket, prefix FROM source').fetchone()
+    if row is None:
+        with conn:
+            conn.execute('INSERT INTO source VALUES (?, ?)', (bucket, prefix))
+    elif row != (bucket, prefix):
+        raise ValueError(f"Index holds s3://{row[0]}/{row[1]}, not s3://{bucket}/{prefix}: use another index")
+
+
+def parse_date(value, cache):
+    """Seconds since the epoch for a manifest date in any archiver format; NO_DATE if it does not parse"""
+    if value not in cache:
+        cache[value] = NO_DATE
+        for fmt in DATE_FORMATS:
+            try:
+                cache[value] = int((datetime.strptime(value, fmt) - EPOCH).total_seconds())
+                break
+            except ValueError:
+                continue
+    return cache[value]
+
+
+def date_seconds(value, end_of_day=False):
+    """Seconds since the epoch for a YYYY-MM-DD search bound, inclusive of the whole day for the end"""
+    seconds = int((datetime.strptime(value, '%Y-%m-%d') - EPOCH).total_seconds())
+    return seconds + 86399 if end_of_day else seconds
+
+
+def trigrams(data):
+    """Distinct trigrams of a byte string as integers"""
+    if len(data) < 3:
+        return np.empty(0, dtype=np.uint32)
+    b = np.frombuffer(data, dtype=np.uint8).astype(np.uint32)
+    return np.unique((b[:-2] << 16) | (b[1:-1] << 8) | b[2:])
+
+
+def like_regex(pattern):
+    """Compiled bytes regex with the semantics of SQL `LIKE '%pattern%'` on UTF-8 file names"""
+    # '_' is one character, which is one to four bytes in UTF-8
+    parts = (rb'(?:[\x00-\x7f]|[\xc0-\xff][\x80-\xbf]*)' if c == '_' else rb'.*' if c == '%'
+             else re.escape(c.encode('utf-8')) for c in pattern)
+    return re.compile(b''.join(parts), re.DOTALL)
+
+
+def literal_parts(pattern):
+    """Runs of the pattern without wildcards; a match contains each of them"""
+    return [part for part in re.split('[%_]', pattern) if part]
+
+
+def save_strings(directory, name, strings):
+    """Store strings as one UTF-8 byte array and an offsets array"""
+    encoded = [s.encode('utf-8') for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    np.save(os.path.join(directory, f'{name}.npy'), np.frombuffer(b''.join(encoded), dtype=np.uint8))
+    np.save(os.path.join(directory, f'{name}_offsets.npy'), offsets)
+
+
+class Segment:
+    def __init__(self, directory):
+        self.name = os.path.basename(directory)
+
+        def load(name):
+            return np.load(os.path.join(directory, f'{name}.npy'), mmap_mode='r')
+        self.paths, self.paths_offsets = load('paths'), load('paths_offsets')
+        self.tars, self.tars_offsets = load('tars'), load('tars_offsets')
+        self.rows = load('rows')
+        self.trigrams, self.postings_offsets, self.postings = load('trigrams'), load('postings_offsets'), load('postings')
+
+    def path(self, i):
+        return bytes(self.paths[self.paths_offsets[i]:self.paths_offsets[i + 1]]).decode('utf-8')
+
+    def tar(self, i):
+        return bytes(self.tars[self.tars_offsets[i]:self.tars_offsets[i + 1]]).decode('utf-8')
+
+    def candidates(self, pattern):
+        """Path ids that contain every trigram of the literal parts of a pattern; None if it has none"""
+        wanted = np.unique(np.concatenate(
+            [trigrams(part.encode('utf-8')) for part in literal_parts(pattern)] or [np.empty(0, dtype=np.uint32)]))
+        if not len(wanted):
+            return None
+        positions = np.searchsorted(self.trigrams, wanted)
+        if (positions >= len(self.trigrams)).any() or (self.trigrams[positions] != wanted).any():
+            return np.empty(0, dtype=np.uint32)
+        lists = sorted((self.postings[self.postings_offsets[p]:self.postings_offsets[p + 1]] for p in positions), key=len)
+        result = np.asarray(lists[0])
+        for posting in lists[1:]:
+            result = np.intersect1d(result, posting, assume_unique=True)
+            if not len(result):
+                break
+        return result
+
+    def search(self, regex, pattern):
+        """Rows whose file name matches the LIKE pattern (compiled as regex)"""
+        ids = self.candidates(pattern)
+        if ids is None:
+            ids = np.arange(len(self.paths_offsets) - 1, dtype=np.uint32)
+        # Check the candidates against the pattern on the mapped bytes, without decoding them
+        names = memoryview(self.paths)
+        starts, stops = self.paths_offsets[ids].tolist(), self.paths_offsets[ids + 1].tolist()
+        matched = np.array([i for i, start, stop in zip(ids.tolist(), starts, stops)
+                            if regex.search(names[start:stop])], dtype=np.uint32)
+        if not len(matched):
+            return self.rows[:0]
+        # Rows are sorted by path: gather the row range of every matched path at once
+        first = np.searchsorted(self.rows['path'], matched, side='left')
+        counts = np.searchsorted(self.rows['path'], matched, side='right') - first
+        shift = np.repeat(first - (np.cumsum(counts) - counts), counts)
+        return self.rows[shift + np.arange(counts.sum())]
+
+
+def build_segment(directory, rows):
+    """Write a segment for [(tar, filename, manifest_id, date, size, start, stop)]"""
+    os.makedirs(directory)
+    paths = sorted({row[1] for row in rows})
+    tars = sorted({row[0] for row in rows})
+    path_ids = {p: i for i, p in enumerate(paths)}
+    tar_ids = {t: i for i, t in enumerate(tars)}
+
+    table = np.array([(path_ids[r[1]], tar_ids[r[0]]) + tuple(r[2:]) for r in rows], dtype=ROW_DTYPE)
+    table.sort(order=['path', 'tar', 'start'])
+    np.save(os.path.join(directory, 'rows.npy'), table)
+    save_strings(directory, 'paths', paths)
+    save_strings(directory, 'tars', tars)
+
+    # Inverted index: (trigram, path id) pairs sorted by trigram, then path id
+    per_path = [trigrams(p.encode('utf-8')) for p in paths]
+    codes = np.concatenate(per_path) if per_path else np.empty(0, dtype=np.uint32)
+    ids = np.repeat(np.arange(len(paths), dtype=np.uint32), [len(t) for t in per_path])
+    order = np.lexsort((ids, codes))
+    codes, ids = codes[order], ids[order]
+    keys, starts = np.unique(codes, return_index=True)
+    offsets = np.append(starts, len(codes)).astype(np.uint64)
+    np.save(os.path.join(directory, 'trigrams.npy'), keys.astype(np.uint32))
+    np.save(os.path.join(directory, 'postings_offsets.npy'), offsets)
+    np.save(os.path.join(directory, 'postings.npy'), ids)
+
+
+class NpyWriter:
+    """An .npy file written in chunks; the data goes to a temporary file until close() knows the length"""
+
+    def __init__(self, path, dtype):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self._raw = open(path + '.part', 'wb')
+
+    def append(self, array):
+        array = np.ascontiguousarray(array, dtype=self.dtype)
+        self._raw.write(array.tobytes())
+        self.count += len(array)
+
+    def close(self):
+        self._raw.close()
+        header = {'descr': np.lib.format.dtype_to_descr(self.dtype), 'fortran_order': False, 'shape': (self.count,)}
+        with open(self.path, 'wb') as out, open(self.path + '.part', 'rb') as raw:
+            np.lib.format.write_array_header_1_0(out, header)
+            shutil.copyfileobj(raw, out, 1 << 20)
+        os.remove(self.path + '.part')
+
+
+def merge_strings(directory, name, sources):
+    """
+    Write the sorted union of the strings of segments [(blob, offsets, alive)], keeping those flagged
+    alive; per source, the new id of each old id, non-decreasing so that sorted ids stay sorted
+    """
+    maps = [np.zeros(len(offsets) - 1, dtype=np.uint32) for _, offsets, _ in sources]
+
+    def entries(source):
+        blob, offsets, alive = sources[source]
+        view = memoryview(blob)
+        for first in range(0, len(alive), MERGE_ROWS):
+            ids = np.flatnonzero(alive[first:first + MERGE_ROWS]) + first
+            starts, stops = offsets[ids].tolist(), offsets[ids + 1].tolist()
+            for i, start, stop in zip(ids.tolist(), starts, stops):
+                yield bytes(view[start:stop]), source, i
+
+    blob = NpyWriter(os.path.join(directory, f'{name}.npy'), np.uint8)
+    ends = NpyWriter(os.path.join(directory, f'{name}_offsets.npy'), np.uint64)
+    ends.append([0])
+    pending, pending_ends = bytearray(), []
+    last, new_id, size = None, -1, 0
+    # UTF-8 byte order is code point order, the order build_segment sorts strings in
+    for value, source, old_id in heapq.merge(*(entries(i) for i in range(len(sources)))):
+        if value != last:
+            new_id += 1
+            size += len(value)
+            pending += value
+            pending_ends.append(size)
+            last = value
+            if len(pending_ends) >= MERGE_ROWS:
+                blob.append(np.frombuffer(bytes(pending), dtype=np.uint8))
+                ends.append(pending_ends)
+                pending, pending_ends = bytearray(), []
+        maps[source][old_id] = new_id
+    blob.append(np.frombuffer(bytes(pending), dtype=np.uint8))
+    ends.append(pending_ends)
+    blob.close()
+    ends.close()
+    # Dropped strings take the id before them, which keeps the maps non-decreasing
+    return [np.maximum.accumulate(m) if len(m) else m for m in maps], new_id + 1
+
+
+def merge_segments(directory, segments, retired):
+    """Write one segment with the rows of segments not in retired manifests, streamed; its row count"""
+    os.makedirs(directory)
+    # Paths and tars still referenced by a live row
+    alive_paths = [np.zeros(len(seg.paths_offsets) - 1, dtype=bool) for seg in segments]
+    alive_tars = [np.zeros(len(seg.tars_offsets) - 1, dtype=bool) for seg in segments]
+    total = 0
+    for seg, paths, tars in zip(segments, alive_paths, alive_tars):
+        for first in range(0, len(seg.rows), MERGE_ROWS):
+            chunk = seg.rows[first:first + MERGE_ROWS]
+            chunk = chunk[~np.isin(chunk['manifest'], retired)]
+            paths[chunk['path']] = True
+            tars[chunk['tar']] = True
+            total += len(chunk)
+    path_maps, path_count = merge_strings(
+        directory, 'paths', [(seg.paths, seg.paths_offsets, alive) for seg, alive in zip(segments, alive_paths)])
+    tar_maps, _ = merge_strings(
+        directory, 'tars', [(seg.tars, seg.tars_offsets, alive) for seg, alive in zip(segments, alive_tars)])
+
+    # Rows: each segment is sorted by path, and the maps keep that order, so a range of new
+    # path ids is one slice of every segment
+    rows = NpyWriter(os.path.join(directory, 'rows.npy'), ROW_DTYPE)
+    bounds = np.linspace(0, path_count, -(-total // MERGE_ROWS) + 1).astype(np.int64)
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        parts = []
+        for seg, path_map, tar_map in zip(segments, path_maps, tar_maps):
+            first, last = np.searchsorted(seg.rows['path'], np.searchsorted(path_map, [low, high]))
+            part = seg.rows[first:last]
+            part = part[~np.isin(part['manifest'], retired)]
+            part['path'], part['tar'] = path_map[part['path']], tar_map[part['tar']]
+            parts.append(part)
+        window = np.concatenate(parts) if parts else np.empty(0, dtype=ROW_DTYPE)
+        window.sort(order=['path', 'tar', 'start'])
+        rows.append(window)
+    rows.close()
+
+    # Postings: windows of trigram codes holding about MERGE_ROWS postings each
+    codes = np.concatenate([np.asarray(seg.trigrams) for seg in segments])
+    counts = np.concatenate([np.diff(seg.postings_offsets) for seg in segments])
+    order = np.argsort(codes, kind='stable')
+    codes, cumulative = codes[order], np.cumsum(counts[order])
+    cuts = codes[np.searchsorted(cumulative, np.arange(MERGE_ROWS, cumulative[-1] if len(cumulative) else 0,
+                                                       MERGE_ROWS))]
+    bounds = np.unique(np.concatenate([[0], cuts, [1 << 24]]).astype(np.int64))
+    keys = NpyWriter(os.path.join(directory, 'trigrams.npy'), np.uint32)
+    offsets = NpyWriter(os.path.join(directory, 'postings_offsets.npy'), np.uint64)
+    postings = NpyWriter(os.path.join(directory, 'postings.npy'), np.uint32)
+    offsets.append([0])
+    written = 0
+    for low, high in zip(bounds[:-1], bounds[1:]):
+        pairs = []
+        for seg, path_map, alive in zip(segments, path_maps, alive_paths):
+            first, last = np.searchsorted(seg.trigrams, [low, high])
+            ids = np.asarray(seg.postings[seg.postings_offsets[first]:seg.postings_offsets[last]])
+            window_codes = np.repeat(np.asarray(seg.trigrams[first:last]).astype(np.uint64),
+                                     np.diff(seg.postings_offsets[first:last + 1]).astype(np.int64))
+            keep = alive[ids]
+            pairs.append((window_codes[keep] << np.uint64(32)) | path_map[ids[keep]].astype(np.uint64))
+        # A path in several segments is one posting
+        pairs = np.unique(np.concatenate(pairs)) if pairs else np.empty(0, dtype=np.uint64)
+        window_keys, window_counts = np.unique(pairs >> np.uint64(32), return_counts=True)
+        keys.append(window_keys)
+        offsets.append(written + np.cumsum(window_counts))
+        postings.append(pairs & np.uint64(0xffffffff))
+        written += len(pairs)
+    for writer in (keys, offsets, postings):
+        writer.close()
+    return total
+
+
+class TrigramIndex:
+    def __init__(self, path, logger=None):
+        self.path = path
+        self.logger = logger
+        os.makedirs(os.path.join(path, 'segments'), exist_ok=True)
+        self._conn = sqlite3.connect(os.path.join(path, 'state.db'), check_same_thread=False)
+        self._conn.executescript(SCHEMA)
+        self._load()
+
+    def _load(self):
+        names = sorted(name for name, in self._conn.execute(
+            'SELECT DISTINCT segment FROM manifests WHERE segment IS NOT NULL'))
+        self.segments = [Segment(os.path.join(self.path, 'segments', name)) for name in names]
+        self.retired = np.array(sorted(m for m, in self._conn.execute('SELECT manifest_id FROM retired')),
+                                dtype=np.uint32)
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(message)
+
+    def sync(self, s3_client, bucket, prefix, max_workers=16):
+        """Index the manifests under {prefix}/manifests/ that are new or changed; returns (manifests, rows, retired)"""
+        check_source(self._conn, bucket, prefix)
+        listed = {}
+        paginator = s3_client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=bucket, Prefix=f"{prefix.rstrip('/')}/manifests/"):
+            for obj in page.get('Contents', []):
+                if is_csv_manifest(obj['Key']):
+                    listed[obj['Key']] = obj.get('ETag')
+        known = {key: (etag, manifest_id) for key, etag, manifest_id in
+                 self._conn.execute('SELECT key, etag, manifest_id FROM manifests')}
+        changed = [key for key, etag in listed.items() if key not in known or known[key][0] != etag]
+        gone = [known[key][1] for key in known if key not in listed]
+        gone += [known[key][1] for key in changed if key in known]
+        # Ids of retired manifests stay reserved until their rows are merged away
+        next_id = max(self._conn.execute('SELECT MAX(manifest_id) FROM manifests').fetchone()[0] or 0,
+                      self._conn.execute('SELECT MAX(manifest_id) FROM retired').fetchone()[0] or 0) + 1
+
+        def fetch(key):
+            obj = s3_client.get_object(Bucket=bucket, Key=key)
+            return key, obj.get('ETag'), manifest_rows_text(obj['Body'].read(), key)
+
+        def fetch_all(executor):
+            # A bounded number of manifests in flight; executor.map alone would read them all ahead
+            window = max_workers * 4
+            for first in range(0, len(changed), window):
+                yield from executor.map(fetch, changed[first:first + window])
+
+        # Manifests of the rows not yet written, written as one segment every SEGMENT_ROWS rows
+        rows, pending, entries, dates = [], [], [], {}
+        total = 0
+
+        def flush():
+            segment = None
+            if rows:
+                segment = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+                build_segment(os.path.join(self.path, 'segments', segment), rows)
+            entries.extend((key, etag, manifest_id, segment if count else None, count)
+                           for key, etag, manifest_id, count in pending)
+            rows.clear()
+            pending.clear()
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for manifest_id, (key, etag, text) in enumerate(fetch_all(executor), next_id):
+                count = 0
+                for line in text.splitlines()[1:]:
+                    parts = line.split('|')
+                    if len(parts) < 7:
+                        continue
+                    # File names may contain the delimiter: the tar is first, the other fields last
+                    try:
+                        size, start, stop = int(parts[-4]), int(parts[-3]), int(parts[-2])
+                    except ValueError:
+                        continue
+                    rows.append((parts[0], '|'.join(parts[1:-5]), manifest_id,
+                                 parse_date(parts[-5], dates), size, start, stop))
+                    count += 1
+                pending.append((key, etag, manifest_id, count))
+                total += count
+                if len(rows) >= SEGMENT_ROWS:
+                    flush()
+        flush()
+
+        with self._conn:
+            self._conn.executemany('INSERT OR IGNORE INTO retired VALUES (?)', [(m,) for m in gone])
+            self._conn.executemany('DELETE FROM manifests WHERE key = ?',
+                                   [(k,) for k in known if k not in listed or k in changed])
+            self._conn.executemany('INSERT INTO manifests VALUES (?, ?, ?, ?, ?)', entries)
+        self._load()
+        self._log(f"Trigram index {self.path}: {total:,} rows from {len(changed):,} manifests, "
+                  f"{len(gone):,} manifests retired")
+        if len(self.segments) > MAX_SEGMENTS:
+            self.merge()
+        return len(changed), total, len(gone)
+
+    def merge(self):
+        """Rewrite all segments as one, dropping the rows of retired manifests"""
+        if len(self.segments) < 2 and not len(self.retired):
+            return
+        old = [segment.name for segment in self.segments]
+        name = datetime.now().strftime('%Y%m%d_%H%M%S_%f')
+        directory = os.path.join(self.path, 'segments', name)
+        rows = merge_segments(directory, self.segments, self.retired)
+        if not rows:
+            shutil.rmtree(directory, ignore_errors=True)
+        with self._conn:
+            self._conn.execute(f"UPDATE manifests SET segment = ? WHERE segment IN ({', '.join('?' * len(old))})",
+                               [name if rows else None] + old)
+            self._conn.execute('DELETE FROM retired')
+        self._load()
+        for segment in old:
+            shutil.rmtree(os.path.join(self.path, 'segments', segment), ignore_errors=True)
+        self._log(f"Trigram index {self.path}: merged {len(old)} segments, {rows:,} rows")
+
+    def segment_rows(self, segment, rows=None):
+        rows = segment.rows if rows is None else rows
+        if len(self.retired):
+            rows = rows[~np.isin(rows['manifest'], self.retired)]
+        return rows
+
+    def search(self, pattern, start_date=None, end_date=None, min_size=None, max_size=None):
+        """DataFrame of the rows search.py would return for `filename LIKE '%pattern%'` and the filters"""
+        regex = like_regex(pattern)
+        frames = []
+        for segment in self.segments:
+            rows = self.segment_rows(segment, segment.search(regex, pattern))
+            if start_date:
+                rows = rows[rows['date'] >= date_seconds(start_date)]
+            if end_date:
+                rows = rows[rows['date'] <= date_seconds(end_date, end_of_day=True)]
+            if min_size is not None:
+                rows = rows[rows['size'] >= min_size]
+            if max_size is not None:
+                rows = rows[rows['size'] <= max_size]
+            if not len(rows):
+                continue
+            tar_ids, tar_rows = np.unique(rows['tar'], return_inverse=True)
+            path_ids, path_rows = np.unique(rows['path'], return_inverse=True)
+            frames.append(pd.DataFrame({
+                'tarfile_location': np.array([segment.tar(i) for i in tar_ids], dtype=object)[tar_rows],
+                'filename': np.array([segment.path(i) for i in path_ids], dtype=object)[path_rows],
+                'start_byte': rows['start'],
+                'stop_byte': rows['stop'],
+                # NO_DATE is the NaT value of datetime64
+                'date': rows['date'].astype('datetime64[s]'),
+            }))
+        if not frames:
+            return pd.DataFrame(columns=RESULT_COLUMNS)
+        df = pd.concat(frames, ignore_index=True).drop_duplicates()
+        return df.sort_values(['tarfile_location', 'filename', 'start_byte'], ignore_index=True)
+
+    def close(self):
+        self._conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query a local substring index of archived file names')
+    parser.add_argument('--index', required=True, help='Index directory (created if missing)')
+    parser.add_argument('--bucket', help='S3 bucket holding the archives; sync the index when given')
+    parser.add_argument('--prefix', help='Archive prefix (the --dst-prefix of the archiver)')
+    parser.add_argument('--max-workers', type=int, default=16, help='Parallel manifest downloads')
+    parser.add_argument('--merge', action='store_true', help='Merge all segments into one')
+    parser.add_argument('--search', help="Substring (LIKE pattern) to look up after the sync")
+    parser.add_argument('--start', help='First date (YYYY-MM-DD)')
+    parser.add_argument('--end', help='Last date (YYYY-MM-DD)')
+    parser.add_argument('--min-size', type=int, default=None, help='Smallest file size in bytes')
+    parser.add_argument('--max-size', type=int, default=None, help='Largest file size in bytes')
+    parser.add_argument('--profile-name', default=None, help='AWS profile name')
+    parser.add_argument('--endpoint', default=None, help='endpoint_url')
+    args = parser.parse_args()
+
+    index = TrigramIndex(args.index)
+    if args.bucket:
+        s3_client = boto3.Session(profile_name=args.profile_name).client('s3', endpoint_url=args.endpoint)
+        try:
+            manifests, rows, retired = index.sync(s3_client, args.bucket, args.prefix, args.max_workers)
+        except ValueError as e:
+            parser.error(str(e))
+        print(f"s3://{args.bucket}/{args.prefix}: {rows:,} rows from {manifests:,} manifests, {retired:,} retired")
+    if args.merge:
+        index.merge()
+    if args.search is not None:
+        df = index.search(args.search, args.start, args.end, args.min_size, args.max_size)
+        df.to_csv(sys.stdout, sep='|', index=True, header=False)
+    index.close()
+
+
+if __name__ == '__main__':
+    main()
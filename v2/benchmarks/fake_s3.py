@@ -0,0 +1,491 @@
+"""
+Filesystem-backed S3 stand-in for offline benchmarks.
+
+Serves the subset of the S3 REST API the archivers, search and restore use
+(path-style addressing): CreateBucket, HeadBucket, ListObjectsV2, GetObject
+(with Range), HeadObject, PutObject, CopyObject, DeleteObject, DeleteObjects and
+multipart uploads.
+Objects are plain files under {root}/{bucket}/{key}, so a source bucket can
+be seeded by copying or hard-linking a local tree, and the server keeps no
+object data in memory. Signatures are not checked.
+
+Usage:
+    python3 fake_s3.py --root /tmp/fake-s3 --port 5055
+    python3 ../apps/fss3-archiver.py ... --endpoint http://localhost:5055
+"""
+import argparse
+import hashlib
+import os
+import shutil
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from xml.etree import ElementTree
+from xml.sax.saxutils import escape
+
+_UPLOADS_DIR = '.uploads'
+_XMLNS = 'http://s3.amazonaws.com/doc/2006-03-01/'
+
+
+class ObjectStore:
+    """Buckets and objects stored as directories and files"""
+
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        os.makedirs(os.path.join(self.root, _UPLOADS_DIR), exist_ok=True)
+        self._lock = threading.Lock()
+        self._etags = {}  # path -> (mtime_ns, size, etag)
+        self._key_cache = {}  # bucket -> sorted keys, dropped on every write
+
+    def bucket_path(self, bucket):
+        return os.path.join(self.root, bucket)
+
+    def object_path(self, bucket, key):
+        path = os.path.normpath(os.path.join(self.root, bucket, key))
+        if not path.startswith(self.bucket_path(bucket) + os.sep):
+            raise ValueError(f"Invalid key: {key}")
+        return path
+
+    def bucket_exists(self, bucket):
+        return bucket != _UPLOADS_DIR and os.path.isdir(self.bucket_path(bucket))
+
+    def create_bucket(self, bucket):
+        os.makedirs(self.bucket_path(bucket), exist_ok=True)
+
+    def etag(self, path, stat=None):
+        """MD5 ETag, computed once per file version"""
+        stat = stat or os.stat(path)
+        with self._lock:
+            cached = self._etags.get(path)
+        if cached and cached[0] == stat.st_mtime_ns and cached[1] == stat.st_size:
+            return cached[2]
+        md5 = hashlib.md5()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b''):
+                md5.update(chunk)
+        etag = md5.hexdigest()
+        with self._lock:
+            self._etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+        return etag
+
+    def _remember(self, bucket, path, etag):
+        stat = os.stat(path)
+        with self._lock:
+            self._etags[path] = (stat.st_mtime_ns, stat.st_size, etag)
+            self._key_cache.pop(bucket, None)
+
+    def put(self, bucket, key, body):
+        path = self.object_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(body)
+        os.replace(tmp_path, path)
+        etag = hashlib.md5(body).hexdigest()
+        self._remember(bucket, path, etag)
+        return etag
+
+    def copy(self, src_bucket, src_key, bucket, key):
+        """Copy an object; its ETag, or KeyError if the source does not exist"""
+        src = self.object_path(src_bucket, src_key)
+        if not os.path.isfile(src):
+            raise KeyError(src_key)
+        path = self.object_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(src, tmp_path)
+        os.replace(tmp_path, path)
+        etag = self.etag(src)
+        self._remember(bucket, path, etag)
+        return etag
+
+    def delete(self, bucket, key):
+        path = self.object_path(bucket, key)
+        if os.path.exists(path):
+            os.remove(path)
+        with self._lock:
+            self._etags.pop(path, None)
+            self._key_cache.pop(bucket, None)
+
+    def keys(self, bucket):
+        """All keys of a bucket in S3 (lexicographic) order"""
+        with self._lock:
+            cached = self._key_cache.get(bucket)
+        if cached is not None:
+            return cached
+        base = self.bucket_path(bucket)
+        keys = []
+        for dirpath, _, filenames in os.walk(base):
+            rel_dir = os.path.relpath(dirpath, base)
+            for name in filenames:
+                if name.endswith('.tmp'):
+                    continue
+                keys.append(name if rel_dir == '.' else f"{rel_dir.replace(os.sep, '/')}/{name}")
+        keys.sort()
+        with self._lock:
+            self._key_cache[bucket] = keys
+        return keys
+
+    # Multipart uploads: parts are files under {root}/.uploads/{upload_id}/
+    def create_upload(self, bucket, key):
+        upload_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root, _UPLOADS_DIR, upload_id))
+        return upload_id
+
+    def put_part(self, upload_id, part_number, body):
+        part_dir = os.path.join(self.root, _UPLOADS_DIR, upload_id)
+        if not os.path.isdir(part_dir):
+            raise KeyError(upload_id)
+        with open(os.path.join(part_dir, f"{part_number:05d}"), 'wb') as f:
+            f.write(body)
+        return hashlib.md5(body).hexdigest()
+
+    def complete_upload(self, bucket, key, upload_id, part_numbers):
+        part_dir = os.path.join(self.root, _UPLOADS_DIR, upload_id)
+        path = self.object_path(bucket, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{upload_id}.tmp"
+        digests = b''
+        with open(tmp_path, 'wb') as out:
+            for number in part_numbers:
+                md5 = hashlib.md5()
+                with open(os.path.join(part_dir, f"{number:05d}"), 'rb') as part:
+                    for chunk in iter(lambda: part.read(1024 * 1024), b''):
+                        md5.update(chunk)
+                        out.write(chunk)
+                digests += md5.digest()
+        os.replace(tmp_path, path)
+        shutil.rmtree(part_dir, ignore_errors=True)
+        etag = f"{hashlib.md5(digests).hexdigest()}-{len(part_numbers)}"
+        self._remember(bucket, path, etag)
+        return etag
+
+    def abort_upload(self, upload_id):
+        shutil.rmtree(os.path.join(self.root, _UPLOADS_DIR, upload_id), ignore_errors=True)
+
+
+def _http_date(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%a, %d %b %Y %H:%M:%S GMT')
+
+
+def _iso_date(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.000Z')
+
+
+def _decode_aws_chunked(body):
+    """Strip aws-chunked framing (chunk sizes, signatures, trailing checksums)"""
+    data = bytearray()
+    pos = 0
+    while True:
+        line_end = body.index(b'\r\n', pos)
+        size = int(body[pos:line_end].split(b';')[0], 16)
+        pos = line_end + 2
+        if size == 0:
+            return bytes(data)
+        data += body[pos:pos + size]
+        pos += size + 2
+
+
+def _handler_for(store):
+    class S3Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+        # Headers and body go out as separate writes; with Nagle on, keep-alive
+        # requests stall on delayed ACKs (~40ms each)
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass
+
+        # Helpers
+        def _parse(self):
+            parts = urlsplit(self.path)
+            query = {k: v[0] for k, v in parse_qs(parts.query, keep_blank_values=True).items()}
+            path = unquote(parts.path).lstrip('/')
+            bucket, _, key = path.partition('/')
+            return bucket, key, query
+
+        def _body(self):
+            length = int(self.headers.get('Content-Length', 0))
+            body = self.rfile.read(length) if length else b''
+            if ('aws-chunked' in self.headers.get('Content-Encoding', '')
+                    or self.headers.get('x-amz-content-sha256', '').startswith('STREAMING-')):
+                body = _decode_aws_chunked(body)
+            return body
+
+        def _send(self, status, body=b'', headers=None, content_type='application/xml'):
+            self.send_response(status)
+            for name, value in (headers or {}).items():
+                self.send_header(name, value)
+            if body or status != 204:
+                self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if body and self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def _xml(self, status, xml):
+            self._send(status, ('<?xml version="1.0" encoding="UTF-8"?>\n' + xml).encode('utf-8'))
+
+        def _error(self, status, code, message, resource=''):
+            self._xml(status, f"<Error><Code>{code}</Code><Message>{escape(message)}</Message>"
+                              f"<Resource>{escape(resource)}</Resource></Error>")
+
+        def _no_such_bucket(self, bucket):
+            self._error(404, 'NoSuchBucket', 'The specified bucket does not exist', bucket)
+
+        # Verbs
+        def do_PUT(self):
+            bucket, key, query = self._parse()
+            body = self._body()
+            if not key:
+                store.create_bucket(bucket)
+                self._send(200, headers={'Location': f"/{bucket}"})
+                return
+            if not store.bucket_exists(bucket):
+                self._no_such_bucket(bucket)
+                return
+            if 'uploadId' in query:
+                try:
+                    etag = store.put_part(query['uploadId'], int(query['partNumber']), body)
+                except KeyError:
+                    self._error(404, 'NoSuchUpload', 'The specified upload does not exist', key)
+                    return
+                self._send(200, headers={'ETag': f'"{etag}"'})
+                return
+            source = self.headers.get('x-amz-copy-source')
+            if source:
+                src_bucket, _, src_key = unquote(source.split('?')[0]).lstrip('/').partition('/')
+                try:
+                    etag = store.copy(src_bucket, src_key, bucket, key)
+                except (KeyError, ValueError):
+                    self._error(404, 'NoSuchKey', 'The specified key does not exist.', src_key)
+                    return
+                self._xml(200, f'<CopyObjectResult xmlns="{_XMLNS}"><ETag>"{etag}"</ETag>'
+                               f'<LastModified>{_iso_date(time.time())}</LastModified></CopyObjectResult>')
+                return
+            etag = store.put(bucket, key, body)
+            self._send(200, headers={'ETag': f'"{etag}"'})
+
+        def do_POST(self):
+            bucket, key, query = self._parse()
+            body = self._body()
+            if not store.bucket_exists(bucket):
+                self._no_such_bucket(bucket)
+                return
+            if 'uploads' in query:
+                upload_id = store.create_upload(bucket, key)
+                self._xml(200, f'<InitiateMultipartUploadResult xmlns="{_XMLNS}"><Bucket>{escape(bucket)}</Bucket>'
+                               f'<Key>{escape(key)}</Key><UploadId>{upload_id}</UploadId></InitiateMultipartUploadResult>')
+                return
+            if 'uploadId' in query:
+                text = body.decode('utf-8')
+                numbers = [int(chunk.split('</PartNumber>')[0]) for chunk in text.split('<PartNumber>')[1:]]
+                etag = store.complete_upload(bucket, key, query['uploadId'], sorted(numbers))
+                self._xml(200, f'<CompleteMultipartUploadResult xmlns="{_XMLNS}"><Bucket>{escape(bucket)}</Bucket>'
+                               f'<Key>{escape(key)}</Key><ETag>"{etag}"</ETag></CompleteMultipartUploadResult>')
+                return
+            if 'delete' in query:
+                self._delete_objects(bucket, body)
+                return
+            self._error(501, 'NotImplemented', 'Operation not supported by the stand-in')
+
+        def _delete_objects(self, bucket, body):
+            """DeleteObjects: every listed key is deleted (missing keys too, as in S3); Quiet omits them from the reply"""
+            request = ElementTree.fromstring(body)
+            # Elements may carry the S3 namespace
+            local = lambda element: element.tag.rsplit('}', 1)[-1]
+            keys = [child.text or '' for obj in request if local(obj) == 'Object' for child in obj if local(child) == 'Key']
+            quiet = any(local(e) == 'Quiet' and (e.text or '').strip().lower() == 'true' for e in request)
+            results = []
+            for key in keys:
+                try:
+                    store.delete(bucket, key)
+                    results.append(f'<Deleted><Key>{escape(key)}</Key></Deleted>')
+                except ValueError:
+                    results.append(f'<Error><Key>{escape(key)}</Key><Code>InvalidArgument</Code>'
+                                   f'<Message>Invalid key</Message></Error>')
+            if quiet:
+                results = [r for r in results if r.startswith('<Error>')]
+            self._xml(200, f'<DeleteResult xmlns="{_XMLNS}">{"".join(results)}</DeleteResult>')
+
+        def do_DELETE(self):
+            bucket, key, query = self._parse()
+            if 'uploadId' in query:
+                store.abort_upload(query['uploadId'])
+            elif key:
+                store.delete(bucket, key)
+            self._send(204)
+
+        def do_HEAD(self):
+            self.do_GET()
+
+        def do_GET(self):
+            bucket, key, query = self._parse()
+            if not bucket:
+                self._error(501, 'NotImplemented', 'ListBuckets is not supported by the stand-in')
+                return
+            if not store.bucket_exists(bucket):
+                self._no_such_bucket(bucket)
+                return
+            if not key:
+                if self.command == 'HEAD':
+                    self._send(200)
+                elif 'location' in query:
+                    self._xml(200, f'<LocationConstraint xmlns="{_XMLNS}"></LocationConstraint>')
+                else:
+                    self._list_objects(bucket, query)
+                return
+            self._get_object(bucket, key)
+
+        def _get_object(self, bucket, key):
+            try:
+                path = store.object_path(bucket, key)
+                stat = os.stat(path)
+            except (ValueError, FileNotFoundError, NotADirectoryError):
+                self._error(404, 'NoSuchKey', 'The specified key does not exist.', key)
+                return
+            size = stat.st_size
+            headers = {
+                'ETag': f'"{store.etag(path, stat)}"',
+                'Last-Modified': _http_date(stat.st_mtime),
+                'Accept-Ranges': 'bytes',
+            }
+            start, end, status = 0, size - 1, 200
+            range_header = self.headers.get('Range')
+            if range_header and range_header.startswith('bytes='):
+                first, _, last = range_header[6:].split(',')[0].partition('-')
+                if first:
+                    start = int(first)
+                    end = min(int(last), size - 1) if last else size - 1
+                else:
+                    start = max(0, size - int(last))
+                if start >= size:
+                    self._error(416, 'InvalidRange', 'The requested range is not satisfiable', key)
+                    return
+                status = 206
+                headers['Content-Range'] = f"bytes {start}-{end}/{size}"
+            length = max(0, end - start + 1)
+
+            self.send_response(status)
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.send_header('Content-Type', 'binary/octet-stream')
+            self.send_header('Content-Length', str(length))
+            self.end_headers()
+            if self.command == 'HEAD':
+                return
+            with open(path, 'rb') as f:
+                f.seek(start)
+                remaining = length
+                while remaining > 0:
+                    chunk = f.read(min(remaining, 1024 * 1024))
+                    if not chunk:
+                        break
+                    self.wfile.write(chunk)
+                    remaining -= len(chunk)
+
+        def _list_objects(self, bucket, query):
+            prefix = query.get('prefix', '')
+            delimiter = query.get('delimiter', '')
+            max_keys = int(query.get('max-keys', 1000))
+            start_after = query.get('continuation-token') or query.get('start-after', '')
+
+            contents, common_prefixes = [], []
+            truncated = False
+            last_key = ''
+            for key in store.keys(bucket):
+                if not key.startswith(prefix) or key <= start_after:
+                    continue
+                if delimiter:
+                    cut = key.find(delimiter, len(prefix))
+                    if cut >= 0:
+                        common = key[:cut + len(delimiter)]
+                        if common_prefixes and common_prefixes[-1] == common:
+                            continue
+                        if len(contents) + len(common_prefixes) >= max_keys:
+                            truncated = True
+                            break
+                        common_prefixes.append(common)
+                        # Skip the rest of this common prefix
+                        last_key = common + '￿'
+                        continue
+                if len(contents) + len(common_prefixes) >= max_keys:
+                    truncated = True
+                    break
+                path = store.object_path(bucket, key)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                contents.append(
+                    f"<Contents><Key>{escape(key)}</Key><LastModified>{_iso_date(stat.st_mtime)}</LastModified>"
+                    f"<ETag>&quot;{store.etag(path, stat)}&quot;</ETag><Size>{stat.st_size}</Size>"
+                    f"<StorageClass>STANDARD</StorageClass></Contents>"
+                )
+                last_key = key
+
+            xml = [f'<ListBucketResult xmlns="{_XMLNS}"><Name>{escape(bucket)}</Name>'
+                   f'<Prefix>{escape(prefix)}</Prefix><MaxKeys>{max_keys}</MaxKeys>'
+                   f'<KeyCount>{len(contents) + len(common_prefixes)}</KeyCount>'
+                   f'<IsTruncated>{"true" if truncated else "false"}</IsTruncated>']
+            if delimiter:
+                xml.append(f'<Delimiter>{escape(delimiter)}</Delimiter>')
+            if truncated:
+                xml.append(f'<NextContinuationToken>{escape(last_key)}</NextContinuationToken>')
+            xml.extend(contents)
+            xml.extend(f"<CommonPrefixes><Prefix>{escape(p)}</Prefix></CommonPrefixes>" for p in common_prefixes)
+            xml.append('</ListBucketResult>')
+            self._xml(200, ''.join(xml))
+
+    return S3Handler
+
+
+class FakeS3Server:
+    """Run the stand-in in a background thread"""
+
+    def __init__(self, root, port=0, host='127.0.0.1'):
+        self.store = ObjectStore(root)
+        self._server = ThreadingHTTPServer((host, port), _handler_for(self.store))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-s3", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Filesystem-backed S3 stand-in for benchmarks')
+    parser.add_argument('--root', required=True, help='Directory holding buckets and objects')
+    parser.add_argument('--port', type=int, default=5055, help='Port to listen on')
+    parser.add_argument('--host', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('--buckets', default='', help='Comma-separated buckets to create at start')
+    args = parser.parse_args()
+
+    server = FakeS3Server(args.root, args.port, args.host)
+    for bucket in filter(None, args.buckets.split(',')):
+        server.store.create_bucket(bucket)
+    print(f"Serving {args.root} as S3 on {server.endpoint}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+
+
+if __name__ == '__main__':
+    main()
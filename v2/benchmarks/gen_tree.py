@@ -0,0 +1,114 @@
+"""
+Generate a synthetic file tree for benchmarking the archivers.
+
+The tree has --depth directory levels with --fanout sub-directories each;
+files are spread round-robin over the leaf directories. File sizes follow
+--size-dist:
+    fixed:50KB                 every file is 50KB
+    uniform:1KB-1MB            uniform between the bounds
+    lognormal:32KB,1.5         lognormal with median 32KB and sigma 1.5
+    mix:4KB*70,256KB*25,8MB*5  weighted choice between fixed sizes (percent)
+
+Usage:
+    python3 gen_tree.py --dest /tmp/bench-tree --files 100000 --depth 3 --fanout 10 --size-dist lognormal:32KB,1.5
+"""
+import argparse
+import math
+import os
+import random
+
+UNITS = {'B': 1, 'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3}
+
+# Random payload reused for every file (slices of it), so generation is I/O bound
+_POOL_SIZE = 16 * 1024 * 1024
+
+
+def parse_size(size_str):
+    """Convert human readable size string (50KB, 1.5MB) to bytes"""
+    size_str = size_str.strip().upper()
+    for unit in sorted(UNITS, key=len, reverse=True):
+        if size_str.endswith(unit):
+            return int(float(size_str[:-len(unit)]) * UNITS[unit])
+    return int(size_str)
+
+
+def size_sampler(spec, rng):
+    """Return a function producing file sizes for a --size-dist spec"""
+    kind, _, params = spec.partition(':')
+    if kind == 'fixed':
+        size = parse_size(params)
+        return lambda: size
+    if kind == 'uniform':
+        low, high = (parse_size(p) for p in params.split('-'))
+        return lambda: rng.randint(low, high)
+    if kind == 'lognormal':
+        median, sigma = params.split(',')
+        mu = math.log(parse_size(median))
+        sigma = float(sigma)
+        return lambda: max(1, int(rng.lognormvariate(mu, sigma)))
+    if kind == 'mix':
+        sizes, weights = [], []
+        for part in params.split(','):
+            size, weight = part.split('*')
+            sizes.append(parse_size(size))
+            weights.append(float(weight))
+        return lambda: rng.choices(sizes, weights)[0]
+    raise ValueError(f"Unknown size distribution: {spec}")
+
+
+def leaf_dirs(dest, depth, fanout):
+    """All leaf directories of a depth x fanout tree"""
+    dirs = [dest]
+    for level in range(depth):
+        dirs = [os.path.join(d, f"dir{level}_{i:03d}") for d in dirs for i in range(fanout)]
+    return dirs
+
+
+def generate_tree(dest, files, depth=2, fanout=10, size_dist='fixed:50KB', seed=0, compressible=False):
+    """Create the tree and return (file_count, total_bytes)"""
+    rng = random.Random(seed)
+    sample = size_sampler(size_dist, rng)
+    if compressible:
+        pool = (b'small file archiving benchmark ' * (_POOL_SIZE // 31 + 1))[:_POOL_SIZE]
+    else:
+        pool = rng.randbytes(_POOL_SIZE)
+
+    dirs = leaf_dirs(dest, depth, fanout)
+    for d in dirs:
+        os.makedirs(d, exist_ok=True)
+
+    total_bytes = 0
+    for i in range(files):
+        size = sample()
+        path = os.path.join(dirs[i % len(dirs)], f"file_{i:08d}.dat")
+        with open(path, 'wb') as f:
+            remaining = size
+            while remaining > 0:
+                chunk = min(remaining, _POOL_SIZE)
+                offset = rng.randrange(0, _POOL_SIZE - chunk + 1)
+                f.write(pool[offset:offset + chunk])
+                remaining -= chunk
+        total_bytes += size
+    return files, total_bytes
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic file tree for benchmarks')
+    parser.add_argument('--dest', required=True, help='Directory to create the tree in')
+    parser.add_argument('--files', type=int, default=10000, help='Number of files')
+    parser.add_argument('--depth', type=int, default=2, help='Directory levels')
+    parser.add_argument('--fanout', type=int, default=10, help='Sub-directories per directory')
+    parser.add_argument('--size-dist', default='fixed:50KB',
+                        help='fixed:SIZE | uniform:MIN-MAX | lognormal:MEDIAN,SIGMA | mix:SIZE*PCT,...')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed (same seed, same tree)')
+    parser.add_argument('--compressible', action='store_true', help='Write repetitive text instead of random bytes')
+    args = parser.parse_args()
+
+    count, total_bytes = generate_tree(
+        args.dest, args.files, args.depth, args.fanout, args.size_dist, args.seed, args.compressible
+    )
+    print(f"Created {count:,} files ({total_bytes / 1024 ** 2:.1f}MB) under {args.dest}")
+
+
+if __name__ == '__main__':
+    main()
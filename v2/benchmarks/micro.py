@@ -0,0 +1,300 @@
+"""
+Micro-benchmarks for the archiver hot paths.
+
+    tar_build        tar of N in-memory members, as in the s3s3 consumer
+    create_hash      fss3-archiver's _create_hash (read + MD5 per file), called directly
+    manifest_rows    f-string manifest rows for 100k files, as in fss3, joined into one string
+    restore_extract  restore.py's extraction: a byte range streamed through tarfile into the output file
+    restore_range_get  the same, with the range streamed from a GET to the local S3 stand-in
+
+Every benchmark reports calls/s, items/s (members, files or rows) and
+allocations measured with tracemalloc in a separate pass: the peak traced
+memory during one call and the number of blocks still allocated after it.
+
+Usage:
+    python3 micro.py
+    python3 micro.py --only tar_build,manifest_rows --members 5000 --compare results/micro_20250101_120000.json
+"""
+import argparse
+import gc
+import hashlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tarfile
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+from gen_tree import generate_tree
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..', 'apps'))
+sys.path.insert(0, APPS_DIR)
+
+
+def load_app(filename, module_name):
+    """Import a hyphenated script from v2/apps as a module"""
+    spec = importlib.util.spec_from_file_location(module_name, os.path.join(APPS_DIR, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def build_tar(members):
+    """Tar assembly as in the s3s3 consumer; returns (tar bytes, [(name, start, end)])"""
+    tar_buffer = io.BytesIO()
+    positions = []
+    current_pos = 0
+    with tarfile.open(fileobj=tar_buffer, mode='w') as tar:
+        for name, content in members:
+            tar_info = tarfile.TarInfo(name=name)
+            tar_info.size = len(content)
+            start_pos = current_pos
+            tar.addfile(tar_info, io.BytesIO(content))
+            padding = (512 - (len(content) % 512)) % 512
+            current_pos = start_pos + 512 + len(content) + padding
+            positions.append((name, start_pos, current_pos))
+    return tar_buffer.getvalue(), positions
+
+
+# Benchmarks: each setup returns (call, items per call, cleanup)
+def setup_tar_build(args, scratch):
+    payload = os.urandom(args.member_size)
+    members = [(f"data/dir{i % 100:03d}/file_{i:08d}.dat", payload) for i in range(args.members)]
+    return (lambda: build_tar(members)), args.members, None
+
+
+def setup_create_hash(args, scratch):
+    fss3 = load_app('fss3-archiver.py', 'fss3_archiver')
+    from run_stats import RunStats
+    from run_trace import Tracer
+
+    tree = os.path.join(scratch, 'hash-tree')
+    generate_tree(tree, args.files, depth=1, fanout=10, size_dist=f"fixed:{args.file_size}")
+    files = []
+    for root, _, names in os.walk(tree):
+        for name in names:
+            path = os.path.join(root, name)
+            files.append(fss3.FileInfo(full_path=path, rel_path=os.path.relpath(path, tree),
+                                       size=os.path.getsize(path)))
+    batch = fss3.FileBatch(files=files, batch_number=0, total_size=sum(f.size for f in files),
+                           file_count=len(files))
+
+    # The method only needs the stats, tracer and logger of an archiver
+    archiver = object.__new__(fss3.FS2S3Archiver)
+    archiver.stats = RunStats()
+    archiver.tracer = Tracer()
+    archiver.logger = logging.getLogger('micro')
+    return (lambda: archiver._create_hash(batch)), len(files), None
+
+
+def setup_manifest_rows(args, scratch):
+    delimiter = '|'
+    tar_path = 'archive/archives/20250101/archive_20250101_120000_0001.tar'
+    current_date = '2025-01-01 12:00:00'
+    md5 = hashlib.md5(b'x').hexdigest()
+    files = [(f"/data/nfsshare/fs1/d0001/dir{i % 1000:04d}/file_{i:08d}.dat", 51200 + i, i * 52224)
+             for i in range(args.rows)]
+
+    def build_manifest():
+        # As in the fss3 consumer
+        manifest_content = [
+            f"tarfile_name{delimiter} file_name{delimiter} current_date{delimiter} filesize{delimiter} "
+            f"start_bytes{delimiter} stop_bytes{delimiter} md5"
+        ]
+        for full_path, file_size, start_pos in files:
+            end_pos = start_pos + file_size + 511
+            manifest_content.append(
+                f"{tar_path}{delimiter}{full_path}{delimiter}{current_date}{delimiter}"
+                f"{file_size}{delimiter}{start_pos}{delimiter}{end_pos}{delimiter}"
+                f"{md5}"
+            )
+        return '\n'.join(manifest_content)
+
+    return build_manifest, args.rows, None
+
+
+def _restore_fixture(args):
+    payload = os.urandom(args.member_size)
+    members = [(f"data/file_{i:08d}.dat", payload) for i in range(args.members)]
+    tar_bytes, positions = build_tar(members)
+    # A member in the middle of the tar, with the range a manifest would record
+    _, start, end = positions[len(positions) // 2]
+    return tar_bytes, start, end - 1
+
+
+def setup_restore_extract(args, scratch):
+    restore_app = load_app('restore.py', 'restore')
+    tar_bytes, start, stop = _restore_fixture(args)
+    extract_path = os.path.join(scratch, 'restored')
+    return (lambda: restore_app.extract_members(io.BytesIO(tar_bytes[start:stop + 1]), extract_path)), 1, None
+
+
+def setup_restore_range_get(args, scratch):
+    import boto3
+    from fake_s3 import FakeS3Server
+
+    restore_app = load_app('restore.py', 'restore')
+    tar_bytes, start, stop = _restore_fixture(args)
+    server = FakeS3Server(os.path.join(scratch, 'fake-s3')).start()
+    s3 = boto3.client('s3', endpoint_url=server.endpoint, region_name='us-east-1',
+                      aws_access_key_id='bench', aws_secret_access_key='bench')
+    s3.create_bucket(Bucket='bench')
+    s3.put_object(Bucket='bench', Key='archive.tar', Body=tar_bytes)
+    extract_path = os.path.join(scratch, 'restored-get')
+
+    def restore():
+        resp = s3.get_object(Bucket='bench', Key='archive.tar', Range=f"bytes={start}-{stop}")
+        restore_app.extract_members(resp['Body'], extract_path)
+
+    return restore, 1, server.stop
+
+
+BENCHMARKS = {
+    'tar_build': setup_tar_build,
+    'create_hash': setup_create_hash,
+    'manifest_rows': setup_manifest_rows,
+    'restore_extract': setup_restore_extract,
+    'restore_range_get': setup_restore_range_get,
+}
+
+
+def measure(call, items, min_time, repeats):
+    """Return timing and allocation figures for one benchmark"""
+    call()  # warm up (imports, page cache, connection pool)
+
+    def run(number):
+        start = time.perf_counter()
+        for _ in range(number):
+            call()
+        return time.perf_counter() - start
+
+    # Calls per repeat so that one repeat takes about min_time
+    number = 1
+    while True:
+        elapsed = run(number)
+        if elapsed >= min_time / 4 or number >= 1 << 20:
+            break
+        number *= 2
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+
+    # Timed repeats with the collector off, as timeit does
+    gc_was_enabled = gc.isenabled()
+    gc.disable()
+    try:
+        timings = [run(number) / number for _ in range(repeats)]
+    finally:
+        if gc_was_enabled:
+            gc.enable()
+
+    # Allocations in a separate pass: tracemalloc slows everything down
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    base, _ = tracemalloc.get_traced_memory()
+    result = call()
+    _, peak = tracemalloc.get_traced_memory()
+    del result
+    gc.collect()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    retained_blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename'))
+
+    best = min(timings)
+    median = statistics.median(timings)
+    return {
+        'items_per_call': items,
+        'calls_per_repeat': number,
+        'repeats': len(timings),
+        'best_seconds_per_call': best,
+        'median_seconds_per_call': median,
+        # Best of the repeats: the least disturbed by other processes
+        'calls_per_second': round(1 / best, 2),
+        'items_per_second': round(items / best, 1),
+        'us_per_item': round(best * 1e6 / items, 3),
+        'alloc_peak_bytes_per_call': peak - base,
+        'alloc_peak_bytes_per_item': round((peak - base) / items, 1),
+        'alloc_retained_blocks': retained_blocks,
+    }
+
+
+def compare(results, previous_file):
+    with open(previous_file) as f:
+        previous = json.load(f)
+    print(f"\nCompared with {previous_file} ({previous.get('label') or previous.get('started')}):")
+    for name, bench in results['benchmarks'].items():
+        before = previous['benchmarks'].get(name)
+        if not before:
+            continue
+        change = (bench['items_per_second'] / before['items_per_second'] - 1) * 100
+        print(f"  {name:18} {before['items_per_second']:>12,.1f} -> {bench['items_per_second']:>12,.1f} items/s "
+              f"({change:+.1f}%)  peak alloc {before['alloc_peak_bytes_per_call']:,} -> "
+              f"{bench['alloc_peak_bytes_per_call']:,} B/call")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Micro-benchmarks for the archiver hot paths')
+    parser.add_argument('--only', help=f"Comma-separated benchmarks ({', '.join(BENCHMARKS)})")
+    parser.add_argument('--members', type=int, default=1000, help='Tar members (tar_build, restore_*)')
+    parser.add_argument('--member-size', type=int, default=16 * 1024, help='Bytes per tar member')
+    parser.add_argument('--files', type=int, default=500, help='Files hashed per call (create_hash)')
+    parser.add_argument('--file-size', default='32KB', help='Size of the hashed files')
+    parser.add_argument('--rows', type=int, default=100000, help='Manifest rows per call (manifest_rows)')
+    parser.add_argument('--min-time', type=float, default=0.5, help='Target seconds per repeat')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed repeats per benchmark')
+    parser.add_argument('--output', help='Results file (default: results/micro_{time}.json)')
+    parser.add_argument('--label', default='', help='Free-text label stored with the results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    args = parser.parse_args()
+
+    names = [n.strip() for n in args.only.split(',')] if args.only else list(BENCHMARKS)
+    unknown = set(names) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmarks: {', '.join(sorted(unknown))}")
+
+    started = datetime.now().strftime('%Y%m%d_%H%M%S')
+    results = {
+        'label': args.label,
+        'started': started,
+        'host': {'python': platform.python_version(), 'platform': platform.platform(), 'cpus': os.cpu_count()},
+        'parameters': {k: v for k, v in vars(args).items() if k not in ('output', 'compare', 'label', 'only')},
+        'benchmarks': {},
+    }
+
+    scratch = tempfile.mkdtemp(prefix='sfas-micro-')
+    try:
+        for name in names:
+            call, items, cleanup = BENCHMARKS[name](args, scratch)
+            try:
+                bench = measure(call, items, args.min_time, args.repeats)
+            finally:
+                if cleanup:
+                    cleanup()
+            results['benchmarks'][name] = bench
+            print(f"{name:18} {bench['calls_per_second']:>10,.2f} calls/s {bench['items_per_second']:>12,.1f} items/s "
+                  f"{bench['us_per_item']:>9,.3f} us/item  peak alloc {bench['alloc_peak_bytes_per_call']:>12,} B/call  "
+                  f"retained {bench['alloc_retained_blocks']:,} blocks")
+    finally:
+        shutil.rmtree(scratch, ignore_errors=True)
+
+    output_file = args.output or os.path.join(BENCH_DIR, 'results', f"micro_{started}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output_file}")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,372 @@
+"""
+End-to-end archiver benchmarks against a local S3 stand-in.
+
+Generates (or reuses) a synthetic tree, starts an S3 backend, then runs
+fss3, s3s3 and fsfs for every combination of thread count and batch
+strategy. Each run is a separate process; wall time and CPU time come from
+its rusage, peak RSS from its /proc high-water mark. Results are written as
+JSON so runs can be compared over time (--compare).
+
+Backends:
+    fake   filesystem-backed stand-in (fake_s3.py), the default
+    moto   moto server (pip install "moto[server]")
+    --endpoint URL uses an already running S3-compatible endpoint
+
+Usage:
+    python3 run_e2e.py --files 20000 --size-dist lognormal:32KB,1.5 \\
+        --archivers fss3,s3s3,fsfs --threads 1,4,8 --strategies files:1000,size:64MB
+    python3 run_e2e.py --tree /data/sample --compare results/e2e_20250101_120000.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import boto3
+
+from fake_s3 import FakeS3Server
+from gen_tree import generate_tree
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..', 'apps'))
+ARCHIVERS = {
+    'fss3': 'fss3-archiver.py',
+    's3s3': 's3s3-archiver.py',
+    'fsfs': 'fsfs-archiver.py',
+}
+SRC_BUCKET = 'bench-src'
+DST_BUCKET = 'bench-dst'
+SRC_PREFIX = 'tree'
+# Dummy credentials: the stand-ins do not check signatures
+BENCH_ENV = {
+    'AWS_ACCESS_KEY_ID': 'bench',
+    'AWS_SECRET_ACCESS_KEY': 'bench',
+    'AWS_DEFAULT_REGION': 'us-east-1',
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def tree_stats(tree):
+    files = total_bytes = 0
+    for root, _, names in os.walk(tree):
+        for name in names:
+            files += 1
+            total_bytes += os.path.getsize(os.path.join(root, name))
+    return files, total_bytes
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=BENCH_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Backend:
+    """S3 endpoint for the runs: fake stand-in, moto server or an existing URL"""
+
+    def __init__(self, kind, workdir, endpoint=None):
+        self.kind = 'endpoint' if endpoint else kind
+        self.endpoint = endpoint
+        self.root = None
+        self._server = None
+        self._process = None
+        if self.kind == 'fake':
+            self.root = os.path.join(workdir, 'fake-s3')
+            self._server = FakeS3Server(self.root).start()
+            self.endpoint = self._server.endpoint
+        elif self.kind == 'moto':
+            port = free_port()
+            self._process = subprocess.Popen(
+                [sys.executable, '-m', 'moto.server', '-p', str(port)],
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+            )
+            self.endpoint = f"http://127.0.0.1:{port}"
+            self._wait_ready()
+        self.client = boto3.client('s3', endpoint_url=self.endpoint, **{
+            'aws_access_key_id': BENCH_ENV['AWS_ACCESS_KEY_ID'],
+            'aws_secret_access_key': BENCH_ENV['AWS_SECRET_ACCESS_KEY'],
+            'region_name': BENCH_ENV['AWS_DEFAULT_REGION'],
+        })
+        for bucket in (SRC_BUCKET, DST_BUCKET):
+            try:
+                self.client.create_bucket(Bucket=bucket)
+            except self.client.exceptions.BucketAlreadyOwnedByYou:
+                pass
+
+    def _wait_ready(self, timeout=30):
+        deadline = time.time() + timeout
+        host, port = self.endpoint.rsplit(':', 1)
+        while time.time() < deadline:
+            try:
+                with socket.create_connection((host.split('//')[1], int(port)), timeout=1):
+                    return
+            except OSError:
+                time.sleep(0.2)
+        raise RuntimeError(f"S3 backend did not start on {self.endpoint}")
+
+    def seed(self, tree):
+        """Make the tree available as s3://SRC_BUCKET/SRC_PREFIX/ for s3s3"""
+        if self.kind == 'fake':
+            dst = os.path.join(self.root, SRC_BUCKET, SRC_PREFIX)
+            shutil.rmtree(dst, ignore_errors=True)
+            shutil.copytree(tree, dst, copy_function=os.link)
+            return
+        uploads = []
+        for root, _, names in os.walk(tree):
+            for name in names:
+                path = os.path.join(root, name)
+                uploads.append((path, f"{SRC_PREFIX}/{os.path.relpath(path, tree).replace(os.sep, '/')}"))
+        with ThreadPoolExecutor(max_workers=32) as pool:
+            list(pool.map(lambda item: self.client.upload_file(item[0], SRC_BUCKET, item[1]), uploads))
+
+    def clean(self, prefix):
+        """Drop a run's output so disk use stays flat"""
+        if self.kind == 'fake':
+            shutil.rmtree(os.path.join(self.root, DST_BUCKET, prefix), ignore_errors=True)
+            return
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=DST_BUCKET, Prefix=prefix + '/'):
+            objects = [{'Key': o['Key']} for o in page.get('Contents', [])]
+            if objects:
+                self.client.delete_objects(Bucket=DST_BUCKET, Delete={'Objects': objects})
+
+    def stop(self):
+        if self._server:
+            self._server.stop()
+        if self._process:
+            self._process.terminate()
+            self._process.wait()
+
+
+def archiver_command(archiver, tree, strategy, threads, endpoint, dst_prefix, run_dir, extra_args):
+    kind, _, value = strategy.partition(':')
+    cmd = [sys.executable, os.path.join(APPS_DIR, ARCHIVERS[archiver])]
+    if archiver == 'fss3':
+        cmd += ['--src-path', tree, '--dst-bucket', DST_BUCKET, '--dst-prefix', dst_prefix, '--endpoint', endpoint]
+    elif archiver == 's3s3':
+        cmd += ['--src-bucket', SRC_BUCKET, '--src-prefix', SRC_PREFIX, '--dst-bucket', DST_BUCKET,
+                '--dst-prefix', dst_prefix, '--endpoint', endpoint]
+    else:
+        cmd += ['--src-path', tree, '--dst-path', os.path.join(run_dir, 'fsfs-out')]
+    cmd += ['--num-threads', str(threads)]
+    cmd += ['--max-files', value] if kind == 'files' else ['--max-size', value]
+    return cmd + extra_args
+
+
+def read_peak_rss(pid):
+    """Peak RSS (VmHWM) of a running process in KB, or None"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+def watch_peak_rss(pid, done, peak):
+    # Linux keeps ru_maxrss across execve, so the child's rusage would include
+    # the harness' own RSS; sample the child's high-water mark instead
+    while not done.is_set():
+        value = read_peak_rss(pid)
+        if value:
+            peak[0] = max(peak[0], value)
+        done.wait(0.05)
+
+
+def run_once(cmd, run_dir):
+    """Run one archiver process and return (exit_code, wall_seconds, rusage, peak_rss_kb, output)"""
+    os.makedirs(run_dir, exist_ok=True)
+    output_path = os.path.join(run_dir, 'output.log')
+    env = dict(os.environ, **BENCH_ENV)
+    with open(output_path, 'w') as output:
+        start = time.perf_counter()
+        process = subprocess.Popen(cmd, cwd=run_dir, env=env, stdout=output, stderr=subprocess.STDOUT)
+        done, peak = threading.Event(), [0]
+        watcher = threading.Thread(target=watch_peak_rss, args=(process.pid, done, peak), daemon=True)
+        watcher.start()
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall = time.perf_counter() - start
+        done.set()
+        watcher.join()
+    process.returncode = os.waitstatus_to_exitcode(status)
+    # Without /proc fall back to rusage (an upper bound)
+    peak_rss_kb = peak[0] or rusage.ru_maxrss
+    with open(output_path) as f:
+        return process.returncode, wall, rusage, peak_rss_kb, f.read()
+
+
+def parse_count(pattern, output):
+    match = re.search(pattern + r':\s*([\d,]+)', output)
+    return int(match.group(1).replace(',', '')) if match else None
+
+
+def summarize(archiver, threads, strategy, repeat, exit_code, wall, rusage, peak_rss_kb, output, dataset):
+    files = parse_count('Total files processed', output)
+    failed = parse_count('Failed files', output)
+    processed = files if files is not None else dataset['files']
+    # Bytes read from the source; the archivers report the same figure
+    total_bytes = dataset['bytes'] * processed / dataset['files'] if dataset['files'] else 0
+    cpu_seconds = rusage.ru_utime + rusage.ru_stime
+    return {
+        'archiver': archiver,
+        'threads': threads,
+        'strategy': strategy,
+        'repeat': repeat,
+        'exit_code': exit_code,
+        'wall_seconds': round(wall, 3),
+        'files': files,
+        'failed': failed,
+        'bytes': int(total_bytes),
+        'files_per_second': round(processed / wall, 1) if wall else 0.0,
+        'mb_per_second': round(total_bytes / wall / 1024 ** 2, 2) if wall else 0.0,
+        'peak_rss_mb': round(peak_rss_kb / 1024, 1),
+        'cpu_user_seconds': round(rusage.ru_utime, 3),
+        'cpu_system_seconds': round(rusage.ru_stime, 3),
+        'cpu_ns_per_byte': round(cpu_seconds * 1e9 / total_bytes, 3) if total_bytes else None,
+        'cpu_utilization': round(cpu_seconds / wall, 2) if wall else 0.0,
+    }
+
+
+def run_key(run):
+    return run['archiver'], run['threads'], run['strategy']
+
+
+def compare(results, previous_file):
+    """Print files/s and MB/s against a previous results file"""
+    with open(previous_file) as f:
+        previous = json.load(f)
+    best_before = {}
+    for run in previous['runs']:
+        key = run_key(run)
+        if key not in best_before or run['files_per_second'] > best_before[key]['files_per_second']:
+            best_before[key] = run
+    print(f"\nCompared with {previous_file} ({previous.get('label') or previous.get('started')}):")
+    for run in results['runs']:
+        before = best_before.get(run_key(run))
+        if not before or not before['files_per_second']:
+            continue
+        change = (run['files_per_second'] / before['files_per_second'] - 1) * 100
+        print(f"  {run['archiver']:5} threads={run['threads']:<3} {run['strategy']:<14} "
+              f"{before['files_per_second']:>10,.1f} -> {run['files_per_second']:>10,.1f} files/s ({change:+.1f}%)  "
+              f"RSS {before['peak_rss_mb']:.0f} -> {run['peak_rss_mb']:.0f}MB")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='End-to-end archiver benchmarks against a local S3 stand-in')
+    parser.add_argument('--tree', help='Existing source tree (default: generate one)')
+    parser.add_argument('--files', type=int, default=10000, help='Files to generate')
+    parser.add_argument('--depth', type=int, default=2, help='Directory levels of the generated tree')
+    parser.add_argument('--fanout', type=int, default=10, help='Sub-directories per directory')
+    parser.add_argument('--size-dist', default='fixed:50KB', help='Size distribution (see gen_tree.py)')
+    parser.add_argument('--seed', type=int, default=0, help='Random seed for the generated tree')
+    parser.add_argument('--archivers', default='fss3,s3s3,fsfs', help='Comma-separated archivers to run')
+    parser.add_argument('--threads', default='1,4,8', help='Comma-separated thread counts')
+    parser.add_argument('--strategies', default='files:1000,size:64MB',
+                        help='Comma-separated batch strategies (files:N or size:SIZE)')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per combination')
+    parser.add_argument('--backend', choices=['fake', 'moto'], default='fake', help='Local S3 stand-in')
+    parser.add_argument('--endpoint', help='Use an already running S3-compatible endpoint instead')
+    parser.add_argument('--workdir', help='Scratch directory (default: a temporary directory)')
+    parser.add_argument('--output', help='Results file (default: results/e2e_{time}.json)')
+    parser.add_argument('--label', default='', help='Free-text label stored with the results')
+    parser.add_argument('--compare', help='Previous results file to compare against')
+    parser.add_argument('--archiver-args', default='', help='Extra arguments passed to every archiver')
+    parser.add_argument('--keep', action='store_true', help='Keep the scratch directory')
+    args = parser.parse_args()
+
+    started = datetime.now().strftime('%Y%m%d_%H%M%S')
+    workdir = args.workdir or tempfile.mkdtemp(prefix='sfas-bench-')
+    os.makedirs(workdir, exist_ok=True)
+
+    if args.tree:
+        tree = os.path.abspath(args.tree)
+    else:
+        tree = os.path.join(workdir, 'tree')
+        print(f"Generating {args.files:,} files ({args.size_dist}) in {tree}")
+        generate_tree(tree, args.files, args.depth, args.fanout, args.size_dist, args.seed)
+    file_count, total_bytes = tree_stats(tree)
+    dataset = {'tree': tree, 'files': file_count, 'bytes': total_bytes, 'generated': not args.tree,
+               'size_dist': args.size_dist, 'depth': args.depth, 'fanout': args.fanout, 'seed': args.seed}
+    print(f"Dataset: {file_count:,} files, {total_bytes / 1024 ** 2:.1f}MB")
+
+    archivers = [a.strip() for a in args.archivers.split(',') if a.strip()]
+    unknown = set(archivers) - set(ARCHIVERS)
+    if unknown:
+        parser.error(f"Unknown archivers: {', '.join(sorted(unknown))}")
+    threads_list = [int(t) for t in args.threads.split(',')]
+    strategies = [s.strip() for s in args.strategies.split(',') if s.strip()]
+    extra_args = args.archiver_args.split()
+
+    backend = Backend(args.backend, workdir, args.endpoint)
+    results = {
+        'label': args.label,
+        'started': started,
+        'git_commit': git_commit(),
+        'host': {'python': platform.python_version(), 'platform': platform.platform(),
+                 'cpus': os.cpu_count()},
+        'backend': backend.kind,
+        'dataset': dataset,
+        'runs': [],
+    }
+    try:
+        if 's3s3' in archivers:
+            print(f"Seeding s3://{SRC_BUCKET}/{SRC_PREFIX}/")
+            backend.seed(tree)
+
+        run_number = 0
+        for archiver in archivers:
+            for threads in threads_list:
+                for strategy in strategies:
+                    for repeat in range(args.repeat):
+                        run_number += 1
+                        dst_prefix = f"bench/{started}/run{run_number:03d}"
+                        run_dir = os.path.join(workdir, 'runs', f"run{run_number:03d}")
+                        cmd = archiver_command(archiver, tree, strategy, threads, backend.endpoint,
+                                               dst_prefix, run_dir, extra_args)
+                        exit_code, wall, rusage, peak_rss_kb, output = run_once(cmd, run_dir)
+                        run = summarize(archiver, threads, strategy, repeat, exit_code, wall, rusage,
+                                        peak_rss_kb, output, dataset)
+                        results['runs'].append(run)
+                        print(f"{archiver:5} threads={threads:<3} {strategy:<14} "
+                              f"{run['files_per_second']:>10,.1f} files/s {run['mb_per_second']:>8,.2f} MB/s "
+                              f"RSS {run['peak_rss_mb']:>7,.1f}MB CPU {run['cpu_ns_per_byte'] or 0:.2f}ns/B"
+                              f"{'' if exit_code == 0 else f'  (exit code {exit_code}, see {run_dir}/output.log)'}")
+                        backend.clean(dst_prefix)
+                        if not args.keep and exit_code == 0:
+                            shutil.rmtree(os.path.join(run_dir, 'fsfs-out'), ignore_errors=True)
+    finally:
+        backend.stop()
+
+    output_file = args.output or os.path.join(BENCH_DIR, 'results', f"e2e_{started}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output_file}")
+
+    if args.compare:
+        compare(results, args.compare)
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()